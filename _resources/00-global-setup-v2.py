@@ -250,6 +250,57 @@ class DBDemos():
         raise Exception(f"couldn't find table {table_name} or table is empty. Do you have data being generated to be consumed?")
       i += 1
 
+  @staticmethod
+  def table_version(table_name):
+    return spark.sql(f"DESCRIBE HISTORY {table_name} LIMIT 1").first()["version"]
+
+  # Training sets are materialized once as a Delta snapshot instead of being collected with toPandas()
+  @staticmethod
+  def cache_training_set(df, snapshot_table, spec=None, source_tables=[], chunk_rows=100000):
+    """Writes df as a Delta snapshot (files of at most chunk_rows rows) and returns it as a lazy spark DataFrame.
+    The snapshot is reused as long as the spec and the Delta versions of the source tables don't change. spec=None always rewrites it."""
+    import hashlib
+    import json
+    key = None
+    if spec is not None:
+      versions = {t: DBDemos.table_version(t) for t in source_tables}
+      key = hashlib.sha1(json.dumps({"spec": spec, "versions": versions}, sort_keys=True, default=str).encode()).hexdigest()
+      if spark.catalog.tableExists(snapshot_table):
+        properties = {r["key"]: r["value"] for r in spark.sql(f"SHOW TBLPROPERTIES {snapshot_table}").collect()}
+        if properties.get("dbdemos.training_set_key") == key:
+          print(f"Reusing the training set snapshot {snapshot_table}")
+          return spark.table(snapshot_table)
+    df.write.mode("overwrite").option("overwriteSchema", "true").option("maxRecordsPerFile", chunk_rows).saveAsTable(snapshot_table)
+    spark.sql(f"ALTER TABLE {snapshot_table} SET TBLPROPERTIES ('dbdemos.training_set_key' = '{key or ''}')")
+    return spark.table(snapshot_table)
+
+  @staticmethod
+  def plan_fingerprint(df):
+    """Analyzed plan of df without the (session specific) expression ids: changes with the tables, filters and columns of df. Used in the cache_training_set spec."""
+    import re
+    try:
+      return re.sub(r"#\d+L?", "", df._jdf.queryExecution().analyzed().toString())
+    except AttributeError:
+      #spark connect: no access to the plan, fallback on the semantic hash
+      return str(df.semanticHash())
+
+  @staticmethod
+  def iter_arrow_chunks(snapshot_table, chunk_rows=100000):
+    """Reads a snapshot written by cache_training_set through Delta, chunk_rows rows at a time (toLocalIterator fetches one partition at a time): the driver never holds the full training set.
+    The chunks are arrow tables with the schema of the spark table, so that all the chunks have the same schema (whatever the nulls of each chunk)."""
+    import itertools
+    import pyarrow as pa
+    from pyspark.sql.pandas.types import to_arrow_schema
+    snapshot = spark.table(snapshot_table)
+    #the Row timestamps are naive: keep them naive in arrow
+    schema = pa.schema([pa.field(f.name, pa.timestamp("us"), f.nullable) if pa.types.is_timestamp(f.type) else f for f in to_arrow_schema(snapshot.schema)])
+    rows = snapshot.toLocalIterator(prefetchPartitions=True)
+    while True:
+      chunk = list(itertools.islice(rows, chunk_rows))
+      if not chunk:
+        return
+      yield pa.Table.from_pylist([r.asDict(recursive=True) for r in chunk], schema=schema)
+
   @staticmethod
   def get_python_version_mlflow():
     import sys
@@ -265,7 +316,8 @@ class DBDemos():
 
   # Workaround for dbdemos to support automl the time being, creates a mock run simulating automl results
   @staticmethod
-  def create_mockup_automl_run(full_xp_path, df, model_name=None, target_col=None):
+  def create_mockup_automl_run(full_xp_path, df, model_name=None, target_col=None, max_training_rows=100000):
+    """df can be a pandas or a spark DataFrame. A spark DataFrame is snapshotted and logged chunk by chunk, and the mock model is trained on max_training_rows rows at most."""
     import mlflow
     import os
     print("AutoML doesn't seem to be available, creating a mockup automl run instead - automl serverless will be added soon...")
@@ -283,12 +335,34 @@ class DBDemos():
         split_probabilities = [0.7, 0.2, 0.1]  # 70% train, 20% val, 10% test
         # Add a new column with random assignments
         import numpy as np
-        df['_automl_split_col'] = np.random.choice(split_choices, size=len(df), p=split_probabilities)
+        import pandas as pd
+        import pyarrow as pa
+        if isinstance(df, pd.DataFrame):
+          df['_automl_split_col'] = np.random.choice(split_choices, size=len(df), p=split_probabilities)
+          chunks = [pa.Table.from_pandas(df, preserve_index=False)]
+          training_sample = df.sample(n=min(len(df), max_training_rows), random_state=42)
+        else:
+          import pyspark.sql.functions as F
+          split = F.rand(42)
+          df = df.withColumn('_automl_split_col', F.when(split < 0.7, 'train').when(split < 0.9, 'val').otherwise('test'))
+          DBDemos.cache_training_set(df, "dbdemos_automl_mockup_training_snapshot")
+          chunks = DBDemos.iter_arrow_chunks("dbdemos_automl_mockup_training_snapshot")
+          #random sample (top-k on a random column, no full sort)
+          training_sample = spark.table("dbdemos_automl_mockup_training_snapshot").orderBy(F.rand(7)).limit(max_training_rows).toPandas()
         import uuid
         import os
+        import pyarrow.parquet as pq
         random_path = f"/tmp/{uuid.uuid4().hex}/dataset.parquet"
         os.makedirs(os.path.dirname(random_path), exist_ok=True)
-        df.to_parquet(random_path, index=False)
+        # Write the dataset artifact chunk by chunk
+        writer = None
+        for chunk in chunks:
+          if writer is None:
+            writer = pq.ParquetWriter(random_path, chunk.schema)
+          writer.write_table(chunk)
+        if writer is not None:
+          writer.close()
+        df = training_sample
         mlflow.log_artifact(random_path, artifact_path='data/training_data')
         model = None
         if model_name is not None and target_col is not None:
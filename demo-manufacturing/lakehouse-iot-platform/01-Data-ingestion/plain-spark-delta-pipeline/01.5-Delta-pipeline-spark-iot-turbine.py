@@ -39,6 +39,15 @@
 
 # COMMAND ----------
 
+# MAGIC %run ../../_resources/02-sensor-hourly-functions
+
+# COMMAND ----------
+
+#batch: rebuild spark_sensor_hourly from the full bronze table. streaming: incremental MERGE of the new sensor data only
+dbutils.widgets.dropdown("sensor_hourly_mode", "batch", ["batch", "streaming"], "spark_sensor_hourly build mode")
+
+# COMMAND ----------
+
 # MAGIC %md-sandbox
 # MAGIC ## Building a Spark Data pipeline with Delta Lake
 # MAGIC
@@ -195,21 +204,15 @@ df.plot(x="timestamp", y=["sensor_F", "sensor_E"], kind="line")
 
 # COMMAND ----------
 
-import pyspark.sql.functions as F
-#Compute std and percentil of our timeserie per hour
-sensors = [c for c in spark.read.table("spark_sensor_bronze").columns if "sensor" in c]
-aggregations = [F.avg("energy").alias("avg_energy")]
-for sensor in sensors:
-  aggregations.append(F.stddev_pop(sensor).alias("std_"+sensor))
-  aggregations.append(F.percentile_approx(sensor, [0.1, 0.3, 0.6, 0.8, 0.95]).alias("percentiles_"+sensor))
-  
-df = (spark.table("spark_sensor_bronze")
-          .withColumn("hourly_timestamp", F.date_trunc("hour", F.from_unixtime("timestamp")))
-          .groupBy('hourly_timestamp', 'turbine_id').agg(*aggregations))
-
-df.write.mode('overwrite').saveAsTable("spark_sensor_hourly")
+#Compute std and percentil of our timeserie per hour (see ../../_resources/02-sensor-hourly-functions)
+if dbutils.widgets.get("sensor_hourly_mode") == "streaming":
+  #Only the new sensor data is consumed: the aggregates are merged as mergeable partials (count/mean/M2 and percentile sketches),
+  #so late data updates the hours it belongs to, and only them.
+  build_sensor_hourly_streaming("spark_sensor_bronze", "spark_sensor_hourly").awaitTermination()
+else:
+  #Full table update: simple, but the cost grows with the bronze history.
+  build_sensor_hourly_batch("spark_sensor_bronze", "spark_sensor_hourly")
 display(spark.table("spark_sensor_hourly"))
-#Note: a more scalable solution would be to switch to streaming API and compute the aggregation with a ~3hours watermark and MERGE (upserting) the final output. For this demo clarity we we'll go with a full table update instead.
 
 # COMMAND ----------
 
@@ -261,13 +264,50 @@ columns = predict_maintenance.metadata.get_input_schema().input_names()
 
 # COMMAND ----------
 
-w = Window.partitionBy("turbine_id").orderBy(col("hourly_timestamp").desc())
-(spark.table("spark_sensor_hourly")
-  .withColumn("row", F.row_number().over(w))
-  .filter(col("row") == 1)
-  .join(spark.table('spark_turbine'), ['turbine_id']).drop("row", "_rescued_data")
-  .withColumn("prediction", predict_maintenance(*columns))
-  .write.mode('overwrite').saveAsTable("spark_current_turbine_metrics"))
+#Instead of re-ranking the full spark_sensor_hourly table and re-scoring all the turbines at each refresh, we consume its Change Data Feed:
+#only the turbines with a new (or updated) latest hour are re-scored and MERGEd in spark_current_turbine_metrics.
+current_metrics_checkpoint = f"{volume_folder}/checkpoint/spark_current_turbine_metrics"
+hourly_columns = [c for c in spark.table("spark_sensor_hourly").columns if c != "turbine_id"]
+
+def latest_hour_per_turbine(hourly_df):
+  #max_by aggregation: no window over the full history
+  return (hourly_df.groupBy("turbine_id")
+                   .agg(F.max_by(F.struct(*hourly_columns), "hourly_timestamp").alias("latest"))
+                   .select("turbine_id", "latest.*"))
+
+def score(latest_df):
+  return (latest_df.join(spark.table('spark_turbine'), ['turbine_id']).drop("_rescued_data")
+                   .withColumn("prediction", predict_maintenance(*columns)))
+
+def merge_current_turbine_metrics(batch_df, batch_id):
+  changes = latest_hour_per_turbine(batch_df.where("_change_type IN ('insert', 'update_postimage')"))
+  #Keep the turbines with a more recent hour, or whose latest hour features changed (late data): the other ones keep their prediction
+  features_changed = " OR ".join(f"NOT (c.{col_name} <=> t.{col_name})" for col_name in hourly_columns)
+  changed = (changes.alias("c").join(spark.table("spark_current_turbine_metrics").alias("t"), "turbine_id", "left")
+                    .where(f"t.hourly_timestamp IS NULL OR c.hourly_timestamp > t.hourly_timestamp OR (c.hourly_timestamp = t.hourly_timestamp AND ({features_changed}))")
+                    .select("c.*"))
+  score(changed).createOrReplaceTempView("current_turbine_metrics_updates")
+  batch_df.sparkSession.sql("""
+    MERGE INTO spark_current_turbine_metrics t USING current_turbine_metrics_updates s ON t.turbine_id = s.turbine_id
+    WHEN MATCHED THEN UPDATE SET *
+    WHEN NOT MATCHED THEN INSERT *""")
+
+spark.sql("ALTER TABLE spark_sensor_hourly SET TBLPROPERTIES (delta.enableChangeDataFeed = true)")
+starting_version = spark.sql("DESCRIBE HISTORY spark_sensor_hourly LIMIT 1").first()["version"]
+if not spark.catalog.tableExists("spark_current_turbine_metrics") or DBDemos.is_folder_empty(current_metrics_checkpoint):
+  #First run: score the latest hour of every turbine once, then follow the changes from this version
+  (score(latest_hour_per_turbine(spark.read.option("versionAsOf", starting_version).table("spark_sensor_hourly")))
+     .write.mode('overwrite').saveAsTable("spark_current_turbine_metrics"))
+
+(spark.readStream
+   .option("readChangeFeed", "true")
+   .option("startingVersion", starting_version) #only used for the first run, then the checkpoint is used
+   .table("spark_sensor_hourly")
+   .writeStream
+     .foreachBatch(merge_current_turbine_metrics)
+     .option("checkpointLocation", current_metrics_checkpoint)
+     .trigger(availableNow=True)
+     .start().awaitTermination())
 
 # COMMAND ----------
 
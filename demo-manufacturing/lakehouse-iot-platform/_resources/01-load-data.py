@@ -5,6 +5,10 @@
 # COMMAND ----------
 
 dbutils.widgets.dropdown("reset_all_data", "false", ["true", "false"], "Reset all data")
+#numpy: vectorized generator, generating blocks of turbines at once (use it to scale the dataset for stress tests)
+dbutils.widgets.dropdown("sensor_engine", "mandrova", ["mandrova", "numpy"], "Sensor data generator")
+dbutils.widgets.text("turbine_count", "512", "Number of turbines")
+dbutils.widgets.text("sample_size", "2125", "Points per turbine")
 
 # COMMAND ----------
 
@@ -68,12 +72,34 @@ import numpy as np
 import cloudpickle
 from unittest import mock
 
-# define a custom model randomly flagging 10% of sensor for the demo init (it'll be replace with proper model on the training part.)
-class MaintenanceEmptyModel(mlflow.pyfunc.PythonModel):
+from abc import ABCMeta, abstractmethod
+
+class VectorizedMockModel(mlflow.pyfunc.PythonModel, metaclass=ABCMeta):
+    """Placeholder model: predictions are computed for the whole batch with numpy, seeded on a hash of the key_columns (the same row gets the same prediction, whatever the spark_udf batching)."""
+    key_columns = None #None: hash all the input columns
+
+    def __init__(self, seed=42):
+        self.seed = seed
+
+    def uniform(self, model_input: pd.DataFrame) -> np.ndarray:
+        keys = model_input[self.key_columns] if self.key_columns else model_input
+        h = pd.util.hash_pandas_object(keys, index=False, hash_key=f"{self.seed:016d}"[-16:]).to_numpy()
+        return (h >> np.uint64(11)) / float(1 << 53)
+
+    @abstractmethod
+    def predict_from_uniform(self, model_input: pd.DataFrame, u: np.ndarray) -> pd.Series:
+        """Prediction of each row, from its uniform draw u in [0, 1)"""
+
     def predict(self, context, model_input: pd.DataFrame) -> pd.Series:
-        import random
-        sensors = ['sensor_F', 'sensor_D', 'sensor_B']
-        return model_input['avg_energy'].apply(lambda x: 'ok' if random.random() < 0.9 else random.choice(sensors))
+        return self.predict_from_uniform(model_input, self.uniform(model_input))
+
+# define a custom model randomly flagging 10% of sensor for the demo init (it'll be replace with proper model on the training part.)
+class MaintenanceEmptyModel(VectorizedMockModel):
+    sensors = np.array(['sensor_F', 'sensor_D', 'sensor_B'])
+    def predict_from_uniform(self, model_input: pd.DataFrame, u: np.ndarray) -> pd.Series:
+        #u < 0.9: ok, the remaining 10% are split evenly between the sensors
+        faulty = self.sensors[np.minimum(((u - 0.9) / 0.1 * len(self.sensors)).astype(int), len(self.sensors) - 1).clip(0)]
+        return pd.Series(np.where(u < 0.9, 'ok', faulty), index=model_input.index)
  
 #Enable Unity Catalog with mlflow registry
 mlflow.set_registry_uri('databricks-uc')
@@ -381,8 +407,9 @@ current_time = int(time.time()) - 3600*30
 #Sec between 2 metrics
 frequency_sec = 10
 #X points per turbine (1 point per frequency_sec second)
-sample_size = 2125
-turbine_count = 512
+sample_size = int(dbutils.widgets.get("sample_size"))
+turbine_count = int(dbutils.widgets.get("turbine_count"))
+sensor_engine = dbutils.widgets.get("sensor_engine")
 dfs = []
 
 # COMMAND ----------
@@ -442,7 +469,78 @@ def generate_turbine(iterator: Iterator[pd.DataFrame]) -> Iterator[pd.DataFrame]
     for i, row in pdf.iterrows():
       yield generate_turbine_data(row["id"])
 
-spark_df = spark.range(0, turbine_count).repartition(int(turbine_count/10)).mapInPandas(generate_turbine, schema=df_schema.schema)
+if sensor_engine == "mandrova":
+  spark_df = spark.range(0, turbine_count).repartition(int(turbine_count/10)).mapInPandas(generate_turbine, schema=df_schema.schema)
+
+# COMMAND ----------
+
+# DBTITLE 1,Vectorized sensor generator
+#Same semantic as generate_turbine_data, but all the sensors of a block of turbines are generated as (turbine x sensor x sample) arrays.
+#Each turbine has its own seeded generator: a turbine always gets the same data, whatever the block it's generated in.
+sensor_names = np.array(['sensor_'+s['name'] for s in sensors])
+sensor_sigmas = np.array([s['sigma'] for s in sensors])
+sensor_sin_steps = np.array([s['sin_step'] for s in sensors])
+#A, C and E are never damaged for simplification
+damageable_sensors = ~np.isin(sensor_names, ['sensor_A', 'sensor_C', 'sensor_E'])
+report_pool = np.array(report_list, dtype=object)
+sensor_schema = "timestamp LONG, " + ", ".join(f"{name} DOUBLE" for name in sensor_names) + ", energy DOUBLE, turbine_id STRING, abnormal_sensor STRING, maintenance_report STRING"
+
+def generate_turbine_block(turbines, seed=0, noise=2, delta=-3):
+  rngs = [np.random.default_rng([seed, int(t)]) for t in turbines]
+  n_turbines, n_sensors = len(turbines), len(sensor_names)
+  damaged = turbines > turbine_count*0.6
+  turbine_ids = np.array([str(uuid.UUID(bytes=rng.bytes(16), version=4)) for rng in rngs], dtype=object)
+  #Damaged turbines: each damageable sensor, in a random order, has 50% chance to be the faulty one (only 1 faulty sensor per turbine)
+  faulty = np.full(n_turbines, -1)
+  for i, rng in enumerate(rngs):
+    order, draws = rng.permutation(n_sensors), rng.random(n_sensors)
+    candidates = [j for j in order if damaged[i] and damageable_sensors[j] and draws[j] < 0.5]
+    faulty[i] = candidates[0] if candidates else -1
+  is_faulty = faulty[:, None] == np.arange(n_sensors)[None, :]
+  sigma = sensor_sigmas[None, :] * np.where(is_faulty, np.array([rng.integers(8, 21) for rng in rngs])[:, None] / 10, 1)
+  normal = np.stack([rng.standard_normal((n_sensors, sample_size)) for rng in rngs])
+  uniform = np.stack([rng.random((4, n_sensors, sample_size), dtype=np.float32) for rng in rngs])
+
+  #normal(0, sigma) + 2*exp(sin(t))+delta, t increasing by sin_step
+  values = normal * sigma[:, :, None] + (2*np.exp(np.sin(np.arange(sample_size)[None, :] * sensor_sin_steps[:, None])) + delta)[None, :, :]
+  max_value, min_value = values.max(axis=2, keepdims=True), values.min(axis=2, keepdims=True)
+  #Faulty sensor: 15% of outliers in [-max*k, max*k], k in [2, 3]
+  k = np.array([rng.integers(2, 4) for rng in rngs])[:, None, None]
+  values = np.where(is_faulty[:, :, None] & (uniform[:, 0] < 0.15), (uniform[:, 1]*2-1) * max_value * k, values)
+  #1% of noise outliers on all the sensors
+  values = np.where(uniform[:, 2] < 0.01, min_value*noise + uniform[:, 3] * (max_value - min_value)*noise, values)
+
+  #Energy: random walk, damaged turbine will produce less. Add some null values in some damaged turbines to get expectation metrics
+  factor = np.where(damaged, 50, 30)[:, None]
+  steps = np.abs(np.stack([rng.standard_normal(sample_size) for rng in rngs]).cumsum(axis=1)) / factor
+  energy = np.concatenate([np.zeros((n_turbines, 1)), steps.cumsum(axis=1)[:, :-1]], axis=1)
+  with_nulls = damaged & np.array([rng.integers(0, 10) > 7 for rng in rngs])
+  energy[with_nulls[:, None] & (np.stack([rng.random(sample_size) for rng in rngs]) < 0.005)] = np.nan
+
+  #One maintenance report per faulty turbine
+  abnormal_sensor = np.where(faulty >= 0, sensor_names[faulty], "ok")
+  reports = np.where(faulty >= 0, report_pool[[rng.integers(0, len(report_pool)) for rng in rngs]], "N/A")
+  pdf = pd.DataFrame({"timestamp": np.tile(current_time + np.arange(sample_size) * frequency_sec, n_turbines)})
+  for j, name in enumerate(sensor_names):
+    pdf[name] = values[:, j, :].ravel()
+  pdf["energy"] = energy.ravel()
+  pdf["turbine_id"] = np.repeat(turbine_ids, sample_size)
+  pdf["abnormal_sensor"] = np.repeat(abnormal_sensor, sample_size)
+  pdf["maintenance_report"] = np.repeat(reports, sample_size)
+  return pdf
+
+#~1M points per block to bound the executor memory (10k turbines x 100k samples: 10 turbines per block)
+turbines_per_block = max(1, 1000000 // sample_size)
+def generate_turbine_blocks(iterator: Iterator[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+  for pdf in iterator:
+    for block_start in pdf["id"]:
+      yield generate_turbine_block(np.arange(block_start, min(block_start + turbines_per_block, turbine_count)))
+
+if sensor_engine == "numpy":
+  block_count = -(-turbine_count // turbines_per_block)
+  spark_df = (spark.range(0, turbine_count, turbines_per_block)
+                   .repartition(min(block_count, 2000))
+                   .mapInPandas(generate_turbine_blocks, schema=sensor_schema))
 
 # COMMAND ----------
 
@@ -0,0 +1,163 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC ## Hourly sensor aggregation: batch rebuild vs incremental MERGE
+# MAGIC
+# MAGIC Shared by `01.5-Delta-pipeline-spark-iot-turbine` and the `03-sensor-hourly-benchmark` notebook. Both implementations produce the same `spark_sensor_hourly` schema: `hourly_timestamp, turbine_id, avg_energy, std_sensor_X, percentiles_sensor_X`.
+# MAGIC
+# MAGIC - `build_sensor_hourly_batch`: full `groupBy` over the whole bronze table, overwriting the output
+# MAGIC - `build_sensor_hourly_streaming`: consumes only the new bronze rows. Each micro-batch computes mergeable partial aggregates per (hour, turbine) and MERGEs them in a `<table>_sketch` table, then MERGEs the finalized rows of the affected hours only in the output table. Late data is merged in the existing hours, whatever its delay.
+# MAGIC
+# MAGIC The partials are the count/mean/M2 of each sensor (merged with Chan's formula for `stddev_pop`) and a log-bucket histogram sketch (DDSketch-like, ~1% relative error) used for the percentiles. The histogram is a `map<int, bigint>`: merging 2 sketches is a sum of the bucket counts.
+
+# COMMAND ----------
+
+import json
+import numpy as np
+import pandas as pd
+import pyspark.sql.functions as F
+import time
+
+percentiles = [0.1, 0.3, 0.6, 0.8, 0.95]
+#Bucket i holds the values in (gamma^(i-1), gamma^i]: gamma = 1.02 gives ~1% relative error on the percentiles
+SKETCH_GAMMA = 1.02
+#Shift the bucket indexes to keep them positive, the sign of the index is the sign of the value. Values below SKETCH_MIN go to bucket 0
+SKETCH_OFFSET = 1000
+SKETCH_MIN = 1e-6
+
+def get_sensors(source_table):
+  return [c for c in spark.read.table(source_table).columns if "sensor" in c]
+
+def with_hourly_timestamp(df):
+  return df.withColumn("hourly_timestamp", F.date_trunc("hour", F.from_unixtime("timestamp")))
+
+# COMMAND ----------
+
+# DBTITLE 1,Batch: full rebuild
+def build_sensor_hourly_batch(source_table="spark_sensor_bronze", target_table="spark_sensor_hourly"):
+  #Compute std and percentil of our timeserie per hour
+  aggregations = [F.avg("energy").alias("avg_energy")]
+  for sensor in get_sensors(source_table):
+    aggregations.append(F.stddev_pop(sensor).alias("std_"+sensor))
+    aggregations.append(F.percentile_approx(sensor, percentiles).alias("percentiles_"+sensor))
+
+  df = (with_hourly_timestamp(spark.table(source_table))
+            .groupBy('hourly_timestamp', 'turbine_id').agg(*aggregations))
+  df.write.mode('overwrite').saveAsTable(target_table)
+
+# COMMAND ----------
+
+# DBTITLE 1,Streaming: mergeable partials + MERGE
+def sketch_index(values):
+  magnitude = np.abs(values)
+  index = np.ceil(np.log(np.maximum(magnitude, SKETCH_MIN)) / np.log(SKETCH_GAMMA)).astype(np.int64) + SKETCH_OFFSET
+  return np.where(magnitude < SKETCH_MIN, 0, np.sign(values).astype(np.int64) * index)
+
+def partial_schema(sensors):
+  columns = ["hourly_timestamp TIMESTAMP", "turbine_id STRING", "energy_n LONG", "energy_sum DOUBLE"]
+  for sensor in sensors:
+    columns += [f"{sensor}_n LONG", f"{sensor}_mean DOUBLE", f"{sensor}_m2 DOUBLE", f"{sensor}_buckets ARRAY<INT>", f"{sensor}_counts ARRAY<LONG>"]
+  return ", ".join(columns)
+
+def hourly_partials(sensors):
+  def compute(pdf: pd.DataFrame) -> pd.DataFrame:
+    energy = pdf["energy"].dropna()
+    row = {"hourly_timestamp": [pdf["hourly_timestamp"].iloc[0]], "turbine_id": [pdf["turbine_id"].iloc[0]],
+           "energy_n": [len(energy)], "energy_sum": [float(energy.sum())]}
+    for sensor in sensors:
+      values = pdf[sensor].dropna().to_numpy(dtype=np.float64)
+      mean = values.mean() if len(values) > 0 else 0.0
+      buckets, counts = np.unique(sketch_index(values), return_counts=True)
+      row[f"{sensor}_n"] = [len(values)]
+      row[f"{sensor}_mean"] = [mean]
+      row[f"{sensor}_m2"] = [float(((values - mean) ** 2).sum())]
+      row[f"{sensor}_buckets"] = [buckets.astype(np.int32)]
+      row[f"{sensor}_counts"] = [counts.astype(np.int64)]
+    return pd.DataFrame(row)
+  return compute
+
+def merge_partial_sql(sensor):
+  n = f"(t.{sensor}_n + s.{sensor}_n)"
+  return f"""
+      {sensor}_n      = {n},
+      {sensor}_mean   = CASE WHEN {n} = 0 THEN 0 ELSE (t.{sensor}_mean * t.{sensor}_n + s.{sensor}_mean * s.{sensor}_n) / {n} END,
+      {sensor}_m2     = t.{sensor}_m2 + s.{sensor}_m2 + CASE WHEN {n} = 0 THEN 0 ELSE power(s.{sensor}_mean - t.{sensor}_mean, 2) * t.{sensor}_n * s.{sensor}_n / {n} END,
+      {sensor}_sketch = map_zip_with(t.{sensor}_sketch, s.{sensor}_sketch, (k, a, b) -> coalesce(a, 0) + coalesce(b, 0))"""
+
+def sketch_percentiles_sql(sensor):
+  #Cumulative counts over the sorted buckets, then the first bucket reaching the rank of each percentile
+  cumulative = f"""aggregate(array_sort(map_entries({sensor}_sketch)), cast(array() as array<struct<k:int, c:bigint>>),
+                     (acc, e) -> concat(acc, array(named_struct('k', e.key, 'c', e.value + coalesce(try_element_at(acc, -1).c, 0L)))))"""
+  #(the single element transform binds the cumulative array to "cum" so that it's computed once)
+  buckets = f"""element_at(transform(array({cumulative}), cum -> transform(array({', '.join(str(p) for p in percentiles)}),
+                     q -> try_element_at(filter(cum, x -> x.c >= greatest(1, ceil(q * {sensor}_n))), 1).k)), 1)"""
+  #Bucket representative value: 2*gamma^i/(1+gamma), with the sign of the bucket index
+  return f"transform({buckets}, b -> CASE WHEN b = 0 THEN 0D ELSE signum(b) * 2 * power({SKETCH_GAMMA}D, abs(b) - {SKETCH_OFFSET}) / (1 + {SKETCH_GAMMA}D) END)"
+
+def finalize_sql(sketch_table, sensors, affected_keys=None):
+  columns = ["hourly_timestamp", "turbine_id", "CASE WHEN energy_n = 0 THEN NULL ELSE energy_sum / energy_n END AS avg_energy"]
+  for sensor in sensors:
+    columns.append(f"CASE WHEN {sensor}_n = 0 THEN NULL ELSE sqrt({sensor}_m2 / {sensor}_n) END AS std_{sensor}")
+    columns.append(f"CASE WHEN {sensor}_n = 0 THEN NULL ELSE {sketch_percentiles_sql(sensor)} END AS percentiles_{sensor}")
+  join = f" INNER JOIN {affected_keys} USING (hourly_timestamp, turbine_id)" if affected_keys else ""
+  return f"SELECT {', '.join(columns)} FROM {sketch_table}{join}"
+
+def idempotent_sql(session, app_id, batch_id, query):
+  #foreachBatch is at-least-once: Delta skips the commit when (app_id, batch_id) was already committed, so a replayed batch isn't added twice to the sketches
+  session.conf.set("spark.databricks.delta.write.txnAppId", app_id)
+  session.conf.set("spark.databricks.delta.write.txnVersion", str(batch_id))
+  try:
+    session.sql(query)
+  finally:
+    session.conf.unset("spark.databricks.delta.write.txnAppId")
+    session.conf.unset("spark.databricks.delta.write.txnVersion")
+
+def build_sensor_hourly_streaming(source_table="spark_sensor_bronze", target_table="spark_sensor_hourly", checkpoint_location=None, processing_time=None, on_batch=None):
+  """availableNow by default, or continuous with a processing_time trigger. on_batch(batch_df, batch_id) is called once the micro-batch is merged."""
+  sensors = get_sensors(source_table)
+  sketch_table = target_table+"_sketch"
+  sketch_columns = ["hourly_timestamp TIMESTAMP", "turbine_id STRING", "energy_n LONG", "energy_sum DOUBLE"]
+  for sensor in sensors:
+    sketch_columns += [f"{sensor}_n LONG", f"{sensor}_mean DOUBLE", f"{sensor}_m2 DOUBLE", f"{sensor}_sketch MAP<INT, BIGINT>"]
+  spark.sql(f"CREATE TABLE IF NOT EXISTS {sketch_table} ({', '.join(sketch_columns)}) CLUSTER BY (turbine_id, hourly_timestamp)")
+  spark.sql(f"CREATE TABLE IF NOT EXISTS {target_table} AS {finalize_sql(sketch_table, sensors)} LIMIT 0")
+  merge_partials = ",".join(merge_partial_sql(sensor) for sensor in sensors)
+  checkpoint_location = checkpoint_location or f"{volume_folder}/checkpoint/{target_table}"
+  query_id = {}
+  def txn_app_id():
+    #The stream query id is saved in the checkpoint: a new checkpoint (batch ids restarting at 0) gets a new app id, so its batches aren't skipped
+    if "id" not in query_id:
+      query_id["id"] = json.loads(dbutils.fs.head(f"{checkpoint_location}/metadata"))["id"]
+    return f"{sketch_table}_merge_{query_id['id']}"
+
+  def merge_sensor_hourly(batch_df, batch_id):
+    partials = (batch_df.groupBy("hourly_timestamp", "turbine_id")
+                        .applyInPandas(hourly_partials(sensors), partial_schema(sensors)))
+    for sensor in sensors:
+      partials = (partials.withColumn(f"{sensor}_sketch", F.map_from_arrays(f"{sensor}_buckets", f"{sensor}_counts"))
+                          .drop(f"{sensor}_buckets", f"{sensor}_counts"))
+    partials.cache().createOrReplaceTempView("sensor_hourly_partials")
+    idempotent_sql(batch_df.sparkSession, txn_app_id(), batch_id, f"""
+      MERGE INTO {sketch_table} t USING sensor_hourly_partials s
+      ON t.hourly_timestamp = s.hourly_timestamp AND t.turbine_id = s.turbine_id
+      WHEN MATCHED THEN UPDATE SET
+        energy_n   = t.energy_n + s.energy_n,
+        energy_sum = t.energy_sum + s.energy_sum,{merge_partials}
+      WHEN NOT MATCHED THEN INSERT *""")
+    #Only the hours touched by this micro-batch (including late data) are recomputed, from the sketches: replaying it is idempotent
+    affected_keys = "(SELECT hourly_timestamp, turbine_id FROM sensor_hourly_partials)"
+    batch_df.sparkSession.sql(f"""
+      MERGE INTO {target_table} t USING ({finalize_sql(sketch_table, sensors, affected_keys)}) s
+      ON t.hourly_timestamp = s.hourly_timestamp AND t.turbine_id = s.turbine_id
+      WHEN MATCHED THEN UPDATE SET *
+      WHEN NOT MATCHED THEN INSERT *""")
+    partials.unpersist()
+    if on_batch is not None:
+      on_batch(batch_df, batch_id)
+
+  trigger = {"processingTime": processing_time} if processing_time else {"availableNow": True}
+  return (with_hourly_timestamp(spark.readStream.option("skipChangeCommits", "true").table(source_table))
+            .writeStream
+              .foreachBatch(merge_sensor_hourly)
+              .option("checkpointLocation", checkpoint_location)
+              .trigger(**trigger)
+              .start())
@@ -0,0 +1,82 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC # spark_sensor_hourly benchmark: batch rebuild vs incremental MERGE
+# MAGIC
+# MAGIC Compare the two implementations of `02-sensor-hourly-functions` with 512 and 10k turbines.
+# MAGIC
+# MAGIC For each fleet size, we generate `history_hours` of synthetic sensor data and build the hourly table with both modes. We then append one new hour of data, plus 5% of late rows belonging to an older hour, and update the table again:
+# MAGIC
+# MAGIC - the batch mode re-aggregates the full bronze table
+# MAGIC - the streaming mode only consumes the new rows and MERGEs the affected hours
+# MAGIC
+# MAGIC The report gives the rows processed, the update latency and the throughput of each step, and checks that both outputs match.
+
+# COMMAND ----------
+
+dbutils.widgets.text("history_hours", "24", "Hours of history")
+dbutils.widgets.text("frequency_sec", "60", "Seconds between 2 sensor points")
+
+# COMMAND ----------
+
+# MAGIC %run ./00-setup
+
+# COMMAND ----------
+
+# MAGIC %run ./02-sensor-hourly-functions
+
+# COMMAND ----------
+
+history_hours = int(dbutils.widgets.get("history_hours"))
+frequency_sec = int(dbutils.widgets.get("frequency_sec"))
+sensor_sigmas = {"A": 1, "B": 2, "C": 3, "D": 1.5, "E": 2, "F": 1}
+
+def generate_sensor_rows(num_turbines, start_ts, hours, seed):
+  points = hours * 3600 // frequency_sec
+  return (spark.range(num_turbines * points)
+               .select(F.concat(F.lit("turbine-"), (F.col("id") % num_turbines).cast("string")).alias("turbine_id"),
+                       (F.lit(start_ts) + (F.col("id") / num_turbines).cast("long") * frequency_sec).alias("timestamp"),
+                       (F.abs(F.randn(seed)) * 10).alias("energy"),
+                       *[(F.randn(seed + i + 1) * sigma - 3).alias(f"sensor_{name}") for i, (name, sigma) in enumerate(sensor_sigmas.items())]))
+
+def timed(step, num_turbines, rows, fn):
+  start = time.time()
+  fn()
+  duration = time.time() - start
+  return {"turbines": num_turbines, "step": step, "rows_processed": rows, "seconds": round(duration, 2), "rows_per_sec": int(rows / duration)}
+
+def max_diff(batch_table, streaming_table):
+  #std is exact in both modes, percentiles are approximated by both (percentile_approx vs ~1% sketch)
+  return (spark.table(batch_table).alias("b").join(spark.table(streaming_table).alias("s"), ["hourly_timestamp", "turbine_id"])
+               .select(F.max(F.abs(F.col("b.std_sensor_B") - F.col("s.std_sensor_B"))).alias("max_std_diff"),
+                       F.max(F.abs(F.col("b.percentiles_sensor_B")[2] - F.col("s.percentiles_sensor_B")[2])).alias("max_median_diff"))
+               .first().asDict())
+
+# COMMAND ----------
+
+results, parity = [], []
+for num_turbines in [512, 10000]:
+  bronze, batch_table, streaming_table = f"bench_sensor_bronze_{num_turbines}", f"bench_sensor_hourly_batch_{num_turbines}", f"bench_sensor_hourly_streaming_{num_turbines}"
+  for table in [bronze, batch_table, streaming_table, streaming_table+"_sketch"]:
+    spark.sql(f"DROP TABLE IF EXISTS {table}")
+  checkpoint = f"{volume_folder}/checkpoint/bench_sensor_hourly_{num_turbines}"
+  dbutils.fs.rm(checkpoint, True)
+
+  start_ts = int(time.time()) // 3600 * 3600 - history_hours * 3600
+  generate_sensor_rows(num_turbines, start_ts, history_hours, seed=0).write.saveAsTable(bronze)
+  rows = spark.table(bronze).count()
+  results.append(timed("initial build - batch", num_turbines, rows, lambda: build_sensor_hourly_batch(bronze, batch_table)))
+  results.append(timed("initial build - streaming", num_turbines, rows, lambda: build_sensor_hourly_streaming(bronze, streaming_table, checkpoint).awaitTermination()))
+
+  #New hour of data, plus 5% of late rows for an hour 2h before the end of the history
+  new_rows = generate_sensor_rows(num_turbines, start_ts + history_hours * 3600, 1, seed=1)
+  late_rows = generate_sensor_rows(num_turbines, start_ts + (history_hours - 2) * 3600, 1, seed=2).sample(0.05, seed=2)
+  increment = new_rows.union(late_rows).cache()
+  increment_rows = increment.count()
+  increment.write.mode("append").saveAsTable(bronze)
+  increment.unpersist()
+  results.append(timed("update - batch (full rebuild)", num_turbines, rows + increment_rows, lambda: build_sensor_hourly_batch(bronze, batch_table)))
+  results.append(timed("update - streaming (MERGE)", num_turbines, increment_rows, lambda: build_sensor_hourly_streaming(bronze, streaming_table, checkpoint).awaitTermination()))
+  parity.append({"turbines": num_turbines, **max_diff(batch_table, streaming_table)})
+
+display(pd.DataFrame(results))
+display(pd.DataFrame(parity))
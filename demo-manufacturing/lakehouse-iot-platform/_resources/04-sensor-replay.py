@@ -0,0 +1,184 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC
+# MAGIC ### Continuous sensor replay
+# MAGIC
+# MAGIC `01-load-data` writes the sensor series in `incoming_data` once. This notebook replays these series continuously in a landing folder, as if the turbines were sending their metrics now, to load-test the ingestion (Auto Loader to bronze) and the hourly features (`02-sensor-hourly-functions`, incremental MERGE) stages.
+# MAGIC
+# MAGIC - `speedup`: replay speed-up factor (60: 1 minute of sensor data is sent every second)
+# MAGIC - `ramp_factor` / `ramp_steps` / `step_duration_min`: the speed-up is multiplied by `ramp_factor` at each step, to find the maximum sustainable throughput
+# MAGIC - `landing_folder`: where the replayed files are written (`replay-*` files). It can be set to the `incoming_data` folder to also feed the demo pipelines: only the previous `replay-*` files are removed from it at startup, the demo dataset is kept.
+# MAGIC
+# MAGIC The series are replayed in time order: each micro-batch file holds the next time slice of all the turbines, partitioned by turbine, so the per-turbine ordering is preserved. The `timestamp` is rewritten to the replay time (event time). The series loop when their end is reached.
+# MAGIC
+# MAGIC While the replay runs, both stages run continuously on the replay tables, and the event time to table lag is recorded for each of them in the `sensor_replay_lag` table.
+
+# COMMAND ----------
+
+dbutils.widgets.text("speedup", "60", "Replay speed-up factor")
+dbutils.widgets.text("ramp_factor", "2", "Speed-up multiplier per ramp step")
+dbutils.widgets.text("ramp_steps", "5", "Number of ramp steps")
+dbutils.widgets.text("step_duration_min", "3", "Duration of each step (minutes)")
+dbutils.widgets.text("trigger_interval", "5", "Seconds between 2 replayed files")
+dbutils.widgets.text("landing_folder", "", "Landing folder (default: <volume>/incoming_data_replay)")
+
+# COMMAND ----------
+
+# MAGIC %run ./00-setup
+
+# COMMAND ----------
+
+# MAGIC %run ./02-sensor-hourly-functions
+
+# COMMAND ----------
+
+import threading
+
+speedup = float(dbutils.widgets.get("speedup"))
+ramp_factor = float(dbutils.widgets.get("ramp_factor"))
+ramp_steps = int(dbutils.widgets.get("ramp_steps"))
+step_duration_min = float(dbutils.widgets.get("step_duration_min"))
+trigger_interval = float(dbutils.widgets.get("trigger_interval"))
+landing_folder = dbutils.widgets.get("landing_folder") or f"{volume_folder}/incoming_data_replay"
+staging_folder = f"{volume_folder}/replay_staging"
+replay_checkpoint = f"{volume_folder}/checkpoint/sensor_replay"
+
+# COMMAND ----------
+
+# DBTITLE 1,Replay source
+class SensorReplay:
+  """Replays the incoming_data series: each call to next_slice sends the next time slice of all the turbines."""
+  def __init__(self, source_folder, landing_folder, staging_folder):
+    self.landing_folder, self.staging_folder = landing_folder, staging_folder
+    series = spark.read.parquet(source_folder)
+    bounds = series.agg(F.min("timestamp").alias("start"), F.max("timestamp").alias("end")).first()
+    self.duration = bounds["end"] - bounds["start"] + 1
+    self.series = series.withColumn("offset_sec", F.col("timestamp") - bounds["start"]).cache()
+    self.position = 0 #replay cursor, in seconds of the original series
+    self.file_id = 0
+
+  def _slice(self, start, length):
+    #[start, start+length) in the original series, wrapping at the end of the series
+    start = start % self.duration
+    condition = (F.col("offset_sec") >= start) & (F.col("offset_sec") < start + length)
+    if start + length > self.duration:
+      condition = condition | (F.col("offset_sec") < start + length - self.duration)
+    return self.series.where(condition).withColumn("offset_sec", (F.col("offset_sec") - start + self.duration) % self.duration)
+
+  def next_slice(self, interval_sec, speedup, now):
+    #interval_sec of wall time = interval_sec*speedup seconds of sensor data, spread over the last interval (event time <= now)
+    length = min(interval_sec * speedup, self.duration)
+    rows = (self._slice(self.position, length)
+              .withColumn("timestamp", (F.lit(now - interval_sec) + F.col("offset_sec") / speedup).cast("long"))
+              .drop("offset_sec"))
+    self.position += length
+    return rows
+
+  def write(self, rows):
+    #1 file per turbine group, sorted by time. Write in a staging folder and move the files so that Auto Loader never sees a partial file
+    count = rows.count()
+    rows.repartition(8, "turbine_id").sortWithinPartitions("turbine_id", "timestamp").write.mode("overwrite").parquet(self.staging_folder)
+    for f in dbutils.fs.ls(self.staging_folder):
+      if f.name.startswith("part-"):
+        dbutils.fs.mv(f.path, f"{self.landing_folder}/replay-{self.file_id:08d}-{f.name}")
+    self.file_id += 1
+    return count
+
+# COMMAND ----------
+
+# DBTITLE 1,Ingestion and hourly features stages, running continuously
+for table in ["replay_sensor_bronze", "replay_sensor_hourly", "replay_sensor_hourly_sketch"]:
+  spark.sql(f"DROP TABLE IF EXISTS {table}")
+#Only delete what this notebook owns: the staging/checkpoint folders, and the replayed files of the landing folder (it can be the incoming_data source folder)
+for path in [staging_folder, replay_checkpoint]:
+  dbutils.fs.rm(path, True)
+dbutils.fs.mkdirs(landing_folder)
+for f in dbutils.fs.ls(landing_folder):
+  if f.name.startswith("replay-"):
+    dbutils.fs.rm(f.path)
+spark.sql("CREATE TABLE IF NOT EXISTS sensor_replay_lag (step INT, speedup DOUBLE, stage STRING, observed_at TIMESTAMP, max_event_time TIMESTAMP, lag_sec DOUBLE)")
+
+replay = SensorReplay(f"{volume_folder}/incoming_data", landing_folder, staging_folder)
+#Prime the bronze table with a first slice so that the hourly stage can start on its schema
+replay.write(replay.next_slice(trigger_interval, speedup, time.time()))
+
+bronze_query = (spark.readStream.format("cloudFiles")
+                  .option("cloudFiles.format", "parquet")
+                  .option("cloudFiles.schemaLocation", f"{replay_checkpoint}/schema")
+                  .load(landing_folder)
+                  .writeStream
+                    .option("checkpointLocation", f"{replay_checkpoint}/bronze")
+                    .trigger(processingTime=f"{int(trigger_interval)} seconds")
+                    .table("replay_sensor_bronze"))
+DBDemos.wait_for_table("replay_sensor_bronze")
+
+lag_samples = []
+current_step = {"step": 0, "speedup": speedup}
+def record_lag(stage, max_timestamp):
+  #timestamp is in epoch seconds: the lag is the wall time minus the latest event time available in the stage output
+  if max_timestamp is not None:
+    now = time.time()
+    lag_samples.append({**current_step, "stage": stage, "observed_at": datetime.fromtimestamp(now), "max_event_time": datetime.fromtimestamp(max_timestamp), "lag_sec": now - max_timestamp})
+
+#Hourly stage: lag recorded when a micro-batch is merged
+hourly_query = build_sensor_hourly_streaming("replay_sensor_bronze", "replay_sensor_hourly", f"{replay_checkpoint}/hourly", processing_time=f"{int(trigger_interval)} seconds",
+                                             on_batch=lambda batch_df, batch_id: record_lag("hourly", batch_df.select(F.max("timestamp")).first()[0]))
+
+#Ingestion stage: lag polled on the bronze table
+def monitor_bronze(done, poll_interval=2):
+  while not done.is_set():
+    record_lag("bronze", spark.table("replay_sensor_bronze").select(F.max("timestamp")).first()[0])
+    time.sleep(poll_interval)
+
+# COMMAND ----------
+
+# DBTITLE 1,Replay with a ramping speed-up
+producer_log = []
+replay_done = threading.Event()
+monitor = threading.Thread(target=monitor_bronze, args=(replay_done,))
+monitor.start()
+
+for step in range(ramp_steps):
+  step_speedup = speedup * ramp_factor ** step
+  current_step.update(step=step, speedup=step_speedup)
+  end_time = time.time() + step_duration_min * 60
+  next_trigger = time.time() + trigger_interval
+  while time.time() < end_time:
+    time.sleep(max(0, next_trigger - time.time()))
+    start = time.time()
+    rows = replay.write(replay.next_slice(trigger_interval, step_speedup, start))
+    producer_log.append({"step": step, "speedup": step_speedup, "rows": rows, "write_sec": time.time() - start})
+    next_trigger += trigger_interval
+    if next_trigger < time.time():
+      print(f"Replay is late by {time.time() - next_trigger:.1f}s, can't produce {step_speedup}x")
+      next_trigger = time.time()
+
+replay_done.set()
+monitor.join()
+for query in [bronze_query, hourly_query]:
+  query.stop()
+
+# COMMAND ----------
+
+# DBTITLE 1,Throughput & lag report
+lag = pd.DataFrame(lag_samples)
+spark.createDataFrame(lag).write.mode("append").saveAsTable("sensor_replay_lag")
+produced = pd.DataFrame(producer_log).groupby(["step", "speedup"]).agg(rows=("rows", "sum"), write_sec=("write_sec", "sum")).reset_index()
+produced["rows_per_sec"] = (produced["rows"] / (step_duration_min * 60)).astype(int)
+
+#A stage keeps up with a step if its lag doesn't drift: the lag at the end of the step stays close to the lag at its beginning
+def lag_stats(samples):
+  samples = samples.sort_values("observed_at")
+  tail, head = samples.tail(max(1, len(samples) // 4)), samples.head(max(1, len(samples) // 4))
+  return pd.Series({"lag_p50_sec": samples["lag_sec"].median(), "lag_max_sec": samples["lag_sec"].max(),
+                    "lag_drift_sec": tail["lag_sec"].mean() - head["lag_sec"].mean()})
+
+report = lag.groupby(["step", "stage"]).apply(lag_stats).reset_index().pivot(index="step", columns="stage")
+report.columns = [f"{stage}_{metric}" for metric, stage in report.columns]
+report = produced.merge(report.reset_index(), on="step")
+for stage in ["bronze", "hourly"]:
+  report[f"{stage}_sustained"] = report[f"{stage}_lag_drift_sec"] < 2 * trigger_interval
+display(report)
+
+sustained = report[report["bronze_sustained"] & report["hourly_sustained"]]
+print(f"Max sustained throughput: {sustained['rows_per_sec'].max() if len(sustained) else 'none of the steps'} rows/sec")
@@ -44,6 +44,30 @@
       "title":  "Load raw data", 
       "description": "Load raw data in dbfs."
     },
+    {
+      "path": "_resources/02-sensor-hourly-functions", 
+      "pre_run": False, 
+      "publish_on_website": False, 
+      "add_cluster_setup_cell": False,
+      "title":  "Hourly sensor aggregation", 
+      "description": "Batch and incremental (MERGE) spark_sensor_hourly implementations."
+    },
+    {
+      "path": "_resources/03-sensor-hourly-benchmark", 
+      "pre_run": False, 
+      "publish_on_website": False, 
+      "add_cluster_setup_cell": False,
+      "title":  "Hourly sensor aggregation benchmark", 
+      "description": "Compare the batch rebuild and the incremental MERGE with 512 and 10k turbines."
+    },
+    {
+      "path": "_resources/04-sensor-replay", 
+      "pre_run": False, 
+      "publish_on_website": False, 
+      "add_cluster_setup_cell": False,
+      "title":  "Continuous sensor replay", 
+      "description": "Replay the turbine sensor series at increasing speed-ups and measure the ingestion and hourly features lag."
+    },
     {
       "path": "config", 
       "pre_run": False, 
@@ -146,6 +146,13 @@
 
 volume_folder = f"/Volumes/{catalog}/{db}/c360"
 
+#Rows processed & latency of each step of the pipeline
+pipeline_metrics = []
+def run_step(step, start, *queries):
+  for query in queries:
+    query.awaitTermination()
+  pipeline_metrics.append({"step": step, "rows_processed": sum(p["numInputRows"] for q in queries for p in q.recentProgress), "duration_sec": round(time.time() - start, 2)})
+
 def ingest_folder(folder, data_format, table):
   bronze_products = (spark.readStream
                               .format("cloudFiles")
@@ -160,9 +167,12 @@ def ingest_folder(folder, data_format, table):
                     .trigger(availableNow = True) #Remove for real time streaming
                     .table(table)) #Table will be created if we haven't specified the schema first
   
-ingest_folder(f'{volume_folder}/orders', 'json', 'spark_churn_orders_bronze')
-ingest_folder(f'{volume_folder}/events', 'csv', 'spark_churn_app_events')
-ingest_folder(f'{volume_folder}/users', 'json',  'spark_churn_users_bronze').awaitTermination()
+#Start the 3 ingestions in parallel, and wait for all of them before the silver/gold steps
+start = time.time()
+run_step("bronze ingestion", start,
+         ingest_folder(f'{volume_folder}/orders', 'json', 'spark_churn_orders_bronze'),
+         ingest_folder(f'{volume_folder}/events', 'csv', 'spark_churn_app_events'),
+         ingest_folder(f'{volume_folder}/users', 'json',  'spark_churn_users_bronze'))
 
 # COMMAND ----------
 
@@ -185,7 +195,7 @@ ingest_folder(f'{volume_folder}/users', 'json',  'spark_churn_users_bronze').awa
 
 # COMMAND ----------
 
-(spark.readStream 
+run_step("silver spark_churn_users", time.time(), spark.readStream 
         .table("spark_churn_users_bronze")
         .withColumnRenamed("id", "user_id")
         .withColumn("email", sha1(col("email")))
@@ -201,7 +211,7 @@ ingest_folder(f'{volume_folder}/users', 'json',  'spark_churn_users_bronze').awa
         .option("checkpointLocation", f"{volume_folder}/checkpoint_spark/churn_users")
         .option("mergeSchema", "true")
         .trigger(availableNow = True)
-        .table("spark_churn_users").awaitTermination())
+        .table("spark_churn_users"))
 
 # COMMAND ----------
 
@@ -209,7 +219,7 @@ ingest_folder(f'{volume_folder}/users', 'json',  'spark_churn_users_bronze').awa
 
 # COMMAND ----------
 
-(spark.readStream 
+run_step("silver spark_churn_orders", time.time(), spark.readStream 
         .table("spark_churn_orders_bronze")
         .withColumnRenamed("id", "order_id")
         .withColumn("amount", col("amount").cast('int'))
@@ -220,7 +230,7 @@ ingest_folder(f'{volume_folder}/users', 'json',  'spark_churn_users_bronze').awa
         .option("checkpointLocation", f"{volume_folder}/checkpoint_spark/churn_orders")
         .option("mergeSchema", "true")
         .trigger(availableNow = True)
-        .table("spark_churn_orders").awaitTermination())
+        .table("spark_churn_orders"))
 
 # COMMAND ----------
 
@@ -242,8 +252,133 @@ ingest_folder(f'{volume_folder}/users', 'json',  'spark_churn_users_bronze').awa
 
 # COMMAND ----------
 
+# MAGIC %md
+# MAGIC Instead of rebuilding the features from the full orders & events history at each run, we consume the new users, orders and events as a single stream. For each micro-batch:
+# MAGIC
+# MAGIC * the per-user deltas (counts, sums, max dates) are MERGEd in `spark_churn_user_activity`. The distinct sessions are kept as a HyperLogLog sketch (`hll_sketch_agg` / `hll_union`), so that they can be merged too
+# MAGIC * only the users touched by the batch are then MERGEd in `spark_churn_features`
+# MAGIC * the DELETE/UPDATE done on `spark_churn_users` are then propagated to `spark_churn_features` (and the activity of the deleted users is removed)
+# MAGIC
+# MAGIC The first run processes the full history, the next ones only the new data.
+
+# COMMAND ----------
+
+# DBTITLE 1,Incremental features: MERGE the per-user deltas
+import pyspark.sql.functions as F
+import pandas as pd
+
+spark.sql("""CREATE TABLE IF NOT EXISTS spark_churn_user_activity (
+                user_id STRING, platform STRING, event_count BIGINT, sessions BINARY, last_event TIMESTAMP,
+                order_count BIGINT, total_amount BIGINT, total_item BIGINT, last_transaction TIMESTAMP)""")
+
+#Same inner join semantic as the full rebuild: users with at least one order and one event
+features_query = """
+    SELECT u.*, a.order_count, a.total_amount, a.total_item, a.last_transaction,
+           a.platform, a.event_count, hll_sketch_estimate(a.sessions) as session_count, a.last_event,
+           datediff(now(), u.creation_date) as days_since_creation,
+           datediff(now(), u.last_activity_date) as days_since_last_activity,
+           datediff(now(), a.last_event) as days_last_event
+      FROM {touched_users} b
+        INNER JOIN spark_churn_users u USING (user_id)
+        INNER JOIN spark_churn_user_activity a USING (user_id)
+      WHERE a.order_count > 0 AND a.event_count > 0"""
+spark.sql(f"CREATE TABLE IF NOT EXISTS spark_churn_features AS {features_query.format(touched_users='(SELECT user_id FROM spark_churn_users LIMIT 0)')}")
+
+def idempotent_sql(session, app_id, batch_id, query):
+  #foreachBatch is at-least-once: Delta skips the commit when (app_id, batch_id) was already committed, so a replayed batch isn't counted twice
+  session.conf.set("spark.databricks.delta.write.txnAppId", app_id)
+  session.conf.set("spark.databricks.delta.write.txnVersion", str(batch_id))
+  try:
+    session.sql(query)
+  finally:
+    session.conf.unset("spark.databricks.delta.write.txnAppId")
+    session.conf.unset("spark.databricks.delta.write.txnVersion")
+
+features_checkpoint = f"{volume_folder}/checkpoint_spark/churn_features"
+def stream_query_id(checkpoint):
+  #The stream query id is saved in the checkpoint: a new checkpoint (batch ids restarting at 0) gets a new app id, so its batches aren't skipped
+  import json
+  return json.loads(dbutils.fs.head(f"{checkpoint}/metadata"))["id"]
+
+touched_users = []
+def merge_features(batch_df, batch_id):
+  #read by the 2 MERGEs and the touched users count
+  batch_df.persist()
+  batch_df.createOrReplaceTempView("churn_activity_batch")
+  idempotent_sql(batch_df.sparkSession, f"spark_churn_user_activity_merge_{stream_query_id(features_checkpoint)}", batch_id, """
+    MERGE INTO spark_churn_user_activity t USING (
+      SELECT user_id, first(platform, true) as platform,
+             count_if(kind = 'event') as event_count, hll_sketch_agg(session_id) as sessions, max(last_event) as last_event,
+             count_if(kind = 'order') as order_count, coalesce(sum(amount), 0) as total_amount, coalesce(sum(item_count), 0) as total_item, max(last_transaction) as last_transaction
+        FROM churn_activity_batch WHERE user_id IS NOT NULL GROUP BY user_id) s
+    ON t.user_id = s.user_id
+    WHEN MATCHED THEN UPDATE SET
+      platform         = coalesce(t.platform, s.platform),
+      event_count      = t.event_count + s.event_count,
+      sessions         = hll_union(t.sessions, s.sessions),
+      last_event       = greatest(t.last_event, s.last_event),
+      order_count      = t.order_count + s.order_count,
+      total_amount     = t.total_amount + s.total_amount,
+      total_item       = t.total_item + s.total_item,
+      last_transaction = greatest(t.last_transaction, s.last_transaction)
+    WHEN NOT MATCHED THEN INSERT *""")
+  #Recomputed from spark_churn_user_activity: replaying it is idempotent
+  batch_df.sparkSession.sql(f"""
+    MERGE INTO spark_churn_features t USING ({features_query.format(touched_users='(SELECT DISTINCT user_id FROM churn_activity_batch)')}) s
+    ON t.user_id = s.user_id
+    WHEN MATCHED THEN UPDATE SET *
+    WHEN NOT MATCHED THEN INSERT *""")
+  touched_users.append(batch_df.select("user_id").distinct().count())
+  batch_df.unpersist()
+
+#New users also trigger an update: their orders/events might have been received before them
+#skipChangeCommits: ignore the DELETE/UPDATE done on spark_churn_users (see compliance DELETE below)
+users = spark.readStream.option("skipChangeCommits", "true").table("spark_churn_users").select("user_id", F.lit("user").alias("kind"))
+orders = spark.readStream.table("spark_churn_orders").select("user_id", F.lit("order").alias("kind"), "amount", "item_count", F.col("creation_date").alias("last_transaction"))
+events = spark.readStream.table("spark_churn_app_events").select("user_id", F.lit("event").alias("kind"), "platform", "session_id",
+                                                                 F.to_timestamp("date", "MM-dd-yyyy HH:mm:ss").alias("last_event"))
+
+run_step("gold spark_churn_features (incremental MERGE)", time.time(),
+         users.unionByName(orders, allowMissingColumns=True).unionByName(events, allowMissingColumns=True)
+           .writeStream
+             .foreachBatch(merge_features)
+             .option("checkpointLocation", features_checkpoint)
+             .trigger(availableNow = True)
+             .start())
+pipeline_metrics[-1]["users_merged"] = sum(touched_users)
+
+#The users stream skips the DELETE/UPDATE commits of spark_churn_users: propagate them by syncing with the users table (one row per user, not the history)
+#Users in spark_churn_features but not in spark_churn_users anymore have been deleted (e.g. compliance DELETE below): drop their activity too
+spark.sql("""
+    MERGE INTO spark_churn_user_activity t USING (
+      SELECT f.user_id FROM spark_churn_features f LEFT ANTI JOIN spark_churn_users u USING (user_id)) s
+    ON t.user_id = s.user_id
+    WHEN MATCHED THEN DELETE""")
+user_columns = [c for c in spark.table("spark_churn_users").columns if c != "user_id"]
+spark.sql(f"""
+    MERGE INTO spark_churn_features t USING spark_churn_users s
+    ON t.user_id = s.user_id
+    WHEN MATCHED AND NOT ({' AND '.join(f't.{c} <=> s.{c}' for c in user_columns)}) THEN UPDATE SET
+      {', '.join(f'{c} = s.{c}' for c in user_columns)}
+    WHEN NOT MATCHED BY SOURCE THEN DELETE""")
+
+#The days_xxx columns depend on the current date (and on the updated users): refresh them, only when they changed (at most once a day)
 spark.sql("""
-    CREATE OR REPLACE TABLE spark_churn_features AS
+    UPDATE spark_churn_features SET
+      days_since_creation      = datediff(now(), creation_date),
+      days_since_last_activity = datediff(now(), last_activity_date),
+      days_last_event          = datediff(now(), last_event)
+    WHERE NOT (days_since_creation <=> datediff(now(), creation_date))
+       OR NOT (days_since_last_activity <=> datediff(now(), last_activity_date))
+       OR NOT (days_last_event <=> datediff(now(), last_event))""")
+
+display(spark.table("spark_churn_features"))
+
+# COMMAND ----------
+
+# DBTITLE 1,Pipeline report: incremental MERGE vs full rebuild
+#Reference: the previous full rebuild, recomputing the aggregates over the whole history (executed with a noop sink, the table isn't replaced)
+full_rebuild = spark.sql("""
       WITH 
           spark_churn_orders_stats AS (SELECT user_id, count(*) as order_count, sum(amount) as total_amount, sum(item_count) as total_item, max(creation_date) as last_transaction
             FROM spark_churn_orders GROUP BY user_id),  
@@ -257,8 +392,12 @@ spark.sql("""
            FROM spark_churn_users
              INNER JOIN spark_churn_orders_stats using (user_id)
              INNER JOIN spark_churn_app_events_stats using (user_id)""")
-     
-display(spark.table("spark_churn_features"))
+rows = spark.table("spark_churn_users").count() + spark.table("spark_churn_orders").count() + spark.table("spark_churn_app_events").count()
+start = time.time()
+full_rebuild.write.format("noop").mode("overwrite").save()
+pipeline_metrics.append({"step": "gold spark_churn_features (full rebuild, reference)", "rows_processed": rows, "duration_sec": round(time.time() - start, 2)})
+
+display(pd.DataFrame(pipeline_metrics))
 
 # COMMAND ----------
 
@@ -6,6 +6,9 @@
 # COMMAND ----------
 
 dbutils.widgets.dropdown("reset_all_data", "false", ["true", "false"], "Reset all data")
+#distributed: generate the dataset in the executors (no download, no driver round-trip), to size the pipeline with a large number of customers
+dbutils.widgets.dropdown("generation_mode", "driver", ["driver", "distributed"], "Data generation mode")
+dbutils.widgets.text("num_customers", "101333", "Number of customers (distributed mode)")
 
 # COMMAND ----------
 
@@ -29,6 +32,7 @@ assert (major, minor) >= (3, 11), f"This demo expect python version 3.11, but fo
 # COMMAND ----------
 
 reset_all_data = dbutils.widgets.get("reset_all_data") == "true"
+generation_mode = dbutils.widgets.get("generation_mode")
 DBDemos.setup_schema(catalog, db, reset_all_data, volume_name)
 folder = f"/Volumes/{catalog}/{db}/{volume_name}"
 
@@ -60,7 +64,7 @@ def cleanup_folder(path):
 # COMMAND ----------
 
 data_downloaded = False
-if not data_exists:
+if not data_exists and generation_mode == "driver":
     try:
         DBDemos.download_file_from_git(folder+'/events', "databricks-demos", "dbdemos-dataset", "/retail/c360/events")
         DBDemos.download_file_from_git(folder+'/orders', "databricks-demos", "dbdemos-dataset", "/retail/c360/orders")
@@ -69,7 +73,7 @@ if not data_exists:
         data_downloaded = True
     except Exception as e: 
         print(f"Error trying to download the file from the repo: {str(e)}. Will generate the data instead...")    
-else:
+elif data_exists:
     data_downloaded = True
 
 # COMMAND ----------
@@ -82,12 +86,34 @@ from  mlflow.models.signature import ModelSignature
 import cloudpickle
 from unittest import mock
 import numpy as np
+import pandas as pd
 
-# define a custom model
-class ChurnEmptyModel(mlflow.pyfunc.PythonModel):
-    def predict(self, context, model_input):
-        import random
-        return model_input['user_id'].apply(lambda x: random.randint(0, 1)).astype('int32')
+from abc import ABCMeta, abstractmethod
+
+class VectorizedMockModel(mlflow.pyfunc.PythonModel, metaclass=ABCMeta):
+    """Placeholder model: predictions are computed for the whole batch with numpy, seeded on a hash of the key_columns (the same row gets the same prediction, whatever the spark_udf batching)."""
+    key_columns = None #None: hash all the input columns
+
+    def __init__(self, seed=42):
+        self.seed = seed
+
+    def uniform(self, model_input: pd.DataFrame) -> np.ndarray:
+        keys = model_input[self.key_columns] if self.key_columns else model_input
+        h = pd.util.hash_pandas_object(keys, index=False, hash_key=f"{self.seed:016d}"[-16:]).to_numpy()
+        return (h >> np.uint64(11)) / float(1 << 53)
+
+    @abstractmethod
+    def predict_from_uniform(self, model_input: pd.DataFrame, u: np.ndarray) -> pd.Series:
+        """Prediction of each row, from its uniform draw u in [0, 1)"""
+
+    def predict(self, context, model_input: pd.DataFrame) -> pd.Series:
+        return self.predict_from_uniform(model_input, self.uniform(model_input))
+
+# define a custom model randomly flagging 50% of the users as churn
+class ChurnEmptyModel(VectorizedMockModel):
+    key_columns = ['user_id']
+    def predict_from_uniform(self, model_input, u):
+        return pd.Series((u < 0.5).astype('int32'), index=model_input.index)
 
 #Enable Unity Catalog with mlflow registry
 mlflow.set_registry_uri('databricks-uc')
@@ -164,53 +190,55 @@ def get_df(size, month):
   df = df.withColumn("gender", F.round(F.rand()+0.2))
   return df.withColumn("age_group", F.round(F.rand()*10))
 
-df_customers = get_df(133, 12*30).withColumn("creation_date", fake_date_old())
-for i in range(1, 24):
-  df_customers = df_customers.union(get_df(2000+i*200, 24-i))
+if generation_mode == "driver":
+  df_customers = get_df(133, 12*30).withColumn("creation_date", fake_date_old())
+  for i in range(1, 24):
+    df_customers = df_customers.union(get_df(2000+i*200, 24-i))
 
-df_customers = df_customers.cache()
-
-ids = df_customers.select("id").collect()
-ids = [r["id"] for r in ids]
+  df_customers = df_customers.cache()
 
+  ids = df_customers.select("id").collect()
+  ids = [r["id"] for r in ids]
 
 # COMMAND ----------
 
-#Number of order per customer to generate a nicely distributed dataset
-import numpy as np
-np.random.seed(0)
-mu, sigma = 3, 2 # mean and standard deviation
-s = np.random.normal(mu, sigma, int(len(ids)))
-s = [i if i > 0 else 0 for i in s]
-
-#Most of our customers have ~3 orders
-import matplotlib.pyplot as plt
-count, bins, ignored = plt.hist(s, 30, density=False)
-plt.show()
-s = [int(i) for i in s]
-
-order_user_ids = list()
-action_user_ids = list()
-for i, id in enumerate(ids):
-  for j in range(1, s[i]):
-    order_user_ids.append(id)
-    #Let's make 5 more actions per order (5 click on the website to buy something)
-    for j in range(1, 5):
-      action_user_ids.append(id)
-
-print(f"Generated {len(order_user_ids)} orders and  {len(action_user_ids)} actions for {len(ids)} users")
+if generation_mode == "driver":
+  #Number of order per customer to generate a nicely distributed dataset
+  import numpy as np
+  np.random.seed(0)
+  mu, sigma = 3, 2 # mean and standard deviation
+  s = np.random.normal(mu, sigma, int(len(ids)))
+  s = [i if i > 0 else 0 for i in s]
+
+  #Most of our customers have ~3 orders
+  import matplotlib.pyplot as plt
+  count, bins, ignored = plt.hist(s, 30, density=False)
+  plt.show()
+  s = [int(i) for i in s]
+
+  order_user_ids = list()
+  action_user_ids = list()
+  for i, id in enumerate(ids):
+    for j in range(1, s[i]):
+      order_user_ids.append(id)
+      #Let's make 5 more actions per order (5 click on the website to buy something)
+      for j in range(1, 5):
+        action_user_ids.append(id)
+
+  print(f"Generated {len(order_user_ids)} orders and  {len(action_user_ids)} actions for {len(ids)} users")
 
 # COMMAND ----------
 
 # DBTITLE 1,order data
-orders = spark.createDataFrame([(i,) for i in order_user_ids], ['user_id'])
-orders = orders.withColumn("id", fake_id())
-orders = orders.withColumn("transaction_date", fake_date())
-orders = orders.withColumn("item_count", F.round(F.rand()*2)+1)
-orders = orders.withColumn("amount", F.col("item_count")*F.round(F.rand()*30+10))
-orders = orders.cache()
-orders.repartition(10).write.format("json").mode("overwrite").save(folder+"/orders")
-cleanup_folder(folder+"/orders")  
+if generation_mode == "driver":
+  orders = spark.createDataFrame([(i,) for i in order_user_ids], ['user_id'])
+  orders = orders.withColumn("id", fake_id())
+  orders = orders.withColumn("transaction_date", fake_date())
+  orders = orders.withColumn("item_count", F.round(F.rand()*2)+1)
+  orders = orders.withColumn("amount", F.col("item_count")*F.round(F.rand()*30+10))
+  orders = orders.cache()
+  orders.repartition(10).write.format("json").mode("overwrite").save(folder+"/orders")
+  cleanup_folder(folder+"/orders")  
 
 # COMMAND ----------
 
@@ -226,16 +254,111 @@ fake_action = F.udf(lambda:fake.random_elements(elements=action_type, length=1)[
 fake_uri = F.udf(lambda:re.sub(r'https?:\/\/.*?\/', "https://databricks.com/", fake.uri()))
 
 
-actions = spark.createDataFrame([(i,) for i in order_user_ids], ['user_id']).repartition(20)
-actions = actions.withColumn("event_id", fake_id())
-actions = actions.withColumn("platform", fake_platform())
-actions = actions.withColumn("date", fake_date())
-actions = actions.withColumn("action", fake_action())
-actions = actions.withColumn("session_id", fake_id())
-actions = actions.withColumn("url", fake_uri())
-actions = actions.cache()
-actions.write.format("csv").option("header", True).mode("overwrite").save(folder+"/events")
-cleanup_folder(folder+"/events")  
+if generation_mode == "driver":
+  actions = spark.createDataFrame([(i,) for i in order_user_ids], ['user_id']).repartition(20)
+  actions = actions.withColumn("event_id", fake_id())
+  actions = actions.withColumn("platform", fake_platform())
+  actions = actions.withColumn("date", fake_date())
+  actions = actions.withColumn("action", fake_action())
+  actions = actions.withColumn("session_id", fake_id())
+  actions = actions.withColumn("url", fake_uri())
+  actions = actions.cache()
+  actions.write.format("csv").option("header", True).mode("overwrite").save(folder+"/events")
+  cleanup_folder(folder+"/events")  
+
+# COMMAND ----------
+
+# DBTITLE 1,Distributed generation: customers, orders & actions
+#Same dataset generated without any row-wise UDF nor driver round-trip: customers are split in the same monthly cohorts as get_df (scaled to num_customers),
+#and the orders / actions of each customer are expanded in the executors from a seeded normal draw.
+import numpy as np
+import pandas as pd
+
+def fake_pool(fake_fn, pool_size=10000):
+  #Faker is only called to build a pool of values, sampled per Arrow batch
+  pool = np.array([fake_fn() for _ in range(pool_size)], dtype=object)
+  @F.pandas_udf("string")
+  def sample_pool(batch: pd.Series) -> pd.Series:
+    return pd.Series(pool[np.random.randint(0, len(pool), len(batch))])
+  return sample_pool.asNondeterministic()
+
+def seeded_id(key, salt, seed):
+  #uuid-like id derived from the row key, null for 2% of the rows like fake_id
+  h = F.sha2(F.concat_ws("-", F.lit(salt), key.cast("string")), 256)
+  return F.when(F.rand(seed) < 0.98, F.concat_ws("-", h.substr(1, 8), h.substr(9, 4), h.substr(13, 4), h.substr(17, 4), h.substr(21, 12)))
+
+def weighted_choice(weights, seed):
+  #Same (normalized) weights as fake.random_elements
+  draw, threshold, choice = F.rand(seed) * sum(weights.values()), 0, None
+  for value, weight in weights.items():
+    threshold += weight
+    if value is not None:
+      choice = choice.when(draw < threshold, value) if choice is not None else F.when(draw < threshold, value)
+  return choice
+
+def random_date(start, end, seed):
+  return F.date_format(F.timestamp_seconds(F.lit(start.timestamp()) + F.rand(seed) * (end - start).total_seconds()), "MM-dd-yyyy HH:mm:ss")
+
+def generate_customers(num_customers, seed=0):
+  #Cohort i has the size of get_df(2000+i*200, 24-i), cohort 0 is the old customers created between 2012 and 2015
+  sizes = np.array([133] + [2000+i*200 for i in range(1, 24)])
+  boundaries = (np.cumsum(sizes) * num_customers / sizes.sum()).astype(int)[:-1]
+  cohort = sum((F.col("id") >= int(b)).cast("int") for b in boundaries)
+  now = datetime.now()
+  month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+  cohort_start = F.lit(now.timestamp()) - (24 - F.col("cohort")) * 30 * 24 * 3600
+  creation_date = F.when(F.col("cohort") == 0, random_date(datetime(2012, 1, 1), datetime(2015, 12, 31), seed)) \
+                   .otherwise(F.date_format(F.timestamp_seconds(cohort_start + F.rand(seed+1) * 30 * 24 * 3600), "MM-dd-yyyy HH:mm:ss"))
+  return (spark.range(num_customers).withColumn("cohort", cohort)
+            .withColumn("customer_key", F.col("id"))
+            .withColumn("id", seeded_id(F.col("customer_key"), "customer", seed+2))
+            .withColumn("firstname", fake_pool(fake.first_name)(F.col("customer_key")))
+            .withColumn("lastname", fake_pool(fake.last_name)(F.col("customer_key")))
+            .withColumn("email", fake_pool(fake.ascii_company_email)(F.col("customer_key")))
+            .withColumn("address", fake_pool(fake.address)(F.col("customer_key")))
+            .withColumn("canal", weighted_choice(canal, seed+3))
+            .withColumn("country", F.element_at(F.array(*[F.lit(c) for c in countries]), (F.rand(seed+4) * len(countries)).cast("int") + 1))
+            .withColumn("creation_date", creation_date)
+            .withColumn("last_activity_date", random_date(month_start, now, seed+5))
+            .withColumn("gender", F.round(F.rand(seed+6)+0.2))
+            .withColumn("age_group", F.round(F.rand(seed+7)*10))
+            #Most of our customers have ~3 orders: same normal(3, 2) draw as the driver generation, range(1, s) gives s-1 orders
+            .withColumn("order_count", F.greatest(F.floor(F.randn(seed+8)*2+3).cast("int")-1, F.lit(0))))
+
+#The driver generation creates one website action per order
+actions_per_order = 1
+
+if generation_mode == "distributed":
+  num_customers = int(dbutils.widgets.get("num_customers"))
+  now = datetime.now()
+  month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+  customers = generate_customers(num_customers).repartition(max(10, num_customers // 100000)).cache()
+  df_customers = customers.drop("cohort", "customer_key", "order_count")
+
+  #sequence(1, 0) is [1, 0] (step -1), not empty: filter the customers without order so they have no order/action row
+  orders = (customers.where("order_count > 0")
+                     .select(F.col("customer_key"), F.col("id").alias("user_id"), F.explode(F.sequence(F.lit(1), F.col("order_count"))).alias("order_index"))
+                     .withColumn("id", seeded_id(F.col("customer_key") * 1000 + F.col("order_index"), "order", 10))
+                     .withColumn("transaction_date", random_date(month_start, now, 11))
+                     .withColumn("item_count", F.round(F.rand(12)*2)+1)
+                     .withColumn("amount", F.col("item_count")*F.round(F.rand(13)*30+10))
+                     .drop("customer_key"))
+  orders.drop("order_index").write.format("json").mode("overwrite").save(folder+"/orders")
+  cleanup_folder(folder+"/orders")
+
+  actions = (orders.select("user_id", "id", F.explode(F.sequence(F.lit(1), F.lit(actions_per_order))).alias("action_index"))
+                   .withColumn("event_id", seeded_id(F.concat_ws("-", F.col("id"), F.col("action_index")), "event", 20))
+                   .withColumn("platform", weighted_choice(platform, 21))
+                   .withColumn("date", random_date(month_start, now, 22))
+                   .withColumn("action", weighted_choice(action_type, 23))
+                   .withColumn("session_id", seeded_id(F.concat_ws("-", F.col("id"), F.col("action_index")), "session", 24))
+                   .withColumn("url", F.concat(F.lit("https://databricks.com/"), fake_pool(lambda: re.sub(r'https?:\/\/.*?\/', "", fake.uri()))(F.col("user_id"))))
+                   .drop("id", "action_index"))
+  actions.write.format("csv").option("header", True).mode("overwrite").save(folder+"/events")
+  cleanup_folder(folder+"/events")
+  #Read back what was written instead of caching tens of millions of rows: the churn is computed on the exact same orders / actions
+  orders = spark.read.json(folder+"/orders")
+  actions = spark.read.option("header", True).csv(folder+"/events")
 
 # COMMAND ----------
 
@@ -0,0 +1,47 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC # Bootstrap model scoring benchmark
+# MAGIC
+# MAGIC Until the real churn model is trained, the DLT pipeline scores `churn_features` with the `ChurnEmptyModel` registered by `01-load-data`. This notebook measures the cost of calling it through `mlflow.pyfunc.spark_udf`, with `env_manager='local'` (driver python env) and `env_manager='virtualenv'` (as in the pipeline), against a native spark column.
+
+# COMMAND ----------
+
+# MAGIC %pip install mlflow==2.22.0 cloudpickle==3.0.0 numpy==1.26.4 pandas==2.2.3
+# MAGIC dbutils.library.restartPython()
+
+# COMMAND ----------
+
+dbutils.widgets.text("scale", "10", "Duplicate churn_features N times")
+
+# COMMAND ----------
+
+# MAGIC %run ./00-setup $reset_all_data=false
+
+# COMMAND ----------
+
+import time
+import mlflow
+import pandas as pd
+import pyspark.sql.functions as F
+
+def benchmark_spark_udf(model_uri, df, result_type, env_managers=("local", "virtualenv")):
+  """Time the model called with spark_udf for each env_manager against a native spark column, to measure the spark_udf overhead itself (noop sink, nothing is written)."""
+  def run(name, prediction):
+    start = time.time()
+    df.withColumn("prediction", prediction).write.format("noop").mode("overwrite").save()
+    return {"predictor": name, "seconds": round(time.time() - start, 2)}
+  results = [run("native spark (baseline)", F.rand(42))]
+  for env_manager in env_managers:
+    predict_udf = mlflow.pyfunc.spark_udf(spark, model_uri, result_type=result_type, env_manager=env_manager)
+    results.append(run(f"spark_udf env_manager={env_manager}", predict_udf(*predict_udf.metadata.get_input_schema().input_names())))
+  rows = df.count()
+  return pd.DataFrame([{**r, "rows_per_sec": int(rows / r["seconds"]) if r["seconds"] else None} for r in results])
+
+scale = int(dbutils.widgets.get("scale"))
+mlflow.set_registry_uri('databricks-uc')
+model_uri = f"models:/{catalog}.{db}.dbdemos_customer_churn@prod"
+#Duplicate the features to get a volume close to a production table
+features = spark.table("churn_features").crossJoin(spark.range(scale).withColumnRenamed("id", "_copy")).drop("_copy").cache()
+print(f"Scoring {features.count()} rows")
+
+display(benchmark_spark_udf(model_uri, features, result_type="long"))
@@ -53,6 +53,14 @@
       "title":  "Dbsql data", 
       "description": "Prep data for dbsql dashboard."
     },
+    {
+      "path": "_resources/02-mock-model-benchmark", 
+      "pre_run": False, 
+      "publish_on_website": False, 
+      "add_cluster_setup_cell": False,
+      "title":  "Bootstrap model benchmark", 
+      "description": "Measure the spark_udf overhead of the bootstrap churn model."
+    },
     {
       "path": "config", 
       "pre_run": False, 
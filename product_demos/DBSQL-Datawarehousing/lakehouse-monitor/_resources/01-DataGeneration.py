@@ -40,6 +40,50 @@ if data_exists:
 
 # COMMAND ----------
 
+# DBTITLE 1,Generation mode
+# "faker" generates the transactions row by row (default, fine for the demo volume)
+# "numpy" draws each day's users, products, quantities and timestamps as whole arrays (use it for large volumes)
+# "spark" generates users, products and transactions inside the executors: nothing is materialized on the driver
+dbutils.widgets.dropdown("generation_mode", "faker", ["faker", "numpy", "spark"], "Data generation mode")
+generation_mode = dbutils.widgets.get("generation_mode")
+
+# COMMAND ----------
+
+# DBTITLE 1,Spark-native generation helpers (generation_mode = spark)
+import pyspark.sql.functions as F
+from pyspark.sql.types import StructType, StructField, LongType
+
+def seeded_uuid(prefix, id_col, seed=42):
+    """uuid-formatted identifier derived from a row index with native functions, so that users/products ids can be recomputed from their index when generating the transactions."""
+    h = F.sha2(F.concat_ws("-", F.lit(prefix), F.lit(str(seed)), id_col.cast("string")), 256)
+    return F.concat_ws("-", h.substr(1, 8), h.substr(9, 4), F.concat(F.lit("4"), h.substr(14, 3)), F.concat(F.lit("8"), h.substr(18, 3)), h.substr(21, 12))
+
+def generate_in_executors(num_rows, generate_pdf, schema, id_col, prefix, seed=42, num_partitions=None):
+    """Call generate_pdf(num_rows, fake, rand) on each batch of spark.range(num_rows) inside the executors.
+    Faker and random are seeded from the batch first id, so the output is deterministic and generation scales with the cluster cores.
+    The id_col column is replaced by seeded_uuid(prefix, id)."""
+    out_schema = StructType([StructField("id", LongType(), False)] + [f for f in schema.fields if f.name != id_col])
+
+    def generate_batches(batches):
+        import random
+        from faker import Faker
+        for batch in batches:
+            if len(batch) == 0:
+                continue
+            batch_seed = hash((seed, int(batch["id"].iloc[0]))) & 0xFFFFFFFF
+            fake = Faker()
+            fake.seed_instance(batch_seed)
+            pdf = generate_pdf(len(batch), fake, random.Random(batch_seed))
+            pdf["id"] = batch["id"].to_numpy()
+            yield pdf[out_schema.fieldNames()]
+
+    ids = spark.range(0, num_rows, numPartitions=num_partitions) if num_partitions else spark.range(num_rows)
+    return (ids.mapInPandas(generate_batches, out_schema)
+               .withColumn(id_col, seeded_uuid(prefix, F.col("id"), seed))
+               .select(schema.fieldNames()))
+
+# COMMAND ----------
+
 # MAGIC %md
 # MAGIC ### Genearate the user table
 # MAGIC
@@ -81,7 +125,7 @@ if not data_exists:
     fake = Faker()
 
     # Function to generate user data
-    def generate_user_data(num_rows=10000):
+    def generate_user_data(num_rows=10000, fake=fake, rand=random):
         user_data = []
         
         for _ in range(num_rows):
@@ -92,7 +136,7 @@ if not data_exists:
                 "PasswordHash": fake.sha256(),
                 "FullName": fake.name(),
                 "DateOfBirth": fake.date_of_birth(minimum_age=18, maximum_age=90),
-                "Gender": random.choice(["Male", "Female", "Other"]),
+                "Gender": rand.choice(["Male", "Female", "Other"]),
                 "PhoneNumber": fake.phone_number(),
                 "Address": fake.address(),
                 "City": fake.city(),
@@ -101,21 +145,18 @@ if not data_exists:
                 "PostalCode": fake.postcode(),
                 "RegistrationDate": fake.date_this_decade(),
                 "LastLoginDate": fake.date_time_between(start_date="-1y", end_date="now"),
-                "AccountStatus": random.choice(["Active", "Suspended", "Inactive"]),
-                "UserRole": random.choice(["Customer", "Admin"]),
-                "PreferredPaymentMethod": random.choice(["Credit Card", "Debit Card", "PayPal", "Bank Transfer"]),
-                "TotalPurchaseAmount": round(random.uniform(0, 10000), 2),
-                "NewsletterSubscription": random.choice([True, False]),
-                "Wishlist": [fake.uuid4() for _ in range(random.randint(0, 10))],
-                "CartItems": [fake.uuid4() for _ in range(random.randint(0, 5))]
+                "AccountStatus": rand.choice(["Active", "Suspended", "Inactive"]),
+                "UserRole": rand.choice(["Customer", "Admin"]),
+                "PreferredPaymentMethod": rand.choice(["Credit Card", "Debit Card", "PayPal", "Bank Transfer"]),
+                "TotalPurchaseAmount": round(rand.uniform(0, 10000), 2),
+                "NewsletterSubscription": rand.choice([True, False]),
+                "Wishlist": [fake.uuid4() for _ in range(rand.randint(0, 10))],
+                "CartItems": [fake.uuid4() for _ in range(rand.randint(0, 5))]
             }
             user_data.append(user)
         
         return pd.DataFrame(user_data)
 
-    # Generate the user data
-    user_pdf = generate_user_data(10000)
-
     # Convert the Pandas DataFrame to a PySpark DataFrame
     schema = StructType([
         StructField("UserID", StringType(), False),
@@ -142,8 +183,15 @@ if not data_exists:
         StructField("CartItems", ArrayType(StringType()), False)
     ])
 
-    # Create Spark DataFrame and Write to Delta
-    user_df = spark.createDataFrame(user_pdf, schema)
+    if generation_mode == "spark":
+        # Generate the user data in the executors, UserID is derived from the user index
+        user_df = generate_in_executors(10000, generate_user_data, schema, "UserID", "user")
+    else:
+        # Generate the user data
+        user_pdf = generate_user_data(10000)
+
+        # Create Spark DataFrame
+        user_df = spark.createDataFrame(user_pdf, schema)
 
     # Write the Spark DataFrame to Delta format
     user_df.write.mode('overwrite').saveAsTable('bronze_user')
@@ -289,42 +337,43 @@ if not data_exists:
     }
 
     # Function to generate product data
-    def generate_product_data(num_rows=10000):
+    def generate_product_data(num_rows=10000, fake=fake, rand=random):
         product_data = []
         
         for _ in range(num_rows):
-            category = random.choice(list(subcategories.keys()))
+            category = rand.choice(list(subcategories.keys()))
             product = {
                 "ProductID": fake.uuid4(),
-                "ProductName": random.choice(product_names[category]),
+                "ProductName": rand.choice(product_names[category]),
                 "Category": category,
-                "SubCategory": random.choice(subcategories[category]),
-                "Brand": random.choice(brands),
-                "Description": random.choice(descriptions[category]),
-                "Price": round(random.uniform(5, 2000), 2),
-                "Discount": round(random.uniform(0, 0.5), 2),  # Discount as a fraction
-                "StockQuantity": random.randint(0, 1000),
+                "SubCategory": rand.choice(subcategories[category]),
+                "Brand": rand.choice(brands),
+                "Description": rand.choice(descriptions[category]),
+                "Price": round(rand.uniform(5, 2000), 2),
+                "Discount": round(rand.uniform(0, 0.5), 2),  # Discount as a fraction
+                "StockQuantity": rand.randint(0, 1000),
                 "SKU": fake.bothify(text='???-########'),
                 "ProductImageURL": fake.image_url(),
-                "ProductRating": round(random.uniform(1, 5), 1),
-                "NumberOfReviews": random.randint(0, 5000),
+                "ProductRating": round(rand.uniform(1, 5), 1),
+                "NumberOfReviews": rand.randint(0, 5000),
                 "SupplierID": fake.uuid4(),
                 "DateAdded": fake.date_this_decade(),
-                "Dimensions": f"{random.uniform(1, 100):.2f} x {random.uniform(1, 100):.2f} x {random.uniform(1, 100):.2f}",
-                "Weight": round(random.uniform(0.1, 50), 2),
+                "Dimensions": f"{rand.uniform(1, 100):.2f} x {rand.uniform(1, 100):.2f} x {rand.uniform(1, 100):.2f}",
+                "Weight": round(rand.uniform(0.1, 50), 2),
                 "Color": fake.color_name(),
-                "Material": random.choice(["Plastic", "Metal", "Wood", "Glass", "Fabric"]),
-                "WarrantyPeriod": f"{random.randint(1, 24)} months",
-                "ReturnPolicy": random.choice(["30 days", "60 days", "No returns"]),
-                "ShippingCost": round(random.uniform(0, 50), 2),
-                "ProductTags": [fake.word() for _ in range(random.randint(1, 5))]
+                "Material": rand.choice(["Plastic", "Metal", "Wood", "Glass", "Fabric"]),
+                "WarrantyPeriod": f"{rand.randint(1, 24)} months",
+                "ReturnPolicy": rand.choice(["30 days", "60 days", "No returns"]),
+                "ShippingCost": round(rand.uniform(0, 50), 2),
+                "ProductTags": [fake.word() for _ in range(rand.randint(1, 5))]
             }
             product_data.append(product)
         
         return pd.DataFrame(product_data)
 
-    # Generate the product data
-    product_pdf = generate_product_data(10000)
+    # Generate the product data (generated in the executors in spark mode, see below)
+    if generation_mode != "spark":
+        product_pdf = generate_product_data(10000)
 
 # COMMAND ----------
 
@@ -358,7 +407,10 @@ if not data_exists:
     ])
 
     # Create Spark DataFrame & Write to Delta
-    product_df = spark.createDataFrame(product_pdf, schema)
+    if generation_mode == "spark":
+        product_df = generate_in_executors(10000, generate_product_data, schema, "ProductID", "product")
+    else:
+        product_df = spark.createDataFrame(product_pdf, schema)
     product_df.write.mode('overwrite').saveAsTable('bronze_product')
 
 # COMMAND ----------
@@ -388,88 +440,204 @@ if not data_exists:
 # MAGIC - Seasonality: Different seasons have different base transaction volumes.
 # MAGIC - Weekday/Weekend: Weekend transaction volumes are higher than weekdays.
 # MAGIC - Marketing Campaigns: Specific days can have higher transaction volumes due to marketing campaigns.
+# MAGIC
+# MAGIC With `generation_mode = numpy`, the same factors are applied but all the transactions of the range are drawn at once as NumPy arrays (users and products are picked by index), which scales to millions of rows. See `02-DataGeneration-benchmark` for the rows/sec comparison.
 
 # COMMAND ----------
 
-if not data_exists:
+# DBTITLE 1,Vectorized (NumPy) transaction generator
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+
+# Seasonality factors, shared by the faker and numpy generators
+seasonality_factors = {
+    "winter": 1.6,
+    "spring": 1.1,
+    "summer": 1.2,
+    "autumn": 1.4
+}
+
+def daily_transaction_counts(start_date_, end_date_, campaigns={}, base_daily_transactions=100, rng=None):
+    """Number of transactions for each day of the range, with the seasonality, weekday/weekend and campaign factors."""
+    rng = rng if rng is not None else np.random.default_rng()
+    days = pd.date_range(start_date_, end_date_, freq="D")
+    month = days.month.to_numpy()
+    seasonality_factor = np.select(
+        [np.isin(month, [12, 1]), np.isin(month, [2, 3, 4, 5]), np.isin(month, [6, 7, 8])],
+        [seasonality_factors["winter"], seasonality_factors["spring"], seasonality_factors["summer"]],
+        default=seasonality_factors["autumn"])
+    day_factor = np.where(days.weekday.to_numpy() < 5, 1.0, 1.3)
+    campaign_factor = np.array([campaigns.get(d, 1.0) for d in days.strftime("%Y-%m-%d")])
+    base_transactions = (base_daily_transactions * day_factor * seasonality_factor * campaign_factor).astype(np.int64)
+    # Apply a random multiplier to introduce variability
+    daily_transactions = (base_transactions * rng.uniform(0.9, 1.1, len(days))).astype(np.int64)
+    return days, daily_transactions
+
+def random_uuid4(rng, n):
+    """Generate n random uuid4 strings without a python call per row."""
+    raw = rng.integers(0, 256, size=(n, 16), dtype=np.uint8)
+    raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40  # version 4
+    raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80  # RFC 4122 variant
+    hex_chars = np.frombuffer(b"0123456789abcdef", dtype=np.uint8)
+    digits = np.empty((n, 32), dtype=np.uint8)
+    digits[:, 0::2] = hex_chars[raw >> 4]
+    digits[:, 1::2] = hex_chars[raw & 0x0F]
+    dash = np.full((n, 1), ord("-"), dtype=np.uint8)
+    uuids = np.hstack([digits[:, :8], dash, digits[:, 8:12], dash, digits[:, 12:16], dash, digits[:, 16:20], dash, digits[:, 20:]])
+    return np.ascontiguousarray(uuids).view("S36").ravel().astype(str)
+
+def generate_transaction_data_numpy(user_pdf_, product_pdf_, start_date_, end_date_, campaigns={}, base_daily_transactions=100, seed=None, instructions_pool_size=1000):
+    """Same output as generate_transaction_data, but every column is drawn as an array for the whole date range."""
+    from faker import Faker
+    rng = np.random.default_rng(seed)
+    days, daily_transactions = daily_transaction_counts(start_date_, end_date_, campaigns, base_daily_transactions, rng)
+    n = int(daily_transactions.sum())
+
+    # Pick users & products by index and join their attributes with a fancy indexing
+    user_idx = rng.integers(0, len(user_pdf_), n)
+    product_idx = rng.integers(0, len(product_pdf_), n)
+    price = product_pdf_["Price"].to_numpy(dtype=np.float64)[product_idx]
+    quantity = rng.integers(1, 6, n)
+    total = price * quantity
+
+    # Random timestamp within each transaction's day
+    day_start = np.repeat(days.to_numpy(), daily_transactions)
+    transaction_date = day_start + rng.integers(0, 86_400_000_000, n).astype("timedelta64[us]")
+
+    # Faker is only called to build a small pool of sentences, then sampled by index
+    fake = Faker()
+    Faker.seed(seed)
+    instructions_pool = np.array([fake.sentence() for _ in range(instructions_pool_size)])
+    special_instructions = np.where(rng.random(n) < 0.5, instructions_pool[rng.integers(0, instructions_pool_size, n)], "")
+
+    return pd.DataFrame({
+        "TransactionID": random_uuid4(rng, n),
+        "UserID": user_pdf_["UserID"].to_numpy()[user_idx],
+        "ProductID": product_pdf_["ProductID"].to_numpy()[product_idx],
+        "TransactionDate": transaction_date,
+        "Quantity": quantity.astype(np.int32),
+        "UnitPrice": price,
+        "TotalPrice": np.round(total, 2),
+        "PaymentMethod": rng.choice(["Credit Card", "Debit Card", "PayPal", "Bank Transfer"], n),
+        "ShippingAddress": user_pdf_["Address"].to_numpy()[user_idx],
+        "LoyaltyPointsEarned": np.rint(total * 0.1).astype(np.int32),  # Example: 10% of the total price in loyalty points
+        "GiftWrap": rng.choice(["yes", "no"], n),
+        "SpecialInstructions": special_instructions
+    })
 
-    from datetime import datetime, timedelta
+# COMMAND ----------
 
-    # Initialize Faker
-    fake = Faker()
+import random
+from datetime import datetime, timedelta
+from faker import Faker
 
-    # Function to generate transaction data
-    def generate_transaction_data(user_pdf_, product_pdf_, start_date_, end_date_, campaigns={}):
-        transaction_data = []
+# Initialize Faker
+fake = Faker()
+
+# Function to generate transaction data
+def generate_transaction_data(user_pdf_, product_pdf_, start_date_, end_date_, campaigns={}):
+    transaction_data = []
+    
+    # Convert date strings to datetime objects
+    start_date = datetime.strptime(start_date_, "%Y-%m-%d")
+    end_date = datetime.strptime(end_date_, "%Y-%m-%d")
+    
+    # Iterate over each date in the range
+    current_date = start_date
+    while current_date <= end_date:
+        # Determine seasonality factor based on month
+        month = current_date.month
+        if month in [12, 1]:
+            seasonality_factor = seasonality_factors["winter"]
+        elif month in [2, 3, 4, 5]:
+            seasonality_factor = seasonality_factors["spring"]
+        elif month in [6, 7, 8]:
+            seasonality_factor = seasonality_factors["summer"]
+        else:
+            seasonality_factor = seasonality_factors["autumn"]
+        
+        # Determine weekday/weekend factor
+        if current_date.weekday() < 5:  # Weekday
+            day_factor = 1.0
+        else:  # Weekend
+            day_factor = 1.3
         
-        # Convert date strings to datetime objects
-        start_date = datetime.strptime(start_date_, "%Y-%m-%d")
-        end_date = datetime.strptime(end_date_, "%Y-%m-%d")
+        # Determine marketing campaign factor
+        campaign_factor = campaigns.get(current_date.strftime("%Y-%m-%d"), 1.0)
         
-        # Define seasonality factors
-        seasonality_factors = {
-            "winter": 1.6,
-            "spring": 1.1,
-            "summer": 1.2,
-            "autumn": 1.4
-        }
+        # Calculate the base number of transactions for the day
+        base_transactions = int(100 * day_factor * seasonality_factor * campaign_factor)
         
-        # Iterate over each date in the range
-        current_date = start_date
-        while current_date <= end_date:
-            # Determine seasonality factor based on month
-            month = current_date.month
-            if month in [12, 1]:
-                seasonality_factor = seasonality_factors["winter"]
-            elif month in [2, 3, 4, 5]:
-                seasonality_factor = seasonality_factors["spring"]
-            elif month in [6, 7, 8]:
-                seasonality_factor = seasonality_factors["summer"]
-            else:
-                seasonality_factor = seasonality_factors["autumn"]
-            
-            # Determine weekday/weekend factor
-            if current_date.weekday() < 5:  # Weekday
-                day_factor = 1.0
-            else:  # Weekend
-                day_factor = 1.3
-            
-            # Determine marketing campaign factor
-            campaign_factor = campaigns.get(current_date.strftime("%Y-%m-%d"), 1.0)
-            
-            # Calculate the base number of transactions for the day
-            base_transactions = int(100 * day_factor * seasonality_factor * campaign_factor)
-            
-            # Apply a random multiplier to introduce variability
-            random_multiplier = random.uniform(0.9, 1.1)  # Adjust the range for desired variability
-            daily_transactions = int(base_transactions * random_multiplier)
-            
-            # Generate transactions for the day
-            for _ in range(daily_transactions):
-                user = user_pdf_.sample(1).iloc[0]
-                product = product_pdf_.sample(1).iloc[0]
-                quantity = random.randint(1, 5)
-                transaction = {
-                    "TransactionID": fake.uuid4(),
-                    "UserID": user["UserID"],
-                    "ProductID": product["ProductID"],
-                    "TransactionDate": fake.date_time_between(start_date=current_date, end_date=current_date + timedelta(days=1)),
-                    "Quantity": quantity,
-                    "UnitPrice": product["Price"],
-                    "TotalPrice": round(product["Price"] * quantity, 2),
-                    "PaymentMethod": random.choice(["Credit Card", "Debit Card", "PayPal", "Bank Transfer"]),
-                    "ShippingAddress": user["Address"],
-                    "LoyaltyPointsEarned": int(round(product["Price"] * quantity * 0.1)),  # Example: 10% of the total price in loyalty points
-                    "GiftWrap": random.choice(["yes", "no"]),
-                    "SpecialInstructions": fake.sentence() if random.choice([True, False]) else ""
-                }
-                transaction_data.append(transaction)
-            
-            # Move to the next day
-            current_date += timedelta(days=1)
+        # Apply a random multiplier to introduce variability
+        random_multiplier = random.uniform(0.9, 1.1)  # Adjust the range for desired variability
+        daily_transactions = int(base_transactions * random_multiplier)
         
-        return pd.DataFrame(transaction_data)
+        # Generate transactions for the day
+        for _ in range(daily_transactions):
+            user = user_pdf_.sample(1).iloc[0]
+            product = product_pdf_.sample(1).iloc[0]
+            quantity = random.randint(1, 5)
+            transaction = {
+                "TransactionID": fake.uuid4(),
+                "UserID": user["UserID"],
+                "ProductID": product["ProductID"],
+                "TransactionDate": fake.date_time_between(start_date=current_date, end_date=current_date + timedelta(days=1)),
+                "Quantity": quantity,
+                "UnitPrice": product["Price"],
+                "TotalPrice": round(product["Price"] * quantity, 2),
+                "PaymentMethod": random.choice(["Credit Card", "Debit Card", "PayPal", "Bank Transfer"]),
+                "ShippingAddress": user["Address"],
+                "LoyaltyPointsEarned": int(round(product["Price"] * quantity * 0.1)),  # Example: 10% of the total price in loyalty points
+                "GiftWrap": random.choice(["yes", "no"]),
+                "SpecialInstructions": fake.sentence() if random.choice([True, False]) else ""
+            }
+            transaction_data.append(transaction)
+        
+        # Move to the next day
+        current_date += timedelta(days=1)
+    
+    return pd.DataFrame(transaction_data)
+
+# Function to generate the transaction data in the executors (generation_mode = spark)
+def generate_transaction_data_spark(user_df_, product_df_, num_users, num_products, start_date_, end_date_, campaigns={}, base_daily_transactions=100, seed=42, instructions_pool_size=200, broadcast_max_rows=1000000):
+    # The daily volumes are computed on the driver (one value per day), the transactions themselves are generated with native functions
+    days, daily_transactions = daily_transaction_counts(start_date_, end_date_, campaigns, base_daily_transactions, np.random.default_rng(seed))
+    day_ends = np.cumsum(daily_transactions)
+    days_df = spark.createDataFrame([(int(end - count), int(end), d.to_pydatetime()) for d, count, end in zip(days, daily_transactions, day_ends)],
+                                    "day_start_id long, day_end_id long, day timestamp")
 
+    fake = Faker()
+    Faker.seed(seed)
+    instructions_pool = F.array(*[F.lit(fake.sentence()) for _ in range(instructions_pool_size)])
+    def pick(values, col_seed):
+        return F.element_at(F.array(*[F.lit(v) for v in values]), (F.rand(seed + col_seed) * len(values)).cast("int") + 1)
+    def dimension(df, num_rows):
+        # A broadcast goes through the driver: only force it for the small dimensions, the large ones use a regular (shuffle) join
+        return F.broadcast(df) if num_rows <= broadcast_max_rows else df
+
+    # Users & products are referenced by their index: the ids are recomputed with seeded_uuid, the other attributes come from a join
+    transactions = (spark.range(int(day_ends[-1]))
+        .join(F.broadcast(days_df), (F.col("id") >= F.col("day_start_id")) & (F.col("id") < F.col("day_end_id")))
+        .withColumn("TransactionID", seeded_uuid("transaction", F.col("id"), seed))
+        .withColumn("UserID", seeded_uuid("user", (F.rand(seed + 1) * num_users).cast("long"), seed))
+        .withColumn("ProductID", seeded_uuid("product", (F.rand(seed + 2) * num_products).cast("long"), seed))
+        .withColumn("TransactionDate", (F.col("day").cast("double") + F.rand(seed + 3) * 86400).cast("timestamp"))
+        .withColumn("Quantity", (F.rand(seed + 4) * 5).cast("int") + 1)
+        .withColumn("PaymentMethod", pick(["Credit Card", "Debit Card", "PayPal", "Bank Transfer"], 5))
+        .withColumn("GiftWrap", pick(["yes", "no"], 6))
+        .withColumn("SpecialInstructions", F.when(F.rand(seed + 7) < 0.5, F.element_at(instructions_pool, (F.rand(seed + 8) * instructions_pool_size).cast("int") + 1)).otherwise(F.lit("")))
+        .join(dimension(user_df_.select("UserID", F.col("Address").alias("ShippingAddress")), num_users), "UserID")
+        .join(dimension(product_df_.select("ProductID", F.col("Price").alias("UnitPrice")), num_products), "ProductID"))
+
+    return transactions.select(
+        "TransactionID", "UserID", "ProductID", "TransactionDate", "Quantity", "UnitPrice",
+        F.round(F.col("UnitPrice") * F.col("Quantity"), 2).alias("TotalPrice"),
+        "PaymentMethod", "ShippingAddress",
+        F.round(F.col("UnitPrice") * F.col("Quantity") * 0.1).cast("int").alias("LoyaltyPointsEarned"),  # Example: 10% of the total price in loyalty points
+        "GiftWrap", "SpecialInstructions")
+
+if not data_exists:
     # Generate the transaction data
     # Set the current date
     current_date = datetime.now()
@@ -489,7 +657,10 @@ if not data_exists:
     }
 
     # Generate the transaction data
-    transaction_pdf = generate_transaction_data(user_pdf, product_pdf, start_date, end_date, campaigns)
+    if generation_mode == "numpy":
+        transaction_pdf = generate_transaction_data_numpy(user_pdf, product_pdf, start_date, end_date, campaigns)
+    elif generation_mode == "faker":
+        transaction_pdf = generate_transaction_data(user_pdf, product_pdf, start_date, end_date, campaigns)
 
     # Convert the Pandas DataFrame to a PySpark DataFrame
     schema = StructType([
@@ -508,7 +679,12 @@ if not data_exists:
     ])
 
     # Create Spark DataFrame and Write to Delta table
-    transaction_df = spark.createDataFrame(transaction_pdf, schema)
+    if generation_mode == "spark":
+        user_df, product_df = spark.read.table("bronze_user"), spark.read.table("bronze_product")
+        transaction_df = generate_transaction_data_spark(user_df, product_df, user_df.count(), product_df.count(), start_date, end_date, campaigns)
+        transaction_df = transaction_df.select([F.col(f.name).cast(f.dataType) for f in schema.fields])
+    else:
+        transaction_df = spark.createDataFrame(transaction_pdf, schema)
     transaction_df.write.mode('overwrite').saveAsTable('bronze_transaction')
 
 # COMMAND ----------
@@ -0,0 +1,57 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC # 02-DataGeneration-benchmark
+# MAGIC Compare the transaction generators of `01-DataGeneration`:
+# MAGIC
+# MAGIC 1. `generate_transaction_data`: Faker, one `sample(1)` per user/product and one python dict per row
+# MAGIC 2. `generate_transaction_data_numpy`: every column drawn as an array, users and products joined by index
+# MAGIC
+# MAGIC Both generators use the same seasonality, weekday and campaign factors. The daily volume is scaled with `base_daily_transactions` to reach the target row count.
+
+# COMMAND ----------
+
+# MAGIC %run ./01-DataGeneration
+
+# COMMAND ----------
+
+import time
+
+# Users & products are used as lookup pools, only the columns joined in the transactions are needed
+user_pdf = spark.read.table("bronze_user").select("UserID", "Address").toPandas()
+product_pdf = spark.read.table("bronze_product").select("ProductID", "Price").toPandas()
+
+current_date = datetime.now()
+start_date = (current_date - timedelta(days=30)).strftime("%Y-%m-%d")
+end_date = current_date.strftime("%Y-%m-%d")
+campaigns = {(current_date - timedelta(days=1)).strftime("%Y-%m-%d"): 2.0}
+
+def base_daily_transactions_for(target_rows):
+    """base_daily_transactions giving ~target_rows transactions over the date range (the demo uses 100)."""
+    _, counts = daily_transaction_counts(start_date, end_date, campaigns, 100, np.random.default_rng(0))
+    return max(1, int(100 * target_rows / counts.sum()))
+
+def bench(name, fn, base_daily_transactions):
+    start = time.time()
+    pdf = fn(base_daily_transactions)
+    duration = time.time() - start
+    return {"generator": name, "rows": len(pdf), "seconds": round(duration, 2), "rows_per_sec": int(len(pdf) / duration)}
+
+# COMMAND ----------
+
+# DBTITLE 1,Faker baseline (small volume, the row-by-row generator doesn't scale further)
+def faker_generator(base_daily_transactions):
+    # The faker generator has a fixed base of 100 transactions/day: scale the campaign factor of every day instead
+    scale = base_daily_transactions / 100
+    days = pd.date_range(start_date, end_date, freq="D").strftime("%Y-%m-%d")
+    return generate_transaction_data(user_pdf, product_pdf, start_date, end_date, {d: campaigns.get(d, 1.0) * scale for d in days})
+
+results = [bench("faker", faker_generator, base_daily_transactions_for(10_000))]
+
+# COMMAND ----------
+
+# DBTITLE 1,NumPy generator at 1M and 10M transactions
+for target_rows in [1_000_000, 10_000_000]:
+    base = base_daily_transactions_for(target_rows)
+    results.append(bench("numpy", lambda b: generate_transaction_data_numpy(user_pdf, product_pdf, start_date, end_date, campaigns, base_daily_transactions=b, seed=42), base))
+
+display(pd.DataFrame(results))
@@ -27,6 +27,14 @@
       "title":  "Prep data", 
       "description": "Data generation."
     },
+    {
+      "path": "_resources/02-DataGeneration-benchmark", 
+      "pre_run": False, 
+      "publish_on_website": False, 
+      "add_cluster_setup_cell": False,
+      "title":  "Data generation benchmark", 
+      "description": "Rows/sec of the faker vs numpy transaction generators."
+    },
     {
       "path": "01-Timeseries-monitor", 
       "pre_run": True, 
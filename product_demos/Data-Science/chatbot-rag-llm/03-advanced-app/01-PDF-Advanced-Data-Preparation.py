@@ -159,38 +159,19 @@ with requests.get('https://dbdemos-dataset.s3.amazonaws.com/llm/databricks-pdf-d
 # MAGIC This looks great. We'll now wrap it with a text_splitter to avoid having too big pages, and create a Pandas UDF function to easily scale that across multiple nodes.
 # MAGIC
 # MAGIC *Note that our pdf text isn't clean. To make it nicer, we could use a few extra LLM-based pre-processing steps, asking to remove unrelevant content like the list of chapters and to only keep the core text.*
+# MAGIC
+# MAGIC Our PDFs can be big: instead of extracting the full text and splitting it at once, the [../_resources/03-pdf-chunking-functions]($../_resources/03-pdf-chunking-functions) helpers parse each PDF page by page and emit the chunks as the pages are parsed, keeping the memory bounded.
+# MAGIC
+# MAGIC Parsing is CPU-bound python: each Spark task parses its PDFs in a small pool of processes (`parse_workers`).
 
 # COMMAND ----------
 
-from llama_index.core.node_parser import SentenceSplitter
-from llama_index.core import Document, set_global_tokenizer
-from transformers import AutoTokenizer
-from typing import Iterator
+# MAGIC %run ../_resources/03-pdf-chunking-functions
 
-# Reduce the arrow batch size as our PDF can be big in memory (classic compute only)
-# spark.conf.set("spark.sql.execution.arrow.maxRecordsPerBatch", 10)
+# COMMAND ----------
 
-@pandas_udf("array<string>")
-def read_as_chunk(batch_iter: Iterator[pd.Series]) -> Iterator[pd.Series]:
-    #set llama2 as tokenizer to match our model size (will stay below gte 1024 limit)
-    set_global_tokenizer(
-      AutoTokenizer.from_pretrained("hf-internal-testing/llama-tokenizer", cache_dir="/tmp/hf_cache")
-    )
-    #Sentence splitter from llama_index to split on sentences
-    splitter = SentenceSplitter(chunk_size=500, chunk_overlap=10)
-    def extract_and_split(b):
-      try:
-        txt = parse_bytes_pypdf(b)
-      except Exception as e:
-        txt = f'__PDF_PARSING_ERROR__ file: {e}'
-        print(txt)
-      if txt is None:
-        return []
-      nodes = splitter.get_nodes_from_documents([Document(text=txt)])
-      return [n.text for n in nodes]
-
-    for x in batch_iter:
-        yield x.apply(extract_and_split)
+# The page-by-page extraction keeps the memory bounded, no need to reduce the arrow batch size (spark.sql.execution.arrow.maxRecordsPerBatch) anymore
+read_as_chunk = get_read_as_chunk_udf(parse_workers=4)
 
 # COMMAND ----------
 
@@ -264,47 +245,62 @@ pprint(embeddings)
 
 # COMMAND ----------
 
-@pandas_udf("array<float>")
-def get_embedding(contents: pd.Series) -> pd.Series:
-    import mlflow.deployments
-    deploy_client = mlflow.deployments.get_deploy_client("databricks")
-    def get_embeddings(batch):
-        #Note: this will fail if an exception is thrown during embedding creation (add try/except if needed) 
-        response = deploy_client.predict(endpoint="databricks-gte-large-en", inputs={"input": batch})
-        return [e['embedding'] for e in response.data]
+# MAGIC %md
+# MAGIC The embedding helpers are defined in the [../_resources/02-embedding-functions]($../_resources/02-embedding-functions) notebook:
+# MAGIC
+# MAGIC - the chunks are sent to the endpoint by batches of 150 (the endpoint limit), with a few requests in parallel and a retry with backoff when the endpoint is rate limited (429)
+# MAGIC - each chunk embedding is cached in the `embedding_cache` table, keyed by the hash of its content: chunks already embedded (rerun, same content in another document, `databricks_documentation` re-ingestion) don't call the endpoint again
+# MAGIC
+# MAGIC Set the `embedding_backend` widget to `local` to run the pipeline offline with a local hashing embedding (for tests only: the Vector Search query below uses the GTE endpoint).
+
+# COMMAND ----------
 
-    # Splitting the contents into batches of 150 items each, since the embedding model takes at most 150 inputs per request.
-    max_batch_size = 150
-    batches = [contents.iloc[i:i + max_batch_size] for i in range(0, len(contents), max_batch_size)]
+# MAGIC %run ../_resources/02-embedding-functions
 
-    # Process each batch and collect the results
-    all_embeddings = []
-    for batch in batches:
-        all_embeddings += get_embeddings(batch.tolist())
+# COMMAND ----------
 
-    return pd.Series(all_embeddings)
+dbutils.widgets.dropdown("embedding_backend", "endpoint", ["endpoint", "local"], "Embedding backend")
+embedding_backend = dbutils.widgets.get("embedding_backend")
+create_embedding_cache()
+
+import json
+
+def append_with_embeddings(checkpoint):
+  def append_batch(batch_df, batch_id):
+    #The stream query id is saved in the checkpoint: a new checkpoint (batch ids restarting at 0) gets a new app id, so its batches aren't skipped
+    app_id = json.loads(dbutils.fs.head(f"{checkpoint}/metadata"))["id"]
+    #Cache the batch: the cache lookup and the final join both read it (avoids parsing the PDFs twice)
+    batch_df = batch_df.cache()
+    #foreachBatch is at-least-once: txnAppId/txnVersion let Delta skip a replayed batch instead of appending its chunks twice
+    (embed_with_cache(batch_df, "content", backend=embedding_backend, max_concurrency=4)
+       .select('url', 'content', 'embedding')
+       .write.mode('append')
+       .option("txnAppId", app_id).option("txnVersion", batch_id)
+       .saveAsTable('databricks_pdf_documentation'))
+    batch_df.unpersist()
+  return append_batch
 
 # COMMAND ----------
 
 (spark.readStream.table('pdf_raw')
       .withColumn("content", F.explode(read_as_chunk("content")))
       .filter("content not like '__PDF_PARSING_ERROR__%'") #Drop PDF with parsing ERROR (could throw an error instead or properly flag that in a prod setup to avoid silent failures)
-      .withColumn("embedding", get_embedding("content"))
-      .selectExpr('path as url', 'content', 'embedding')
+      .selectExpr('path as url', 'content')
   .writeStream
     .trigger(availableNow=True)
+    .foreachBatch(append_with_embeddings(f'dbfs:{volume_folder}/checkpoints/pdf_chunk'))
     .option("checkpointLocation", f'dbfs:{volume_folder}/checkpoints/pdf_chunk')
-    .table('databricks_pdf_documentation').awaitTermination())
+    .start().awaitTermination())
 
 #Let's also add our documentation web page from the simple demo (make sure you run the quickstart demo first)
 if spark.catalog.tableExists(f'{catalog}.{db}.databricks_documentation'):
   (spark.readStream.option("skipChangeCommits", "true").table('databricks_documentation') #skip changes for more stable demo
-      .withColumn('embedding', get_embedding("content"))
-      .select('url', 'content', 'embedding')
+      .select('url', 'content')
   .writeStream
     .trigger(availableNow=True)
+    .foreachBatch(append_with_embeddings(f'dbfs:{volume_folder}/checkpoints/docs_chunks'))
     .option("checkpointLocation", f'dbfs:{volume_folder}/checkpoints/docs_chunks')
-    .table('databricks_pdf_documentation').awaitTermination())
+    .start().awaitTermination())
 
 # COMMAND ----------
 
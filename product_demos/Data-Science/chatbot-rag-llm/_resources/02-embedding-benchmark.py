@@ -0,0 +1,61 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC # Embedding pipeline benchmark (offline)
+# MAGIC
+# MAGIC Compare the embedding strategies of `02-embedding-functions` with the `local` backend, without calling the foundation model endpoint. The local backend simulates the endpoint: `latency_sec` per request of up to 150 texts, and a fraction of the requests rejected with a 429.
+# MAGIC
+# MAGIC We embed `num_chunks` synthetic chunks, of which only `distinct_ratio` are distinct contents (the same content appears in several documents or is re-ingested):
+# MAGIC
+# MAGIC - **sequential**: one request at a time per task, no cache (previous `get_embedding` UDF)
+# MAGIC - **concurrent**: `max_concurrency` requests in flight per task, no cache
+# MAGIC - **cache (cold)**: concurrent, empty cache: only the distinct contents are embedded
+# MAGIC - **cache (warm)**: same chunks again (rerun): no request at all
+
+# COMMAND ----------
+
+dbutils.widgets.text("num_chunks", "20000", "Number of chunks")
+dbutils.widgets.text("distinct_ratio", "0.5", "Ratio of distinct contents")
+dbutils.widgets.text("latency_sec", "0.2", "Simulated latency per request (sec)")
+dbutils.widgets.text("rate_limit_probability", "0.05", "Simulated 429 probability")
+dbutils.widgets.text("max_concurrency", "8", "Concurrent requests per task")
+
+# COMMAND ----------
+
+# MAGIC %run ./00-init $reset_all_data=false
+
+# COMMAND ----------
+
+# MAGIC %run ./02-embedding-functions
+
+# COMMAND ----------
+
+num_chunks = int(dbutils.widgets.get("num_chunks"))
+distinct_chunks = max(1, int(num_chunks * float(dbutils.widgets.get("distinct_ratio"))))
+simulation = {"latency_sec": float(dbutils.widgets.get("latency_sec")), "rate_limit_probability": float(dbutils.widgets.get("rate_limit_probability"))}
+max_concurrency = int(dbutils.widgets.get("max_concurrency"))
+cache_table = "embedding_cache_benchmark"
+
+chunks = (spark.range(num_chunks).repartition(8)
+               .select(F.concat(F.lit("Databricks chunk "), (F.col("id") % distinct_chunks).cast("string"), F.lit(" "), F.repeat(F.lit("lakehouse vector search embedding "), 30)).alias("content")))
+
+def timed(strategy, fn):
+  start = time.time()
+  fn().write.format("noop").mode("overwrite").save()
+  duration = time.time() - start
+  return {"strategy": strategy, "chunks": num_chunks, "seconds": round(duration, 2), "chunks_per_sec": int(num_chunks / duration)}
+
+# COMMAND ----------
+
+spark.sql(f"DROP TABLE IF EXISTS {cache_table}")
+create_embedding_cache(cache_table)
+
+results = [
+  timed("sequential", lambda: chunks.withColumn("embedding", get_embedding_udf("local", max_concurrency=1, **simulation)("content"))),
+  timed("concurrent", lambda: chunks.withColumn("embedding", get_embedding_udf("local", max_concurrency=max_concurrency, **simulation)("content")))]
+results.append(timed("cache (cold)", lambda: embed_with_cache(chunks, "content", "local", cache_table, max_concurrency=max_concurrency, **simulation)))
+cached = spark.table(cache_table).count()
+results.append(timed("cache (warm)", lambda: embed_with_cache(chunks, "content", "local", cache_table, max_concurrency=max_concurrency, **simulation)))
+assert spark.table(cache_table).count() == cached, "the warm run shouldn't embed any new content"
+
+display(pd.DataFrame(results))
+print(f"{cached} distinct contents embedded and cached for {num_chunks} chunks")
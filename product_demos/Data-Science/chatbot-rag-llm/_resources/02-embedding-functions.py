@@ -0,0 +1,119 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC ## Embedding helpers: backends, concurrent batching and content-hash cache
+# MAGIC
+# MAGIC Shared by `03-advanced-app/01-PDF-Advanced-Data-Preparation` and the `02-embedding-benchmark` notebook.
+# MAGIC
+# MAGIC - **Backends**: `endpoint` calls the `databricks-gte-large-en` foundation model, `local` computes a deterministic hashing-trick embedding with numpy (same 1024 dimension, no network) so that the flow can be tested and benchmarked offline. `local` can simulate the endpoint latency and rate limits.
+# MAGIC - **Batching**: the texts are sent by batches of 150 (endpoint limit), `max_concurrency` requests in parallel. Requests rejected with a 429 are retried with an exponential backoff.
+# MAGIC - **Cache**: `embed_with_cache` keys each chunk by `sha2(model | content)` and only embeds the chunks missing from the `embedding_cache` Delta table. Reruns and re-ingestion of unchanged content never call the endpoint again.
+
+# COMMAND ----------
+
+import pyspark.sql.functions as F
+from pyspark.sql.functions import pandas_udf
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import numpy as np
+import random
+import time
+import re
+import zlib
+
+EMBEDDING_ENDPOINT = "databricks-gte-large-en"
+EMBEDDING_DIMENSION = 1024
+EMBEDDING_CACHE_TABLE = "embedding_cache"
+
+# COMMAND ----------
+
+# DBTITLE 1,Concurrent batching with retry on 429
+def is_rate_limited(e):
+  message = str(e)
+  return "429" in message or "REQUEST_LIMIT_EXCEEDED" in message or "RATE_LIMIT" in message.upper()
+
+def with_retry(predict, max_retries=8, max_backoff_sec=60):
+  def predict_with_retry(batch):
+    for attempt in range(max_retries):
+      try:
+        return predict(batch)
+      except Exception as e:
+        if not is_rate_limited(e) or attempt == max_retries - 1:
+          raise
+        #Exponential backoff with jitter, so that the parallel requests don't retry at the same time
+        time.sleep(min(max_backoff_sec, 2 ** attempt) * random.uniform(0.5, 1))
+  return predict_with_retry
+
+def batched(predict, max_batch_size=150, max_concurrency=4, max_retries=8):
+  """Turns predict(list of <= max_batch_size texts) into embed(list of texts), with up to max_concurrency requests in flight."""
+  predict = with_retry(predict, max_retries)
+  def embed(texts):
+    batches = [texts[i:i + max_batch_size] for i in range(0, len(texts), max_batch_size)]
+    if max_concurrency <= 1 or len(batches) <= 1:
+      results = [predict(batch) for batch in batches]
+    else:
+      with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        results = list(executor.map(predict, batches))
+    return [e for batch in results for e in batch]
+  return embed
+
+# COMMAND ----------
+
+# DBTITLE 1,Embedding backends
+def endpoint_backend(endpoint=EMBEDDING_ENDPOINT, **batching):
+  import mlflow.deployments
+  deploy_client = mlflow.deployments.get_deploy_client("databricks")
+  def predict(batch):
+    response = deploy_client.predict(endpoint=endpoint, inputs={"input": batch})
+    return [e['embedding'] for e in response.data]
+  return batched(predict, **batching)
+
+def local_backend(dimension=EMBEDDING_DIMENSION, latency_sec=0.0, rate_limit_probability=0.0, **batching):
+  #Hashing trick: each token increments a bucket (crc32 is stable across python workers), then L2 normalization
+  def predict(batch):
+    if latency_sec > 0:
+      time.sleep(latency_sec)
+    if random.random() < rate_limit_probability:
+      raise Exception("429 REQUEST_LIMIT_EXCEEDED (simulated)")
+    vectors = np.zeros((len(batch), dimension), dtype=np.float32)
+    for i, text in enumerate(batch):
+      tokens = re.findall(r"\w+", (text or "").lower())
+      if tokens:
+        vectors[i] = np.bincount([zlib.crc32(t.encode()) % dimension for t in tokens], minlength=dimension)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    return vectors.tolist()
+  return batched(predict, **batching)
+
+embedding_backends = {"endpoint": endpoint_backend, "local": local_backend}
+
+def embedding_model_name(backend="endpoint", **options):
+  #Part of the cache key: embeddings of different models/backends never mix in the cache
+  return options.get("endpoint", EMBEDDING_ENDPOINT) if backend == "endpoint" else f"local-hash-{options.get('dimension', EMBEDDING_DIMENSION)}"
+
+def get_embedding_udf(backend="endpoint", **options):
+  @pandas_udf("array<float>")
+  def get_embedding(contents: pd.Series) -> pd.Series:
+    embed = embedding_backends[backend](**options)
+    return pd.Series(embed(contents.tolist()))
+  return get_embedding
+
+# COMMAND ----------
+
+# DBTITLE 1,Content-hash embedding cache
+def create_embedding_cache(cache_table=EMBEDDING_CACHE_TABLE):
+  spark.sql(f"CREATE TABLE IF NOT EXISTS {cache_table} (content_hash STRING, model STRING, embedding ARRAY<FLOAT>) CLUSTER BY (content_hash)")
+
+def embed_with_cache(df, content_col="content", backend="endpoint", cache_table=EMBEDDING_CACHE_TABLE, **options):
+  """Adds an embedding column to df. Only the distinct contents missing from the cache are embedded, then added to the cache."""
+  session = df.sparkSession
+  model = embedding_model_name(backend, **options)
+  keyed = df.withColumn("content_hash", F.sha2(F.concat_ws("|", F.lit(model), F.col(content_col)), 256))
+  misses = (keyed.select("content_hash", content_col).dropDuplicates(["content_hash"])
+                 .join(session.table(cache_table), "content_hash", "left_anti")
+                 .withColumn("embedding", get_embedding_udf(backend, **options)(content_col))
+                 .select("content_hash", F.lit(model).alias("model"), "embedding")
+                 .cache())
+  misses.createOrReplaceTempView("embedding_cache_misses")
+  session.sql(f"""MERGE INTO {cache_table} t USING embedding_cache_misses s ON t.content_hash = s.content_hash
+                  WHEN NOT MATCHED THEN INSERT *""")
+  misses.unpersist()
+  return keyed.join(session.table(cache_table).select("content_hash", "embedding"), "content_hash").drop("content_hash")
@@ -0,0 +1,114 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC # PDF chunking benchmark
+# MAGIC
+# MAGIC Compare the PDF chunking strategies on a corpus of large PDFs, built by concatenating each Databricks ebook `copies` times:
+# MAGIC
+# MAGIC - **full document**: extract the full text, then split it (previous `read_as_chunk`)
+# MAGIC - **page by page**: `iter_chunks` from `03-pdf-chunking-functions`, in a single process
+# MAGIC - **page by page + pool**: same, with a pool of `parse_workers` processes
+# MAGIC
+# MAGIC Each strategy runs in a forked process so that its peak RSS is measured independently. RSS includes the memory inherited at fork, so we report the increase over the RSS at fork time, for the main process and for the largest pool worker.
+
+# COMMAND ----------
+
+# MAGIC %pip install --quiet -U transformers==4.49.0 pypdf==4.1.0 llama-index==0.10.43
+# MAGIC dbutils.library.restartPython()
+
+# COMMAND ----------
+
+dbutils.widgets.text("copies", "20", "Copies of each ebook per PDF")
+dbutils.widgets.text("parse_workers", "4", "Processes in the pool")
+
+# COMMAND ----------
+
+# MAGIC %run ./00-init-advanced $reset_all_data=false
+
+# COMMAND ----------
+
+# MAGIC %run ./03-pdf-chunking-functions
+
+# COMMAND ----------
+
+import resource
+import time
+from pypdf import PdfReader, PdfWriter
+
+copies = int(dbutils.widgets.get("copies"))
+parse_workers = int(dbutils.widgets.get("parse_workers"))
+
+# COMMAND ----------
+
+# DBTITLE 1,Build the corpus of large PDFs on the local disk
+volume_folder = f"/Volumes/{catalog}/{db}/volume_databricks_documentation"
+upload_pdfs_to_volume(volume_folder+"/databricks-pdf")
+corpus_folder = "/tmp/pdf_chunking_benchmark"
+os.makedirs(corpus_folder, exist_ok=True)
+
+corpus, total_pages = [], 0
+for f in dbutils.fs.ls(volume_folder+"/databricks-pdf"):
+  if not f.name.endswith(".pdf"):
+    continue
+  writer = PdfWriter()
+  for _ in range(copies):
+    writer.append(PdfReader(f.path.replace("dbfs:", "")))
+  path = f"{corpus_folder}/{f.name}"
+  with open(path, "wb") as out:
+    writer.write(out)
+  corpus.append(path)
+  total_pages += len(writer.pages)
+print(f"{len(corpus)} PDFs, {total_pages} pages, {sum(os.path.getsize(p) for p in corpus) / 1024 / 1024:.0f} MB")
+
+# COMMAND ----------
+
+# DBTITLE 1,Strategies
+def read_corpus():
+  #one document in memory at a time, like the binary column of an arrow batch
+  for path in corpus:
+    with open(path, "rb") as f:
+      yield f.read()
+
+def full_document():
+  from llama_index.core import Document
+  splitter = get_splitter()
+  chunks = 0
+  for raw in read_corpus():
+    txt = "\n".join(list(iter_pages_pypdf(raw)))
+    chunks += len(splitter.get_nodes_from_documents([Document(text=txt)]))
+  return chunks
+
+def page_by_page(workers):
+  def run():
+    with pdf_chunk_pool(workers) as chunk_all:
+      return sum(len(chunks) for chunks in chunk_all(read_corpus()))
+  return run
+
+def max_rss_mb(who):
+  return resource.getrusage(who).ru_maxrss / 1024
+
+def run_isolated(strategy, fn):
+  context = multiprocessing.get_context("fork")
+  queue = context.Queue()
+  def target():
+    baseline = max_rss_mb(resource.RUSAGE_SELF)
+    start = time.time()
+    chunks = fn()
+    duration = time.time() - start
+    #RUSAGE_CHILDREN: largest terminated pool worker (the pool is shut down when fn returns)
+    worker_rss = max_rss_mb(resource.RUSAGE_CHILDREN)
+    queue.put({"strategy": strategy, "pages": total_pages, "chunks": chunks, "seconds": round(duration, 1),
+               "pages_per_sec": round(total_pages / duration, 1),
+               "peak_rss_increase_mb": round(max_rss_mb(resource.RUSAGE_SELF) - baseline),
+               "worker_peak_rss_increase_mb": round(max(0, worker_rss - baseline)) if worker_rss > 0 else None})
+  process = context.Process(target=target)
+  process.start()
+  result = queue.get()
+  process.join()
+  return result
+
+# COMMAND ----------
+
+results = [run_isolated("full document", full_document),
+           run_isolated("page by page", page_by_page(1)),
+           run_isolated(f"page by page + pool ({parse_workers})", page_by_page(parse_workers))]
+display(pd.DataFrame(results))
@@ -0,0 +1,92 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC ## PDF chunking helpers: page-by-page extraction and process pool
+# MAGIC
+# MAGIC Shared by `03-advanced-app/01-PDF-Advanced-Data-Preparation` and the `03-pdf-chunking-benchmark` notebook.
+# MAGIC
+# MAGIC - `iter_chunks` parses the PDF page by page and yields the chunks as soon as enough text is buffered (`buffer_chars`): the full text of the document and all its llama_index nodes are never in memory at the same time. The last chunk of each buffer is carried over to the next pages so that chunks still span page breaks.
+# MAGIC - `pdf_chunk_pool` parses the documents of a batch in a pool of `parse_workers` processes: pypdf parsing and tokenization are pure python and CPU-bound, threads would be limited by the GIL. The pool is created once per Spark task, so the total number of processes is the number of concurrent tasks times `parse_workers`: keep it close to the number of cores.
+
+# COMMAND ----------
+
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from pyspark.sql.functions import pandas_udf
+from typing import Iterator
+import multiprocessing
+import pandas as pd
+import types
+import sys
+import io
+import os
+
+def iter_pages_pypdf(raw_doc_contents_bytes: bytes):
+  from pypdf import PdfReader
+  #pages are loaded lazily by pypdf: only the current page text is kept
+  for page in PdfReader(io.BytesIO(raw_doc_contents_bytes)).pages:
+    yield page.extract_text() or ""
+
+def get_splitter(chunk_size=500, chunk_overlap=10):
+  from llama_index.core.node_parser import SentenceSplitter
+  from llama_index.core import set_global_tokenizer
+  from transformers import AutoTokenizer
+  #set llama2 as tokenizer to match our model size (will stay below gte 1024 limit)
+  set_global_tokenizer(
+    AutoTokenizer.from_pretrained("hf-internal-testing/llama-tokenizer", cache_dir="/tmp/hf_cache")
+  )
+  #Sentence splitter from llama_index to split on sentences
+  return SentenceSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+def iter_chunks(raw_doc_contents_bytes: bytes, splitter, buffer_chars=8000):
+  from llama_index.core import Document
+  buffer = ""
+  for page in iter_pages_pypdf(raw_doc_contents_bytes):
+    buffer += page + "\n"
+    if len(buffer) >= buffer_chars:
+      chunks = [n.text for n in splitter.get_nodes_from_documents([Document(text=buffer)])]
+      #keep the last chunk: it's split again with the next pages
+      yield from chunks[:-1]
+      buffer = chunks[-1] if chunks else ""
+  if buffer.strip():
+    yield from (n.text for n in splitter.get_nodes_from_documents([Document(text=buffer)]))
+
+# COMMAND ----------
+
+# DBTITLE 1,Process pool chunking
+def as_module_function(fn, module_name="pdf_chunking_worker"):
+  #The pool pickles the task function by reference (module + name): expose it in a module registered in sys.modules, inherited by the forked workers
+  module = sys.modules.setdefault(module_name, types.ModuleType(module_name))
+  fn.__module__, fn.__qualname__ = module_name, fn.__name__
+  setattr(module, fn.__name__, fn)
+  return fn
+
+@contextmanager
+def pdf_chunk_pool(parse_workers=4, buffer_chars=8000):
+  """Yields chunk_all(contents): an iterator of chunk lists, one per PDF, in the same order."""
+  splitter = get_splitter()
+  def chunk_pdf(raw_doc_contents_bytes):
+    #Note: in production setting you might want to flag the incorrect pdf/files instead
+    try:
+      return list(iter_chunks(raw_doc_contents_bytes, splitter, buffer_chars))
+    except Exception as e:
+      txt = f'__PDF_PARSING_ERROR__ file: {e}'
+      print(txt)
+      return [txt]
+
+  if parse_workers <= 1:
+    yield lambda contents: map(chunk_pdf, contents)
+    return
+  as_module_function(chunk_pdf)
+  #The tokenizer is already loaded: avoid the tokenizers fork warning/deadlock
+  os.environ["TOKENIZERS_PARALLELISM"] = "false"
+  #fork: the workers inherit the splitter and tokenizer instead of loading them again
+  with ProcessPoolExecutor(max_workers=parse_workers, mp_context=multiprocessing.get_context("fork")) as pool:
+    yield lambda contents: pool.map(chunk_pdf, contents)
+
+def get_read_as_chunk_udf(parse_workers=4, buffer_chars=8000):
+  @pandas_udf("array<string>")
+  def read_as_chunk(batch_iter: Iterator[pd.Series]) -> Iterator[pd.Series]:
+    with pdf_chunk_pool(parse_workers, buffer_chars) as chunk_all:
+      for x in batch_iter:
+        yield pd.Series(list(chunk_all(x)))
+  return read_as_chunk
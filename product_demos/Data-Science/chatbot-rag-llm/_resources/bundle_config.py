@@ -42,6 +42,38 @@
       "title":  "Setup",
       "description": "setup for the advanced demo (pdf + ocr setup)."
     },
+    {
+      "path": "_resources/02-embedding-functions",
+      "pre_run": False,
+      "publish_on_website": False,
+      "add_cluster_setup_cell": False,
+      "title":  "Embedding helpers",
+      "description": "Embedding backends, concurrent batching and content-hash embedding cache."
+    },
+    {
+      "path": "_resources/02-embedding-benchmark",
+      "pre_run": False,
+      "publish_on_website": False,
+      "add_cluster_setup_cell": False,
+      "title":  "Embedding benchmark",
+      "description": "Offline benchmark of the sequential, concurrent and cached embedding strategies."
+    },
+    {
+      "path": "_resources/03-pdf-chunking-functions",
+      "pre_run": False,
+      "publish_on_website": False,
+      "add_cluster_setup_cell": False,
+      "title":  "PDF chunking helpers",
+      "description": "Page-by-page PDF extraction and chunking with a process pool."
+    },
+    {
+      "path": "_resources/03-pdf-chunking-benchmark",
+      "pre_run": False,
+      "publish_on_website": False,
+      "add_cluster_setup_cell": False,
+      "title":  "PDF chunking benchmark",
+      "description": "Pages/sec and peak memory of the PDF chunking strategies on large PDFs."
+    },
     {
       "path": "00-RAG-LLM-RAG-Introduction",
       "pre_run": False,
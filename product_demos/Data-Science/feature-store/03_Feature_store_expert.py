@@ -103,6 +103,21 @@ fe.create_table(name=f"{catalog}.{db}.destination_location_features",
 
 # COMMAND ----------
 
+# MAGIC %md
+# MAGIC ### Daily refresh of the rolling features
+# MAGIC
+# MAGIC `create_table` computed the rolling windows over the full `travel_purchase` history. Once the tables exist, a daily job doesn't need to recompute everything: `refresh_user_features` / `refresh_destination_features` (see `./_resources/00-init-expert`) only take the purchases after the latest `ts` already in the feature table, recompute the rows of the affected users/destinations over the window preceding their first new purchase (6 months / 7 days), and merge them in the feature tables.
+# MAGIC
+# MAGIC The refresh cost stays proportional to the new data. As we just created the tables, there is nothing new to merge here.
+
+# COMMAND ----------
+
+# DBTITLE 1,Incremental refresh (run daily, after new purchases are added to travel_purchase)
+print(f"user_features: {refresh_user_features(fe, f'{catalog}.{db}.user_features')} rows updated")
+print(f"destination_features: {refresh_destination_features(fe, f'{catalog}.{db}.destination_features')} rows updated")
+
+# COMMAND ----------
+
 # MAGIC %md
 # MAGIC ## Compute streaming features
 # MAGIC
@@ -165,6 +180,8 @@ fe.write_table(
 # MAGIC Because it's shipped as part of your FeatureLookup definition, the same code will be used at inference time, offering a garantee that we compute the feature the same way, and adding flexibility while increasing model version.
 # MAGIC
 # MAGIC Note that this function will be available as `catalog.schema.distance_udf` in the browser.
+# MAGIC
+# MAGIC *Note: this python function is called once per row. For large batch scoring, `./_resources/00-init-expert` also provides the same computation as an arrow-vectorized pandas UDF (`with_distance`) and for pandas request batches (`add_distance`), with an optional cache for the hot user/destination pairs. See `./_resources/03-distance-benchmark` for the rows/sec of each variant.*
 
 # COMMAND ----------
 
@@ -271,10 +288,12 @@ training_set = fe.create_training_set(
 
 # COMMAND ----------
 
-training_features_df = training_set.load_df()
-#Let's cache the training dataset for automl (to avoid recomputing it everytime)
-
-training_features_df.toPandas()
+#Let's materialize the training dataset once as a Delta snapshot for automl and the next steps (to avoid recomputing it everytime).
+#The snapshot is only recomputed when the training rows (training_df plan), the feature lookups or one of the source tables change, and it's read lazily: the driver never holds the full dataset.
+training_features_df = DBDemos.cache_training_set(training_set.load_df(), "travel_training_set_snapshot",
+                                                  spec={"lookups": feature_lookups_spec(feature_lookups), "training_df": DBDemos.plan_fingerprint(training_df),
+                                                        "exclude_columns": ['user_id', 'destination_id', 'booking_date', 'clicked', 'price'], "label": "purchased"},
+                                                  source_tables=["travel_purchase", "user_features", "destination_features", "destination_location_features", "availability_features"])
 
 # COMMAND ----------
 
@@ -302,7 +321,7 @@ except Exception as e:
     if "cannot import name 'automl'" in str(e):
         # Note: cannot import name 'automl' from 'databricks' likely means you're using serverless. Dbdemos doesn't support autoML serverless API - this will be improved soon.
         # Adding a temporary workaround to make sure it works well for now - ignore this for classic run
-        summary_cl = DBDemos.create_mockup_automl_run(f"{xp_path}/{xp_name}", training_features_df.toPandas(), model_name="automl_mockup_expert", target_col="purchased")
+        summary_cl = DBDemos.create_mockup_automl_run(f"{xp_path}/{xp_name}", training_features_df, model_name="automl_mockup_expert", target_col="purchased")
     else:
         raise e
 
@@ -395,11 +414,9 @@ display(scored_df)
 
 # COMMAND ----------
 
-from sklearn.metrics import accuracy_score
-
-# simply convert the original probability predictions to true or false
-pd_scoring = scored_df.select("purchased", "prediction").toPandas()
-print("Accuracy: ", accuracy_score(pd_scoring["purchased"], pd_scoring["prediction"]))
+# compute the accuracy in spark: the predictions don't need to be collected on the driver
+accuracy = scored_df.select(F.avg((F.col("purchased") == F.col("prediction")).cast("double"))).first()[0]
+print("Accuracy: ", accuracy)
 
 # COMMAND ----------
 
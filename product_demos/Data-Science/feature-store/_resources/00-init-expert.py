@@ -51,7 +51,50 @@ def destination_features_fn(travel_purchase_df):
             F.count("*").over(w.Window.partitionBy("destination_id").orderBy(F.col("ts").cast("long")).rangeBetween(start=-(7 * 86400), end=0))
           )
           .select("destination_id", "ts", "sum_clicks_7d", "sum_impressions_7d")
-    )  
+    )
+
+#Longest rolling window of each feature group (the user 6 months purchases and the destination 7 days clicks/impressions)
+USER_FEATURES_WINDOW_SEC = 6 * 30 * 86400
+DESTINATION_FEATURES_WINDOW_SEC = 7 * 86400
+
+def refresh_rolling_features(fe, table_name, key, feature_fn, window_sec, source_df, new_rows=None):
+    """
+    Incrementally refreshes a rolling feature table from the new rows of source_df, and merges the updated rows in the feature table.
+    new_rows defaults to the source rows after the latest ts already in the feature table (event-time watermark). They must be part of source_df.
+    """
+    if new_rows is None:
+        watermark = spark.table(table_name).agg(F.max("ts")).first()[0]
+        new_rows = source_df if watermark is None else source_df.where(F.col("ts") > F.lit(watermark))
+    # A new event changes the rolling window of all the rows of its key from its ts: keep the first new ts per key
+    affected = new_rows.groupBy(key).agg(F.min("ts").alias("first_new_ts"))
+    # Only the history within the window before the first new event is required to recompute these rows
+    context = (source_df.join(affected, key)
+                 .where(F.col("ts").cast("long") >= F.col("first_new_ts").cast("long") - window_sec)
+                 .drop("first_new_ts"))
+    updates = (feature_fn(context)
+                 .join(affected, key)
+                 .where(F.col("ts") >= F.col("first_new_ts"))
+                 .drop("first_new_ts")
+                 .dropDuplicates([key, "ts"])
+                 .cache())
+    updated_rows = updates.count()
+    if updated_rows > 0:
+        fe.write_table(name=table_name, df=updates, mode="merge")
+    updates.unpersist()
+    return updated_rows
+
+def refresh_user_features(fe, table_name, source_df=None, new_rows=None):
+    source_df = spark.table('travel_purchase') if source_df is None else source_df
+    return refresh_rolling_features(fe, table_name, "user_id", create_user_features, USER_FEATURES_WINDOW_SEC, source_df, new_rows)
+
+def refresh_destination_features(fe, table_name, source_df=None, new_rows=None):
+    source_df = spark.table('travel_purchase') if source_df is None else source_df
+    return refresh_rolling_features(fe, table_name, "destination_id", destination_features_fn, DESTINATION_FEATURES_WINDOW_SEC, source_df, new_rows)
+
+def feature_lookups_spec(feature_lookups):
+    """JSON-able description of the FeatureLookup / FeatureFunction list, used as training set cache key."""
+    attributes = ["table_name", "lookup_key", "timestamp_lookup_key", "feature_names", "udf_name", "input_bindings", "output_name"]
+    return [{a: getattr(l, a, None) for a in attributes} for l in feature_lookups]
 
 #Required for pandas_on_spark assign to work properly
 import pyspark.pandas as ps
@@ -64,6 +107,51 @@ def compute_hearth_distance(lat1, lon1, lat2, lon2):
   a = np.sin(dlat/2)**2 + np.cos(np.radians(lat1)) * np.cos(np.radians(lat2)) * np.sin(dlon/2)**2
   return 2 * 6371 * np.arcsin(np.sqrt(a))
 
+from pyspark.sql.functions import pandas_udf, udf
+import pandas as pd
+
+#Row-wise python UDF: same execution model as the distance_udf SQL python function (one python call per row)
+distance_scalar_udf = udf(lambda lat1, lon1, lat2, lon2: float(compute_hearth_distance(lat1, lon1, lat2, lon2)), DoubleType())
+
+#Vectorized: compute_hearth_distance is numpy-based and runs on the whole arrow batch at once
+@pandas_udf("double")
+def distance_vectorized_udf(lat1: pd.Series, lon1: pd.Series, lat2: pd.Series, lon2: pd.Series) -> pd.Series:
+  return compute_hearth_distance(lat1, lon1, lat2, lon2)
+
+#Optional cache for the hot pairs: user locations are rounded to ~10m (4 decimals), the distance error is negligible
+DISTANCE_CACHE_PRECISION = 4
+
+def build_distance_cache(df, top_n=100000, user_lat="user_latitude", user_lon="user_longitude"):
+  """Precomputes the distance of the top_n most frequent (user location, destination) pairs of df (which must have the destination latitude/longitude)."""
+  return (df.select(F.round(user_lat, DISTANCE_CACHE_PRECISION).alias("cache_lat"), F.round(user_lon, DISTANCE_CACHE_PRECISION).alias("cache_lon"), "destination_id", "latitude", "longitude")
+            .groupBy("cache_lat", "cache_lon", "destination_id", "latitude", "longitude").count()
+            .orderBy(F.desc("count")).limit(top_n)
+            .withColumn("distance", distance_vectorized_udf("cache_lat", "cache_lon", "latitude", "longitude"))
+            .select("cache_lat", "cache_lon", "destination_id", "distance"))
+
+def with_distance(df, cache_df=None, user_lat="user_latitude", user_lon="user_longitude"):
+  """Adds the distance column to a spark DataFrame: from the cache when the pair is cached, computed in batch for the others."""
+  if cache_df is None:
+    return df.withColumn("distance", distance_vectorized_udf(user_lat, user_lon, "latitude", "longitude"))
+  joined = (df.withColumn("cache_lat", F.round(user_lat, DISTANCE_CACHE_PRECISION)).withColumn("cache_lon", F.round(user_lon, DISTANCE_CACHE_PRECISION))
+              .join(F.broadcast(cache_df), ["cache_lat", "cache_lon", "destination_id"], "left")
+              .drop("cache_lat", "cache_lon"))
+  #Split hits and misses: a coalesce would still send every row to the python UDF
+  misses = joined.where("distance IS NULL").withColumn("distance", distance_vectorized_udf(user_lat, user_lon, "latitude", "longitude"))
+  return joined.where("distance IS NOT NULL").unionByName(misses)
+
+def add_distance(pdf, cache=None, user_lat="user_latitude", user_lon="user_longitude"):
+  """Serving path: adds the distance column to a pandas DataFrame (the whole request batch at once). cache: dict (cache_lat, cache_lon, destination_id) -> distance."""
+  distance = pd.Series(np.nan, index=pdf.index)
+  if cache:
+    keys = zip(pdf[user_lat].round(DISTANCE_CACHE_PRECISION), pdf[user_lon].round(DISTANCE_CACHE_PRECISION), pdf["destination_id"])
+    distance = pd.Series([cache.get(k, np.nan) for k in keys], index=pdf.index, dtype="float64")
+  missing = distance.isna().to_numpy()
+  if missing.any():
+    rows = pdf[missing]
+    distance[missing] = compute_hearth_distance(rows[user_lat].to_numpy(), rows[user_lon].to_numpy(), rows["latitude"].to_numpy(), rows["longitude"].to_numpy())
+  return pdf.assign(distance=distance)
+
 
 # COMMAND ----------
 
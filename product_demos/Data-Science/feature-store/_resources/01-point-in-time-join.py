@@ -0,0 +1,93 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC ## Point-in-time join engine
+# MAGIC
+# MAGIC Standalone implementation of the training set built by `fe.create_training_set` in `03_Feature_store_expert`, running on plain Spark (no Feature Engineering client, works on a local Spark session). Used by the `02-point-in-time-benchmark` notebook.
+# MAGIC
+# MAGIC Each lookup is a dict with the `FeatureLookup` parameters: `table` (table name or DataFrame), `lookup_key`, optional `timestamp_lookup_key` and `feature_names`. A timestamp lookup returns, for each row, the features of the latest feature row with the same key and `ts <= timestamp_lookup_key`.
+# MAGIC
+# MAGIC Two strategies for the timestamp lookups:
+# MAGIC
+# MAGIC - `range_join`: join every feature row of the key with `ts <=` the row timestamp, then keep the latest with a `row_number` window per row. The join output grows with the history depth.
+# MAGIC - `as_of` (sort-merge as-of join): union the rows and the feature rows, partition by key, sort by time and carry the last feature row forward with `last(..., ignorenulls)`. One shuffle of each side, no join explosion, whatever the history depth.
+
+# COMMAND ----------
+
+import pyspark.sql.functions as F
+from pyspark.sql import SparkSession
+from pyspark.sql.window import Window
+
+spark = SparkSession.builder.getOrCreate()
+
+def lookup_keys(lookup):
+  return [lookup["lookup_key"]] if isinstance(lookup["lookup_key"], str) else list(lookup["lookup_key"])
+
+def lookup_features(lookup, timestamp_key="ts"):
+  table = lookup["table"]
+  features = spark.table(table) if isinstance(table, str) else table
+  feature_names = lookup.get("feature_names") or [c for c in features.columns if c not in lookup_keys(lookup) + [timestamp_key]]
+  return features, feature_names
+
+# COMMAND ----------
+
+# DBTITLE 1,Timestamp lookup strategies
+def range_join_lookup(df, features, keys, timestamp_lookup_key, feature_names, timestamp_key="ts"):
+  row_id = "_pit_row_id"
+  left = df.withColumn(row_id, F.monotonically_increasing_id())
+  right = features.select(*[F.col(k).alias(f"_pit_{k}") for k in keys], F.col(timestamp_key).alias("_pit_ts"), *feature_names)
+  condition = [left[k] == right[f"_pit_{k}"] for k in keys] + [right["_pit_ts"] <= left[timestamp_lookup_key]]
+  latest = Window.partitionBy(row_id).orderBy(F.col("_pit_ts").desc())
+  return (left.join(right, condition, "left")
+              .withColumn("_pit_rank", F.row_number().over(latest))
+              .where("_pit_rank = 1")
+              .drop(row_id, "_pit_rank", "_pit_ts", *[f"_pit_{k}" for k in keys]))
+
+def as_of_lookup(df, features, keys, timestamp_lookup_key, feature_names, timestamp_key="ts"):
+  rows = df.select(*[F.col(k).alias(f"_pit_{k}") for k in keys], F.col(timestamp_lookup_key).alias("_pit_ts"), F.lit(1).alias("_pit_side"),
+                   F.struct(*df.columns).alias("_pit_row"))
+  feature_rows = (features.where(" AND ".join(f"`{k}` IS NOT NULL" for k in keys))
+                          .select(*[F.col(k).alias(f"_pit_{k}") for k in keys], F.col(timestamp_key).alias("_pit_ts"), F.lit(0).alias("_pit_side"),
+                                  F.struct(*feature_names).alias("_pit_features")))
+  #Feature rows sort before the rows with the same ts: a feature row at ts is visible to the lookup at ts
+  as_of = (Window.partitionBy(*[f"_pit_{k}" for k in keys]).orderBy("_pit_ts", "_pit_side")
+                 .rowsBetween(Window.unboundedPreceding, Window.currentRow))
+  return (rows.unionByName(feature_rows, allowMissingColumns=True)
+              .withColumn("_pit_features", F.last("_pit_features", ignorenulls=True).over(as_of))
+              .where("_pit_side = 1")
+              .select("_pit_row.*", *[F.col(f"_pit_features.{f}").alias(f) for f in feature_names]))
+
+timestamp_lookup_strategies = {"range_join": range_join_lookup, "as_of": as_of_lookup}
+
+# COMMAND ----------
+
+# DBTITLE 1,Training set
+def haversine_km(lat1, lon1, lat2, lon2):
+  #Same formula as compute_hearth_distance / distance_udf, as native Spark expressions
+  dlat, dlon = F.radians(F.col(lat2) - F.col(lat1)), F.radians(F.col(lon2) - F.col(lon1))
+  a = F.sin(dlat / 2) ** 2 + F.cos(F.radians(lat1)) * F.cos(F.radians(lat2)) * F.sin(dlon / 2) ** 2
+  return 2 * 6371 * F.asin(F.sqrt(a))
+
+def build_training_frame(df, lookups, exclude_columns=[], on_demand_features={}, strategy="as_of", timestamp_key="ts"):
+  """Same output as fe.create_training_set(...).load_df(): df columns, then the lookups features, then the on-demand features (name -> Column)."""
+  for lookup in lookups:
+    features, feature_names = lookup_features(lookup, timestamp_key)
+    keys = lookup_keys(lookup)
+    if lookup.get("timestamp_lookup_key"):
+      df = timestamp_lookup_strategies[strategy](df, features, keys, lookup["timestamp_lookup_key"], feature_names, timestamp_key)
+    else:
+      df = df.join(features.select(*keys, *feature_names), keys, "left")
+  for name, column in on_demand_features.items():
+    df = df.withColumn(name, column)
+  return df.drop(*exclude_columns)
+
+def travel_training_frame(training_df, strategy="as_of"):
+  """Training frame of 03_Feature_store_expert: 4 lookups + the distance_udf FeatureFunction."""
+  lookups = [
+    {"table": "user_features", "lookup_key": "user_id", "timestamp_lookup_key": "ts", "feature_names": ["mean_price_7d"]},
+    {"table": "destination_features", "lookup_key": "destination_id", "timestamp_lookup_key": "ts"},
+    {"table": "destination_location_features", "lookup_key": "destination_id", "feature_names": ["latitude", "longitude"]},
+    {"table": "availability_features", "lookup_key": ["destination_id", "booking_date"], "timestamp_lookup_key": "ts", "feature_names": ["availability"]}]
+  return build_training_frame(training_df, lookups,
+                              exclude_columns=['user_id', 'destination_id', 'booking_date', 'clicked', 'price'],
+                              on_demand_features={"distance": haversine_km("user_latitude", "user_longitude", "latitude", "longitude")},
+                              strategy=strategy)
@@ -0,0 +1,109 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC # Point-in-time join benchmark
+# MAGIC
+# MAGIC Measure the training set materialization of `01-point-in-time-join` (`range_join` vs `as_of`) as the number of timestamp lookups and the history depth (feature rows per key) grow. Runs on any Spark session, including a local one: the data is synthetic.
+# MAGIC
+# MAGIC For each configuration we report the materialization time and the shuffle bytes written, read from the Spark UI REST API (not available on serverless: the column is then empty).
+# MAGIC
+# MAGIC The last cell checks that the engine returns the same training frame as `fe.create_training_set` on the `03_Feature_store_expert` tables, when they exist.
+
+# COMMAND ----------
+
+# MAGIC %run ./01-point-in-time-join
+
+# COMMAND ----------
+
+import json
+import time
+import pandas as pd
+from urllib.request import urlopen
+
+num_rows = 100000
+num_keys = 1000
+step_sec = 3600
+
+def feature_table(i, history_depth):
+  #history_depth feature rows per key, one every step_sec
+  return (spark.range(num_keys * history_depth)
+               .select((F.col("id") % num_keys).alias("entity_id"),
+                       (F.lit(0) + (F.col("id") / num_keys).cast("long") * step_sec).cast("timestamp").alias("ts"),
+                       F.rand(i).alias(f"feature_{i}")))
+
+def label_rows(history_depth):
+  return spark.range(num_rows).select((F.col("id") % num_keys).alias("entity_id"),
+                                      (F.rand(42) * history_depth * step_sec).cast("long").cast("timestamp").alias("ts"),
+                                      (F.rand(43) > 0.5).alias("label"))
+
+def shuffle_write_bytes(job_group):
+  ui_url = spark.sparkContext.uiWebUrl
+  if ui_url is None:
+    return None
+  api = f"{ui_url}/api/v1/applications/{spark.sparkContext.applicationId}"
+  try:
+    time.sleep(1) #let the UI listener catch up with the last stages
+    stage_ids = {s for job in json.load(urlopen(f"{api}/jobs")) if job.get("jobGroup") == job_group for s in job["stageIds"]}
+    return sum(s["shuffleWriteBytes"] for s in json.load(urlopen(f"{api}/stages")) if s["stageId"] in stage_ids)
+  except Exception as e:
+    print(f"Couldn't read the shuffle metrics from the Spark UI: {e}")
+    return None
+
+def run_benchmark(num_lookups, history_depth, strategy):
+  lookups = [{"table": feature_table(i, history_depth).cache(), "lookup_key": "entity_id", "timestamp_lookup_key": "ts"} for i in range(num_lookups)]
+  labels = label_rows(history_depth).cache()
+  for df in [labels] + [l["table"] for l in lookups]:
+    df.count()
+  job_group = f"pit_{strategy}_{num_lookups}_{history_depth}"
+  spark.sparkContext.setJobGroup(job_group, job_group)
+  start = time.time()
+  build_training_frame(labels, lookups, strategy=strategy).write.format("noop").mode("overwrite").save()
+  duration = time.time() - start
+  shuffle = shuffle_write_bytes(job_group)
+  for df in [labels] + [l["table"] for l in lookups]:
+    df.unpersist()
+  return {"strategy": strategy, "lookups": num_lookups, "history_depth": history_depth, "feature_rows_per_lookup": num_keys * history_depth,
+          "seconds": round(duration, 2), "shuffle_write_mb": None if shuffle is None else round(shuffle / 1024 / 1024, 1)}
+
+# COMMAND ----------
+
+# DBTITLE 1,Both strategies return the same rows
+lookups = [{"table": feature_table(i, 10), "lookup_key": "entity_id", "timestamp_lookup_key": "ts"} for i in range(2)]
+frames = [build_training_frame(label_rows(10), lookups, strategy=s) for s in ["range_join", "as_of"]]
+assert frames[0].exceptAll(frames[1]).count() == 0 and frames[1].exceptAll(frames[0]).count() == 0, "as_of and range_join training frames differ"
+
+# COMMAND ----------
+
+results = []
+for history_depth in [10, 100, 1000]:
+  for num_lookups in [1, 2, 4]:
+    for strategy in ["range_join", "as_of"]:
+      results.append(run_benchmark(num_lookups, history_depth, strategy))
+display(pd.DataFrame(results))
+
+# COMMAND ----------
+
+# DBTITLE 1,Parity with the Feature Engineering client (Databricks, after running 03_Feature_store_expert)
+try:
+  from databricks.feature_engineering import FeatureEngineeringClient
+  from databricks.feature_engineering.entities.feature_function import FeatureFunction
+  from databricks.feature_engineering.entities.feature_lookup import FeatureLookup
+except ImportError:
+  FeatureEngineeringClient = None
+
+if FeatureEngineeringClient is not None and spark.catalog.tableExists("availability_features"):
+  training_df = spark.table('travel_purchase').select('ts', 'purchased', 'destination_id', 'user_id', 'user_latitude', 'user_longitude', 'booking_date').where("ts < '2022-11-23'")
+  training_set = FeatureEngineeringClient().create_training_set(
+    df=training_df,
+    feature_lookups=[
+      FeatureLookup(table_name="user_features", lookup_key="user_id", timestamp_lookup_key="ts", feature_names=["mean_price_7d"]),
+      FeatureLookup(table_name="destination_features", lookup_key="destination_id", timestamp_lookup_key="ts"),
+      FeatureLookup(table_name="destination_location_features", lookup_key="destination_id", feature_names=["latitude", "longitude"]),
+      FeatureLookup(table_name="availability_features", lookup_key=["destination_id", "booking_date"], timestamp_lookup_key="ts", feature_names=["availability"]),
+      FeatureFunction(udf_name="distance_udf", input_bindings={"lat1": "user_latitude", "lon1": "user_longitude", "lat2": "latitude", "lon2": "longitude"}, output_name="distance")],
+    exclude_columns=['user_id', 'destination_id', 'booking_date', 'clicked', 'price'],
+    label='purchased')
+  expected = training_set.load_df()
+  actual = travel_training_frame(training_df).select(*expected.columns)
+  #distance is rounded: the python UDF and the Spark expressions can differ on the last bits
+  expected, actual = [df.withColumn("distance", F.round("distance", 6)) for df in [expected, actual]]
+  print(f"Rows only in the Feature Engineering training set: {expected.exceptAll(actual).count()}, only in the as-of engine: {actual.exceptAll(expected).count()}")
@@ -0,0 +1,101 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC # Distance feature micro-benchmark
+# MAGIC
+# MAGIC Rows/sec of the user to destination distance feature (see `00-init-expert`), scalar vs vectorized:
+# MAGIC
+# MAGIC - **Spark**: row-wise python UDF, the `distance_udf` Unity Catalog function used by the `FeatureFunction`, its batch (`PARAMETER STYLE PANDAS`) version, the arrow-vectorized pandas UDF, and the vectorized UDF with the hot pairs cache
+# MAGIC - **Serving path** (pandas, one request batch at a time): row-wise `apply`, vectorized `add_distance`, and `add_distance` with the hot pairs cache
+# MAGIC
+# MAGIC The synthetic rows reuse `hot_ratio` of a small set of (user location, destination) pairs, to show the cache hit path.
+
+# COMMAND ----------
+
+# MAGIC %run ./00-init-expert
+
+# COMMAND ----------
+
+num_rows = 5000000
+hot_pairs = 10000
+hot_ratio = 0.5
+request_size = 1000
+
+def distance_rows(n):
+  #hot rows reuse one of the hot_pairs locations, the others are random
+  hot = F.rand(1) < hot_ratio
+  pair = (F.rand(2) * hot_pairs).cast("int")
+  def coordinate(seed, scale):
+    return F.when(hot, F.round((F.hash(pair, F.lit(seed)) % 10000) / 10000 * scale, DISTANCE_CACHE_PRECISION)).otherwise((F.rand(seed) * 2 - 1) * scale)
+  #the destination location only depends on destination_id, like destination_location_features
+  destination_id = F.when(hot, pair % 100).otherwise((F.rand(5) * 100).cast("int"))
+  return (spark.range(n).select(coordinate(3, 90).alias("user_latitude"), coordinate(4, 180).alias("user_longitude"), destination_id.alias("destination_id"))
+               .withColumn("latitude", (F.hash("destination_id", F.lit(6)) % 9000) / 100)
+               .withColumn("longitude", (F.hash("destination_id", F.lit(7)) % 18000) / 100))
+
+def timed(path, variant, rows, fn):
+  start = time.time()
+  fn()
+  duration = time.time() - start
+  return {"path": path, "variant": variant, "rows": rows, "seconds": round(duration, 2), "rows_per_sec": int(rows / duration)}
+
+# COMMAND ----------
+
+# DBTITLE 1,Batch version of the Unity Catalog function
+try:
+  spark.sql("""
+    CREATE OR REPLACE FUNCTION distance_udf_batch(lat1 DOUBLE, lon1 DOUBLE, lat2 DOUBLE, lon2 DOUBLE)
+    RETURNS DOUBLE
+    LANGUAGE PYTHON
+    PARAMETER STYLE PANDAS
+    HANDLER 'distance_batch'
+    COMMENT 'Calculate hearth distance from latitude and longitude, one arrow batch at a time'
+    AS $$
+    import numpy as np
+    def distance_batch(batches):
+      for lat1, lon1, lat2, lon2 in batches:
+        dlat, dlon = np.radians(lat2 - lat1), np.radians(lon2 - lon1)
+        a = np.sin(dlat/2)**2 + np.cos(np.radians(lat1)) * np.cos(np.radians(lat2)) * np.sin(dlon/2)**2
+        yield 2 * 6371 * np.arcsin(np.sqrt(a))
+    $$""")
+  uc_functions = ["distance_udf", "distance_udf_batch"]
+except Exception as e:
+  print(f"Batch python UDFs not available on this runtime, skipping distance_udf_batch: {e}")
+  uc_functions = ["distance_udf"]
+uc_functions = [f for f in uc_functions if spark.catalog.functionExists(f)]
+
+# COMMAND ----------
+
+# DBTITLE 1,Spark
+rows = distance_rows(num_rows).cache()
+rows.count()
+cache_df = build_distance_cache(rows, top_n=hot_pairs * 2).cache()
+cache_df.count()
+
+def noop(df):
+  return lambda: df.write.format("noop").mode("overwrite").save()
+
+results = [timed("spark", "scalar python UDF", num_rows, noop(rows.withColumn("distance", distance_scalar_udf("user_latitude", "user_longitude", "latitude", "longitude"))))]
+for function in uc_functions:
+  results.append(timed("spark", f"UC function {function}", num_rows, noop(rows.withColumn("distance", F.expr(f"{function}(user_latitude, user_longitude, latitude, longitude)")))))
+results.append(timed("spark", "vectorized pandas UDF", num_rows, noop(with_distance(rows))))
+results.append(timed("spark", "vectorized pandas UDF + cache", num_rows, noop(with_distance(rows, cache_df))))
+
+# COMMAND ----------
+
+# DBTITLE 1,Serving path (pandas)
+serving_pdf = rows.limit(request_size * 100).toPandas()
+requests_pdf = [serving_pdf.iloc[i:i + request_size] for i in range(0, len(serving_pdf), request_size)]
+cache = {(r.cache_lat, r.cache_lon, r.destination_id): r.distance for r in cache_df.toPandas().itertuples()}
+serving_rows = sum(len(r) for r in requests_pdf)
+
+def scalar_requests():
+  for pdf in requests_pdf:
+    pdf.assign(distance=pdf.apply(lambda r: compute_hearth_distance(r.user_latitude, r.user_longitude, r.latitude, r.longitude), axis=1))
+
+results.append(timed("serving", "scalar (row-wise apply)", serving_rows, scalar_requests))
+results.append(timed("serving", "vectorized add_distance", serving_rows, lambda: [add_distance(pdf) for pdf in requests_pdf]))
+results.append(timed("serving", "vectorized add_distance + cache", serving_rows, lambda: [add_distance(pdf, cache) for pdf in requests_pdf]))
+
+rows.unpersist()
+cache_df.unpersist()
+display(pd.DataFrame(results))
@@ -37,6 +37,30 @@
       "title":  "Setup",
       "description": "Init data for expert demo."
     },
+    {
+      "path": "_resources/01-point-in-time-join",
+      "pre_run": False,
+      "publish_on_website": False,
+      "add_cluster_setup_cell": False,
+      "title":  "Point-in-time join engine",
+      "description": "Standalone as-of join building the expert demo training set on plain Spark."
+    },
+    {
+      "path": "_resources/02-point-in-time-benchmark",
+      "pre_run": False,
+      "publish_on_website": False,
+      "add_cluster_setup_cell": False,
+      "title":  "Point-in-time join benchmark",
+      "description": "Training set materialization time and shuffle size by number of lookups and history depth."
+    },
+    {
+      "path": "_resources/03-distance-benchmark",
+      "pre_run": False,
+      "publish_on_website": False,
+      "add_cluster_setup_cell": False,
+      "title":  "Distance feature benchmark",
+      "description": "Rows/sec of the scalar and vectorized distance feature, in Spark and in the serving path."
+    },
     {
       "path": "01_Feature_store_introduction", 
       "pre_run": True, 
@@ -54,64 +54,16 @@ display(telcoDF)
 # COMMAND ----------
 
 # MAGIC %md
-# MAGIC ### Using PandasUDF and PySpark
-# MAGIC To scale pandas analytics on a Spark dataframe
-
-# COMMAND ----------
-
-from pyspark.sql import DataFrame as SparkDataFrame
-from pyspark.sql.functions import pandas_udf, col, when, lit
-
-
-#  Count the number of optional services enabled, like streaming TV
-def compute_service_features(inputDF: SparkDataFrame) -> SparkDataFrame:
-  # Create pandas UDF function
-  @pandas_udf('double')
-  def num_optional_services(*cols):
-    # Nested helper function to count the number of optional services in a pandas dataframe
-    return sum(map(lambda s: (s == "Yes").astype('double'), cols))
-
-  return inputDF.\
-    withColumn("num_optional_services",
-        num_optional_services("online_security", "online_backup", "device_protection", "tech_support", "streaming_tv", "streaming_movies"))
-
-# COMMAND ----------
-
-# MAGIC %md
-# MAGIC ### Using Pandas On Spark API
+# MAGIC ### Using native Spark expressions
 # MAGIC
-# MAGIC Because our Data Scientist team is familiar with Pandas, we'll use the [pandas on spark API](https://spark.apache.org/docs/latest/api/python/reference/pyspark.pandas/index.html) to scale `pandas` code. The Pandas instructions will be converted in the spark engine under the hood and distributed at scale.
+# MAGIC The cleaning and the `num_optional_services` count are defined in [the churn features notebook]($../_resources/01-churn-features) as Spark column expressions. Spark compiles them in a single projection: there is no pandas on Spark conversion and no python UDF, so the rows never leave the JVM to be serialized to a python worker.
 # MAGIC
-# MAGIC *Note: Starting from `spark 3.2`, koalas is builtin and we can get a Pandas Dataframe using `pandas_api()`.*
+# MAGIC *Note: [the benchmark notebook]($../_resources/02-churn-features-benchmark) checks that these features match the previous pandas UDF / pandas on Spark implementation, and compares their python worker time.*
 
 # COMMAND ----------
 
 # DBTITLE 1,Define featurization function
-def clean_churn_features(dataDF: SparkDataFrame) -> SparkDataFrame:
-  """
-  Simple cleaning function leveraging the Pandas API
-  """
-
-  # Convert to pandas on spark dataframe
-  data_psdf = dataDF.pandas_api()
-
-  # Convert some columns
-  data_psdf = data_psdf.astype({"senior_citizen": "string"})
-  data_psdf["senior_citizen"] = data_psdf["senior_citizen"].map({"1" : "Yes", "0" : "No"})
-
-  data_psdf["total_charges"] = data_psdf["total_charges"].apply(lambda x: float(x) if x.strip() else 0)
-
-  # Fill some missing numerical values with 0
-  data_psdf = data_psdf.fillna({"tenure": 0.0})
-  data_psdf = data_psdf.fillna({"monthly_charges": 0.0})
-  data_psdf = data_psdf.fillna({"total_charges": 0.0})
-
-  # Add/Force semantic data types for specific columns (to facilitate autoML)
-  data_cleanDF = data_psdf.to_spark()
-  data_cleanDF = data_cleanDF.withMetadata("customer_id", {"spark.contentAnnotation.semanticType":"native"})
-  data_cleanDF = data_cleanDF.withMetadata("num_optional_services", {"spark.contentAnnotation.semanticType":"numeric"})
-
-  return data_cleanDF
+# MAGIC %run ../_resources/01-churn-features
 
 # COMMAND ----------
 
@@ -134,7 +86,7 @@ from pyspark.sql.functions import lit
 
 # Add current scoring timestamp
 this_time = (datetime.now()).timestamp()
-churn_features_n_predsDF = clean_churn_features(compute_service_features(telcoDF)) \
+churn_features_n_predsDF = clean_churn_features(telcoDF) \
                             .withColumn("transaction_ts", lit(this_time).cast("timestamp"))
 
 display(churn_features_n_predsDF)
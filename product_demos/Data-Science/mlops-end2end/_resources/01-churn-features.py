@@ -0,0 +1,41 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC ## Churn features
+# MAGIC
+# MAGIC Cleaning of the bronze customers and `num_optional_services` count, as native Spark expressions. Used by `02-mlops-advanced/01_feature_engineering` and the `02-churn-features-benchmark` notebook.
+# MAGIC
+# MAGIC All the features are computed in a single projection: no `pandas_api()` round trip and no pandas UDF, so no data is serialized to a python worker.
+
+# COMMAND ----------
+
+import pyspark.sql.functions as F
+from pyspark.sql import DataFrame as SparkDataFrame
+from pyspark.sql.functions import col
+
+optional_services = ["online_security", "online_backup", "device_protection", "tech_support", "streaming_tv", "streaming_movies"]
+
+def churn_feature_columns():
+  """Cleaned/added columns, as Spark expressions (name -> Column)"""
+  senior_citizen = col("senior_citizen").cast("string")
+  total_charges = F.trim(col("total_charges"))
+  return {
+    "senior_citizen": F.when(senior_citizen == "1", "Yes").when(senior_citizen == "0", "No"),
+    #new customers have a blank total_charges
+    "total_charges": F.when(total_charges == "", 0.0).otherwise(total_charges.cast("double")),
+    #Count the number of optional services enabled, like streaming TV
+    "num_optional_services": sum(F.when(col(c) == "Yes", 1.0).otherwise(0.0) for c in optional_services)}
+
+def clean_churn_features(dataDF: SparkDataFrame) -> SparkDataFrame:
+  """
+  Simple cleaning function, compiled by Spark in a single projection
+  """
+  data_cleanDF = dataDF.withColumns(churn_feature_columns())
+
+  # Fill some missing numerical values with 0
+  data_cleanDF = data_cleanDF.fillna(0.0, subset=["tenure", "monthly_charges", "total_charges"])
+
+  # Add/Force semantic data types for specific columns (to facilitate autoML)
+  data_cleanDF = data_cleanDF.withMetadata("customer_id", {"spark.contentAnnotation.semanticType":"native"})
+  data_cleanDF = data_cleanDF.withMetadata("num_optional_services", {"spark.contentAnnotation.semanticType":"numeric"})
+
+  return data_cleanDF
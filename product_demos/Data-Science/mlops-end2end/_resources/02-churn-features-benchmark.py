@@ -0,0 +1,126 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC # Churn features benchmark
+# MAGIC
+# MAGIC Compare the native Spark `clean_churn_features` (see `01-churn-features`) with the previous implementation: `compute_service_features` pandas UDF, then the `pandas_api()` cleaning with a per-row `apply` on `total_charges`.
+# MAGIC
+# MAGIC - **Parity**: both versions return the same schema and rows, on synthetic bronze rows and on the `advanced_churn_bronze_customers` table when it exists
+# MAGIC - **Benchmark**: wall time and python worker CPU time to materialize the features of `num_rows` synthetic customers
+# MAGIC
+# MAGIC The python worker CPU time is read from the `pyspark.daemon` processes of this node: run it on a single node cluster (or a local Spark session) to capture all the workers.
+
+# COMMAND ----------
+
+# MAGIC %run ./01-churn-features
+
+# COMMAND ----------
+
+import time
+import psutil
+import pandas as pd
+from pyspark.sql import SparkSession
+from pyspark.sql.functions import pandas_udf
+
+spark = SparkSession.builder.getOrCreate()
+
+num_rows = 10000000
+
+# COMMAND ----------
+
+# DBTITLE 1,Previous implementation (pandas UDF + pandas on Spark)
+def compute_service_features(inputDF: SparkDataFrame) -> SparkDataFrame:
+  @pandas_udf('double')
+  def num_optional_services(*cols):
+    return sum(map(lambda s: (s == "Yes").astype('double'), cols))
+  return inputDF.withColumn("num_optional_services", num_optional_services(*optional_services))
+
+def clean_churn_features_pandas_api(dataDF: SparkDataFrame) -> SparkDataFrame:
+  data_psdf = dataDF.pandas_api()
+  data_psdf = data_psdf.astype({"senior_citizen": "string"})
+  data_psdf["senior_citizen"] = data_psdf["senior_citizen"].map({"1" : "Yes", "0" : "No"})
+  data_psdf["total_charges"] = data_psdf["total_charges"].apply(lambda x: float(x) if x.strip() else 0)
+  data_psdf = data_psdf.fillna({"tenure": 0.0})
+  data_psdf = data_psdf.fillna({"monthly_charges": 0.0})
+  data_psdf = data_psdf.fillna({"total_charges": 0.0})
+  data_cleanDF = data_psdf.to_spark()
+  data_cleanDF = data_cleanDF.withMetadata("customer_id", {"spark.contentAnnotation.semanticType":"native"})
+  data_cleanDF = data_cleanDF.withMetadata("num_optional_services", {"spark.contentAnnotation.semanticType":"numeric"})
+  return data_cleanDF
+
+implementations = {"pandas UDF + pandas on Spark": lambda df: clean_churn_features_pandas_api(compute_service_features(df)),
+                   "native Spark expressions": clean_churn_features}
+
+# COMMAND ----------
+
+def pick(seed, values):
+  return F.element_at(F.array(*[F.lit(v) for v in values]), (F.rand(seed) * len(values)).cast("int") + 1)
+
+def bronze_rows(n):
+  #same schema as the advanced_churn_bronze_customers table created by 00-setup
+  yes_no = ["Yes", "No"]
+  services = ["Yes", "No", "No internet service"]
+  return (spark.range(n).select(
+    F.format_string("%d-SYNTH", "id").alias("customer_id"),
+    pick(1, ["Male", "Female"]).alias("gender"),
+    (F.rand(2) < 0.15).cast("long").alias("senior_citizen"),
+    pick(3, yes_no).alias("partner"),
+    pick(4, yes_no).alias("dependents"),
+    (F.rand(5) * 72).cast("long").alias("tenure"),
+    pick(6, yes_no).alias("phone_service"),
+    pick(7, ["Yes", "No", "No phone service"]).alias("multiple_lines"),
+    pick(8, ["DSL", "Fiber optic", "No"]).alias("internet_service"),
+    *[pick(9 + i, services).alias(c) for i, c in enumerate(optional_services)],
+    pick(20, ["Month-to-month", "One year", "Two year"]).alias("contract"),
+    pick(21, yes_no).alias("paperless_billing"),
+    pick(22, ["Electronic check", "Mailed check", "Bank transfer (automatic)", "Credit card (automatic)"]).alias("payment_method"),
+    F.round(F.rand(23) * 100 + 18, 2).alias("monthly_charges"),
+    #~1% of blank total charges, like the new customers of the Telco dataset
+    F.when(F.rand(24) < 0.01, F.lit(" ")).otherwise(F.format_string("%.2f", F.rand(25) * 8000)).alias("total_charges"),
+    pick(26, yes_no).alias("churn")))
+
+def python_worker_cpu_seconds():
+  #pyspark.daemon forks the python workers: the exited workers are accounted in the daemon children times
+  total = 0.0
+  for p in psutil.process_iter(["cmdline"]):
+    try:
+      if "pyspark.daemon" in " ".join(p.info["cmdline"] or []):
+        t = p.cpu_times()
+        total += t.user + t.system + t.children_user + t.children_system
+    except psutil.Error:
+      pass
+  return total
+
+def python_nodes(df):
+  plan = df._jdf.queryExecution().executedPlan().toString()
+  return sorted({node for node in ["ArrowEvalPython", "BatchEvalPython", "MapInPandas", "FlatMapGroupsInPandas"] if node in plan})
+
+# COMMAND ----------
+
+# DBTITLE 1,Parity with the previous implementation
+def assert_same_features(df, name):
+  expected, actual = [implementations[i](df) for i in implementations]
+  assert [(f.name, f.dataType) for f in expected.schema] == [(f.name, f.dataType) for f in actual.schema], f"{name}: schema differs"
+  assert expected.exceptAll(actual).count() == 0 and actual.exceptAll(expected).count() == 0, f"{name}: rows differ"
+  print(f"{name}: same features")
+
+assert_same_features(bronze_rows(100000), "synthetic bronze rows")
+if spark.catalog.tableExists("advanced_churn_bronze_customers"):
+  assert_same_features(spark.table("advanced_churn_bronze_customers"), "advanced_churn_bronze_customers")
+
+# COMMAND ----------
+
+# DBTITLE 1,Benchmark
+rows = bronze_rows(num_rows).cache()
+rows.count()
+
+results = []
+for name, transform in implementations.items():
+  features = transform(rows)
+  cpu_start, start = python_worker_cpu_seconds(), time.time()
+  features.write.format("noop").mode("overwrite").save()
+  duration, python_cpu = time.time() - start, python_worker_cpu_seconds() - cpu_start
+  results.append({"implementation": name, "rows": num_rows, "python_nodes": ", ".join(python_nodes(features)),
+                  "seconds": round(duration, 2), "python_worker_cpu_seconds": round(python_cpu, 2), "rows_per_sec": int(num_rows / duration)})
+
+rows.unpersist()
+display(pd.DataFrame(results))
@@ -35,6 +35,22 @@
         "title":  "Setup",
         "description": "Init data for demo."
       },
+      {
+        "path": "_resources/01-churn-features",
+        "pre_run": False,
+        "publish_on_website": False,
+        "add_cluster_setup_cell": False,
+        "title":  "Churn features",
+        "description": "Churn cleaning and service features as native Spark expressions."
+      },
+      {
+        "path": "_resources/02-churn-features-benchmark",
+        "pre_run": False,
+        "publish_on_website": False,
+        "add_cluster_setup_cell": False,
+        "title":  "Churn features benchmark",
+        "description": "Parity and python worker time of the native Spark churn features vs the pandas UDF / pandas on Spark version."
+      },
       {
         "path": "01-mlops-quickstart/00_mlops_end2end_quickstart_presentation", 
         "pre_run": True, 
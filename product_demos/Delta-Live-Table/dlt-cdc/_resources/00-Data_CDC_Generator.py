@@ -32,45 +32,106 @@ volume_folder =  f"/Volumes/{catalog}/{db}/{volume_name}"
 
 # COMMAND ----------
 
+# DBTITLE 1,Generator engines
+# "udf": one row-at-a-time python UDF call per Faker column (original engine)
+# "vectorized": Faker values are precomputed in pools and sampled by index in Arrow pandas_udf batches, other columns are native spark expressions
+dbutils.widgets.dropdown("generator_engine", "udf", ["udf", "vectorized"], "Generator engine")
+generator_engine = dbutils.widgets.get("generator_engine")
+
+from pyspark.sql import functions as F
+from faker import Faker
+from collections import OrderedDict 
+from datetime import datetime
+import uuid
+import numpy as np
+import pandas as pd
+fake = Faker()
+import random
+
+operations = OrderedDict([("APPEND", 0.5),("DELETE", 0.1),("UPDATE", 0.3),(None, 0.01)])
+
+# Row-at-a-time engine
+fake_firstname = F.udf(fake.first_name)
+fake_lastname = F.udf(fake.last_name)
+fake_email = F.udf(fake.ascii_company_email)
+fake_date = F.udf(lambda:fake.date_time_this_month().strftime("%m-%d-%Y %H:%M:%S"))
+fake_address = F.udf(fake.address)
+fake_operation = F.udf(lambda:fake.random_elements(elements=operations, length=1)[0])
+fake_id = F.udf(lambda: str(uuid.uuid4()) if random.uniform(0, 1) < 0.98 else None)
+
+# Vectorized engine
+def fake_pool(fake_fn, pool_size=10000):
+  """pandas_udf sampling a pool of pre-generated Faker values: one numpy indexing per Arrow batch instead of one Faker call per row."""
+  pool = np.array([fake_fn() for _ in range(pool_size)], dtype=object)
+  @F.pandas_udf("string")
+  def sample_pool(batch: pd.Series) -> pd.Series:
+    return pd.Series(pool[np.random.randint(0, len(pool), len(batch))])
+  sample_pool = sample_pool.asNondeterministic()
+  return lambda: sample_pool(F.lit(0))
+
+def native_date():
+  # Same range as Faker's date_time_this_month: from the beginning of the month to now
+  now = datetime.now()
+  month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+  return lambda: F.date_format(F.timestamp_seconds(F.lit(month_start.timestamp()) + F.rand() * (now - month_start).total_seconds()), "MM-dd-yyyy HH:mm:ss")
+
+def native_operation():
+  # Weighted choice with the same (normalized) weights as fake.random_elements
+  def operation_col():
+    draw = F.rand() * sum(operations.values())
+    op, threshold = None, 0
+    for operation, weight in operations.items():
+      threshold += weight
+      if operation is not None:
+        op = op.when(draw < threshold, operation) if op is not None else F.when(draw < threshold, operation)
+    return op
+  return operation_col
+
+engines = {}
+def get_engine(engine):
+  if engine in engines:
+    return engines[engine]
+  if engine == "vectorized":
+    engines[engine] = {"firstname": fake_pool(fake.first_name), "lastname": fake_pool(fake.last_name), "email": fake_pool(fake.ascii_company_email),
+                       "address": fake_pool(fake.address), "date": native_date(), "operation": native_operation(),
+                       "id": lambda: F.when(F.rand() < 0.98, F.expr("uuid()"))}
+  else:
+    engines[engine] = {"firstname": fake_firstname, "lastname": fake_lastname, "email": fake_email, "address": fake_address,
+                       "date": fake_date, "operation": fake_operation, "id": fake_id}
+  return engines[engine]
+
+def generate_customers(num_rows=100000, engine="udf"):
+  fake_col = get_engine(engine)
+  df = spark.range(0, num_rows).repartition(100)
+  df = df.withColumn("id", fake_col["id"]())
+  df = df.withColumn("firstname", fake_col["firstname"]())
+  df = df.withColumn("lastname", fake_col["lastname"]())
+  df = df.withColumn("email", fake_col["email"]())
+  df = df.withColumn("address", fake_col["address"]())
+  df = df.withColumn("operation", fake_col["operation"]())
+  return df.withColumn("operation_date", fake_col["date"]())
+
+def generate_transactions(customers_df, num_rows=10000, engine="udf"):
+  fake_col = get_engine(engine)
+  df = spark.range(0, num_rows).repartition(20)
+  df = df.withColumn("id", fake_col["id"]())
+  df = df.withColumn("transaction_date", fake_col["date"]())
+  df = df.withColumn("amount", F.round(F.rand()*1000))
+  df = df.withColumn("item_count", F.round(F.rand()*10))
+  df = df.withColumn("operation", fake_col["operation"]())
+  df = df.withColumn("operation_date", fake_col["date"]())
+  #Join with the customer to get the same IDs generated.
+  return df.withColumn("t_id", F.monotonically_increasing_id()).join(customers_df.select("id").withColumnRenamed("id", "customer_id").withColumn("t_id", F.monotonically_increasing_id()), "t_id").drop("t_id")
+
+# COMMAND ----------
+
 try:
   dbutils.fs.ls(volume_folder+"/transactions")
   dbutils.fs.ls(volume_folder+"/customers")
 except:  
   print(f"folder doesn't exists, generating the data under {volume_folder}...")
-  from pyspark.sql import functions as F
-  from faker import Faker
-  from collections import OrderedDict 
-  import uuid
-  fake = Faker()
-  import random
-
-
-  fake_firstname = F.udf(fake.first_name)
-  fake_lastname = F.udf(fake.last_name)
-  fake_email = F.udf(fake.ascii_company_email)
-  fake_date = F.udf(lambda:fake.date_time_this_month().strftime("%m-%d-%Y %H:%M:%S"))
-  fake_address = F.udf(fake.address)
-  operations = OrderedDict([("APPEND", 0.5),("DELETE", 0.1),("UPDATE", 0.3),(None, 0.01)])
-  fake_operation = F.udf(lambda:fake.random_elements(elements=operations, length=1)[0])
-  fake_id = F.udf(lambda: str(uuid.uuid4()) if random.uniform(0, 1) < 0.98 else None)
-
-  df = spark.range(0, 100000).repartition(100)
-  df = df.withColumn("id", fake_id())
-  df = df.withColumn("firstname", fake_firstname())
-  df = df.withColumn("lastname", fake_lastname())
-  df = df.withColumn("email", fake_email())
-  df = df.withColumn("address", fake_address())
-  df = df.withColumn("operation", fake_operation())
-  df_customers = df.withColumn("operation_date", fake_date())
+  df_customers = generate_customers(100000, generator_engine)
   df_customers.repartition(100).write.format("json").mode("overwrite").save(volume_folder+"/customers")
 
-  df = spark.range(0, 10000).repartition(20)
-  df = df.withColumn("id", fake_id())
-  df = df.withColumn("transaction_date", fake_date())
-  df = df.withColumn("amount", F.round(F.rand()*1000))
-  df = df.withColumn("item_count", F.round(F.rand()*10))
-  df = df.withColumn("operation", fake_operation())
-  df = df.withColumn("operation_date", fake_date())
-  #Join with the customer to get the same IDs generated.
-  df = df.withColumn("t_id", F.monotonically_increasing_id()).join(spark.read.json(volume_folder+"/customers").select("id").withColumnRenamed("id", "customer_id").withColumn("t_id", F.monotonically_increasing_id()), "t_id").drop("t_id")
+  df = generate_transactions(spark.read.json(volume_folder+"/customers"), 10000, generator_engine)
   df.repartition(10).write.format("json").mode("overwrite").save(volume_folder+"/transactions")
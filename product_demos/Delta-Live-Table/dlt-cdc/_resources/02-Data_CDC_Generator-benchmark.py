@@ -0,0 +1,28 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC # CDC generator benchmark
+# MAGIC
+# MAGIC Compare the throughput of the two engines of `00-Data_CDC_Generator`:
+# MAGIC
+# MAGIC - `udf`: one python UDF call per row and per Faker column
+# MAGIC - `vectorized`: Faker pools sampled by index in Arrow `pandas_udf` batches + native spark expressions
+# MAGIC
+# MAGIC Data is written with the `noop` format to only measure the generation.
+
+# COMMAND ----------
+
+# MAGIC %run ./00-Data_CDC_Generator
+
+# COMMAND ----------
+
+import time
+
+def bench(engine, num_rows):
+  get_engine(engine)  # build the engine (and the vectorized Faker pools) outside of the measure
+  start = time.time()
+  generate_customers(num_rows, engine).write.format("noop").mode("overwrite").save()
+  duration = time.time() - start
+  return {"engine": engine, "rows": num_rows, "seconds": round(duration, 2), "rows_per_sec": int(num_rows / duration)}
+
+results = [bench(engine, num_rows) for num_rows in [100000, 1000000] for engine in ["udf", "vectorized"]]
+display(pd.DataFrame(results))
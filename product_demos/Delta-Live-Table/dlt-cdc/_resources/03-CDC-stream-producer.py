@@ -0,0 +1,155 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC
+# MAGIC ### Continuous CDC event producer
+# MAGIC
+# MAGIC `00-Data_CDC_Generator` writes a single JSON dump. This notebook keeps appending micro-batches of APPEND/UPDATE/DELETE events into the same `customers` volume folder at a configurable rate, to load-test the `APPLY CHANGES` flow of the DLT pipeline under sustained throughput.
+# MAGIC
+# MAGIC - `events_per_sec`: target event rate
+# MAGIC - `key_reuse`: share of events updating/deleting an existing customer id (the others are new APPEND)
+# MAGIC - `key_skew`: zipf exponent used to pick the reused ids (0 = uniform, higher values concentrate the changes on a few hot keys)
+# MAGIC
+# MAGIC Each micro-batch is logged in the `cdc_stream_producer_log` table with its event time. Start the DLT pipeline in continuous mode first: while the producer runs, a background monitor polls `SCD2_customers` and records when each batch becomes visible, to report the event time to silver table latency.
+
+# COMMAND ----------
+
+# MAGIC %run ./00-Data_CDC_Generator
+
+# COMMAND ----------
+
+dbutils.widgets.text("events_per_sec", "1000", "Events per second")
+dbutils.widgets.text("key_reuse", "0.6", "Share of events on existing keys")
+dbutils.widgets.text("key_skew", "1.2", "Key reuse skew (zipf exponent, 0 = uniform)")
+dbutils.widgets.text("trigger_interval", "5", "Seconds between micro-batches")
+dbutils.widgets.text("duration_min", "10", "Producer duration (minutes)")
+
+events_per_sec = int(dbutils.widgets.get("events_per_sec"))
+key_reuse = float(dbutils.widgets.get("key_reuse"))
+key_skew = float(dbutils.widgets.get("key_skew"))
+trigger_interval = float(dbutils.widgets.get("trigger_interval"))
+duration_min = float(dbutils.widgets.get("duration_min"))
+
+# COMMAND ----------
+
+# DBTITLE 1,Micro-batch event generator
+import os
+import time
+
+class CDCEventProducer:
+  """Generates CDC micro-batches on the driver with numpy (Faker is only used to build the value pools) and appends them as JSON files to the volume."""
+  def __init__(self, folder, key_reuse=0.6, key_skew=1.2, pool_size=10000, max_keys=1000000, seed=None):
+    self.folder, self.key_reuse, self.key_skew, self.max_keys = folder, key_reuse, key_skew, max_keys
+    self.rng = np.random.default_rng(seed)
+    self.pools = {"firstname": fake.first_name, "lastname": fake.last_name, "email": fake.ascii_company_email, "address": fake.address}
+    self.pools = {col: np.array([fn() for _ in range(pool_size)], dtype=object) for col, fn in self.pools.items()}
+    # Start from the ids of the initial dump so that the first updates hit existing customers
+    self.keys = np.array([r["id"] for r in spark.read.json(folder).select("id").where("id is not null").limit(max_keys).collect()], dtype=object)
+    self.batch_id = 0
+
+  def _pick_keys(self, n):
+    if self.key_skew > 0:
+      idx = (self.rng.zipf(1 + self.key_skew, n) - 1) % len(self.keys)
+    else:
+      idx = self.rng.integers(0, len(self.keys), n)
+    return self.keys[idx]
+
+  def next_batch(self, num_events, event_time):
+    reused = self.rng.random(num_events) < self.key_reuse if len(self.keys) > 0 else np.zeros(num_events, dtype=bool)
+    new_keys = np.array([str(uuid.uuid4()) for _ in range(int((~reused).sum()))], dtype=object)
+    ids = np.empty(num_events, dtype=object)
+    ids[~reused] = new_keys
+    ids[reused] = self._pick_keys(int(reused.sum()))
+    # Existing keys get UPDATE/DELETE with the generator weights, new keys are APPEND
+    update_share = operations["UPDATE"] / (operations["UPDATE"] + operations["DELETE"])
+    operation = np.where(reused, np.where(self.rng.random(num_events) < update_share, "UPDATE", "DELETE"), "APPEND")
+    self.keys = np.concatenate([self.keys, new_keys])[-self.max_keys:]
+    pdf = pd.DataFrame({col: pool[self.rng.integers(0, len(pool), num_events)] for col, pool in self.pools.items()})
+    pdf["id"] = ids
+    pdf["operation"] = operation
+    # operation_date is the event time: it's the APPLY CHANGES sequence_by and is used to measure the end to end latency
+    # Hot keys can get several events in the same batch: 1 microsecond per event keeps the sequence strictly increasing within the batch
+    event_times = pd.Timestamp(event_time) + pd.to_timedelta(np.arange(num_events), unit="us")
+    pdf["operation_date"] = event_times.strftime("%m-%d-%Y %H:%M:%S.%f")
+    return pdf
+
+  def write_batch(self, pdf):
+    # Write a hidden temp file and rename it so that autoloader never picks a partially written file
+    path = f"{self.folder}/stream-{int(time.time())}-{self.batch_id:08d}.json"
+    tmp_path = f"{self.folder}/.{os.path.basename(path)}.tmp"
+    pdf.to_json(tmp_path, orient="records", lines=True)
+    os.rename(tmp_path, path)
+    self.batch_id += 1
+    return path
+
+# COMMAND ----------
+
+# DBTITLE 1,Event time to silver table latency monitor
+import threading
+
+# Poll the SCD2 table in the background while the producer runs, and record when each logged batch marker becomes visible
+def measure_latency(run_start, producer_done, target_table="SCD2_customers", timeout_sec=600, poll_interval=2):
+  seen = {}
+  deadline = None
+  while True:
+    log = spark.read.table("cdc_stream_producer_log").where(F.col("event_time") >= run_start)
+    markers = log.where(~F.col("batch_id").isin(list(seen.keys()))) if seen else log
+    found = spark.read.table(target_table) \
+                 .join(markers, (F.col("id") == F.col("marker_id")) & (F.col("__START_AT") == F.col("marker_operation_date"))) \
+                 .select("batch_id").collect()
+    now = datetime.now()
+    for r in found:
+      seen.setdefault(r["batch_id"], now)
+    if producer_done.is_set():
+      deadline = deadline or time.time() + timeout_sec
+      if len(seen) >= log.count() or time.time() > deadline:
+        break
+    time.sleep(poll_interval)
+  latency = log.toPandas()
+  latency["visible_time"] = latency["batch_id"].map(seen)
+  latency["latency_sec"] = (latency["visible_time"] - latency["event_time"]).dt.total_seconds()
+  return latency
+
+# COMMAND ----------
+
+# DBTITLE 1,Run the producer at the target rate
+spark.sql("CREATE TABLE IF NOT EXISTS cdc_stream_producer_log (batch_id LONG, event_time TIMESTAMP, num_events LONG, marker_id STRING, marker_operation_date STRING, generation_ms DOUBLE)")
+
+producer = CDCEventProducer(volume_folder+"/customers", key_reuse, key_skew)
+events_per_batch = int(events_per_sec * trigger_interval)
+
+run_start = datetime.now()
+producer_done = threading.Event()
+latency_result = {}
+monitor = threading.Thread(target=lambda: latency_result.update(latency=measure_latency(run_start, producer_done)))
+monitor.start()
+
+end_time = time.time() + duration_min * 60
+next_trigger = time.time()
+while time.time() < end_time:
+  event_time = datetime.now()
+  start = time.time()
+  pdf = producer.next_batch(events_per_batch, event_time)
+  producer.write_batch(pdf)
+  generation_ms = (time.time() - start) * 1000
+  # The last APPEND/UPDATE of the batch is used as latency marker: it'll be visible in SCD2_customers with __START_AT = operation_date
+  markers = pdf[pdf["operation"] != "DELETE"]
+  if len(markers) > 0:
+    marker = markers.iloc[-1]
+    spark.createDataFrame([(producer.batch_id - 1, event_time, events_per_batch, marker["id"], marker["operation_date"], generation_ms)], "batch_id long, event_time timestamp, num_events long, marker_id string, marker_operation_date string, generation_ms double") \
+         .write.mode("append").saveAsTable("cdc_stream_producer_log")
+  else:
+    print(f"Batch {producer.batch_id - 1} only contains DELETE events: no latency marker for this batch")
+  next_trigger += trigger_interval
+  if next_trigger < time.time():
+    print(f"Producer is late by {time.time() - next_trigger:.1f}s, can't sustain {events_per_sec} events/sec")
+  else:
+    time.sleep(next_trigger - time.time())
+producer_done.set()
+
+# COMMAND ----------
+
+# DBTITLE 1,Latency report (waits for the pipeline to catch up)
+monitor.join()
+latency = latency_result["latency"]
+display(latency)
+display(latency["latency_sec"].describe(percentiles=[.5, .9, .99]).to_frame())
@@ -34,6 +34,22 @@
       "title":  "CDC data generator", 
       "description": "Generate data for the pipeline."
     },
+    {
+      "path": "_resources/02-Data_CDC_Generator-benchmark", 
+      "pre_run": False, 
+      "publish_on_website": False, 
+      "add_cluster_setup_cell": False,
+      "title":  "CDC data generator benchmark", 
+      "description": "Throughput of the udf vs vectorized generator engines."
+    },
+    {
+      "path": "_resources/03-CDC-stream-producer", 
+      "pre_run": False, 
+      "publish_on_website": False, 
+      "add_cluster_setup_cell": False,
+      "title":  "Continuous CDC producer", 
+      "description": "Append CDC micro-batches at a configurable rate and measure the end to end latency."
+    },
     {
       "path": "_resources/01-load-data-quality-dashboard", 
       "pre_run": False, 
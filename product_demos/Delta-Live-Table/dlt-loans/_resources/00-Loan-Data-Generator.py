@@ -1,5 +1,5 @@
 # Databricks notebook source
-# MAGIC %pip install iso3166 Faker
+# MAGIC %pip install iso3166
 
 # COMMAND ----------
 
@@ -29,6 +29,7 @@ dbutils.widgets.combobox('reset_all_data', 'false', ['true', 'false'], 'Reset al
 dbutils.widgets.combobox('batch_wait', '30', ['15', '30', '45', '60'], 'Speed (secs between writes)')
 dbutils.widgets.combobox('num_recs', '10000', ['5000', '10000', '20000'], 'Volume (# records per writes)')
 dbutils.widgets.combobox('batch_count', '1', ['1', '100', '200', '500'], 'Write count (how many times do we append data)')
+dbutils.widgets.combobox('target_rows_per_sec', '0', ['0', '1000', '10000', '100000'], 'Target rows/sec (0: use the secs between writes)')
 
 # COMMAND ----------
 
@@ -75,61 +76,54 @@ cleanup_folder(output_path+'/ref_accounting_treatment')
 
 # COMMAND ----------
 
-from faker import Faker
 from collections import OrderedDict 
+from datetime import datetime, timedelta
+from iso3166 import countries
 import pyspark.sql.functions as F
-import uuid
-import random
-
-fake = Faker()
-base_rates = OrderedDict([("ZERO", 0.5),("UKBRBASE", 0.1),("FDTR", 0.3),(None, 0.01)])
-base_rate = F.udf(lambda:fake.random_elements(elements=base_rates, length=1)[0])
-fake_country_code = F.udf(fake.country_code)
-
-fake_date = F.udf(lambda:fake.date_time_between(start_date="-2y", end_date="+0y").strftime("%m-%d-%Y %H:%M:%S"))
-fake_date_future = F.udf(lambda:fake.date_time_between(start_date="+0y", end_date="+2y").strftime("%m-%d-%Y %H:%M:%S"))
-fake_date_current = F.udf(lambda:fake.date_time_this_month().strftime("%m-%d-%Y %H:%M:%S"))
-def random_choice(enum_list):
-  return F.udf(lambda:random.choice(enum_list))
-
-fake.date_time_between(start_date="-10y", end_date="+30y")
-
-def generate_transactions(num, folder, file_count, mode):
-  (spark.range(0,num)
-  .withColumn("acc_fv_change_before_taxes", (F.rand()*1000+100).cast('int'))
-  .withColumn("purpose", (F.rand()*1000+100).cast('int'))
-
-  .withColumn("accounting_treatment_id", (F.rand()*6).cast('int'))
-  .withColumn("accrued_interest", (F.rand()*100+100).cast('int'))
-  .withColumn("arrears_balance", (F.rand()*100+100).cast('int'))
-  .withColumn("base_rate", base_rate())
-  .withColumn("behavioral_curve_id", (F.rand()*6).cast('int'))
-  .withColumn("cost_center_code", fake_country_code())
-  .withColumn("country_code", fake_country_code())
-  .withColumn("date", fake_date())
-  .withColumn("end_date", fake_date_future())
-  .withColumn("next_payment_date", fake_date_current())
-  .withColumn("first_payment_date", fake_date_current())
-  .withColumn("last_payment_date", fake_date_current())
-  .withColumn("behavioral_curve_id", (F.rand()*6).cast('int'))
-  .withColumn("count", (F.rand()*500).cast('int'))
-  .withColumn("arrears_balance", (F.rand()*500).cast('int'))
-  .withColumn("balance", (F.rand()*500-30).cast('int'))
-  .withColumn("imit_amount", (F.rand()*500).cast('int'))
-  .withColumn("minimum_balance_eur", (F.rand()*500).cast('int'))
-  .withColumn("type", random_choice([
-          "bonds","call","cd","credit_card","current","depreciation","internet_only","ira",
-          "isa","money_market","non_product","deferred","expense","income","intangible","prepaid_card",
-          "provision","reserve","suspense","tangible","non_deferred","retail_bonds","savings",
-          "time_deposit","vostro","other","amortisation"
-        ])())
-  .withColumn("status", random_choice(["active", "cancelled", "cancelled_payout_agreed", "transactional", "other"])())
-  .withColumn("guarantee_scheme", random_choice(["repo", "covered_bond", "derivative", "none", "other"])())
-  .withColumn("encumbrance_type", random_choice(["be_pf", "bg_dif", "hr_di", "cy_dps", "cz_dif", "dk_gdfi", "ee_dgs", "fi_dgf", "fr_fdg",  "gb_fscs",
-                                                 "de_edb", "de_edo", "de_edw", "gr_dgs", "hu_ndif", "ie_dgs", "it_fitd", "lv_dgf", "lt_vi",
-                                                 "lu_fgdl", "mt_dcs", "nl_dgs", "pl_bfg", "pt_fgd", "ro_fgdb", "sk_dpf", "si_dgs", "es_fgd",
-                                                 "se_ndo", "us_fdic"])())
-  .withColumn("purpose", random_choice(['admin','annual_bonus_accruals','benefit_in_kind','capital_gain_tax','cash_management','cf_hedge','ci_service',
+
+# Declarative column specs. Each spec is compiled into a native spark expression (rand() indexed into arrays, timestamp arithmetic):
+# the generation never leaves the JVM, no python worker is involved.
+def int_between(low, high):
+  return {"kind": "int_between", "low": low, "high": high}
+
+def categorical(values, weights=None):
+  """Random value from the list, uniform or with the given weights (a None value generates nulls)."""
+  return {"kind": "categorical", "values": list(values), "weights": weights}
+
+def timestamp_between(start, end, fmt="MM-dd-yyyy HH:mm:ss"):
+  """Random timestamp between two datetimes, formatted as a string."""
+  return {"kind": "timestamp_between", "start": start, "end": end, "fmt": fmt}
+
+def compile_column(spec):
+  if spec["kind"] == "int_between":
+    return (F.rand()*(spec["high"]-spec["low"])+spec["low"]).cast('int')
+  if spec["kind"] == "categorical":
+    values, weights = spec["values"], spec["weights"]
+    if weights is None:
+      return F.element_at(F.array(*[F.lit(v) for v in values]), (F.rand()*len(values)).cast('int')+1)
+    # Weighted choice: compare one draw to the cumulative (normalized) weights
+    draw = F.rand()*sum(weights)
+    col, threshold = None, 0
+    for value, weight in zip(values, weights):
+      threshold += weight
+      col = F.when(draw < threshold, F.lit(value)) if col is None else col.when(draw < threshold, F.lit(value))
+    return col
+  if spec["kind"] == "timestamp_between":
+    start, end = spec["start"].timestamp(), spec["end"].timestamp()
+    return F.date_format(F.timestamp_seconds(F.lit(start) + F.rand()*(end-start)), spec["fmt"])
+  raise ValueError(f"Unknown column spec {spec}")
+
+def compile_spec(spec):
+  return [compile_column(col_spec).alias(name) for name, col_spec in spec.items()]
+
+def transaction_spec():
+  # Dates are relative to now, the spec is rebuilt for each batch
+  now = datetime.now()
+  month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+  country_codes = [c.alpha2 for c in countries]
+  return OrderedDict([
+    ("acc_fv_change_before_taxes", int_between(100, 1100)),
+    ("purpose", categorical(['admin','annual_bonus_accruals','benefit_in_kind','capital_gain_tax','cash_management','cf_hedge','ci_service',
                     'clearing','collateral','commitments','computer_and_it_cost','corporation_tax','credit_card_fee','critical_service','current_account_fee',
                     'custody','employee_stock_option','dealing_revenue','dealing_rev_deriv','dealing_rev_deriv_nse','dealing_rev_fx','dealing_rev_fx_nse',
                     'dealing_rev_sec','dealing_rev_sec_nse','deposit','derivative_fee','dividend','div_from_cis','div_from_money_mkt','donation','employee',
@@ -140,19 +134,72 @@ def generate_transactions(num, folder, file_count, mode):
                     'operational_excess','operational_escrow','other','other_expenditure','other_fs_fee','other_non_fs_fee','other_social_contrib',
                     'other_staff_rem','other_staff_cost','overdraft_fee','own_property','pension','ppe','prime_brokerage','property','recovery',
                     'redundancy_pymt','reference','reg_loss','regular_wages','release','rent','restructuring','retained_earnings','revaluation',
-                    'revenue_reserve','share_plan','staff','system','tax','unsecured_loan_fee','write_off'])())
-  ).repartition(file_count).write.format('json').mode(mode).save(folder)
-  cleanup_folder(output_path+'/raw_transactions')
+                    'revenue_reserve','share_plan','staff','system','tax','unsecured_loan_fee','write_off'])),
+    ("accounting_treatment_id", int_between(0, 6)),
+    ("accrued_interest", int_between(100, 200)),
+    ("arrears_balance", int_between(0, 500)),
+    ("base_rate", categorical(["ZERO", "UKBRBASE", "FDTR", None], [0.5, 0.1, 0.3, 0.01])),
+    ("behavioral_curve_id", int_between(0, 6)),
+    ("cost_center_code", categorical(country_codes)),
+    ("country_code", categorical(country_codes)),
+    ("date", timestamp_between(now - timedelta(days=2*365), now)),
+    ("end_date", timestamp_between(now, now + timedelta(days=2*365))),
+    ("next_payment_date", timestamp_between(month_start, now)),
+    ("first_payment_date", timestamp_between(month_start, now)),
+    ("last_payment_date", timestamp_between(month_start, now)),
+    ("count", int_between(0, 500)),
+    ("balance", int_between(-30, 470)),
+    ("imit_amount", int_between(0, 500)),
+    ("minimum_balance_eur", int_between(0, 500)),
+    ("type", categorical([
+          "bonds","call","cd","credit_card","current","depreciation","internet_only","ira",
+          "isa","money_market","non_product","deferred","expense","income","intangible","prepaid_card",
+          "provision","reserve","suspense","tangible","non_deferred","retail_bonds","savings",
+          "time_deposit","vostro","other","amortisation"
+        ])),
+    ("status", categorical(["active", "cancelled", "cancelled_payout_agreed", "transactional", "other"])),
+    ("guarantee_scheme", categorical(["repo", "covered_bond", "derivative", "none", "other"])),
+    ("encumbrance_type", categorical(["be_pf", "bg_dif", "hr_di", "cy_dps", "cz_dif", "dk_gdfi", "ee_dgs", "fi_dgf", "fr_fdg",  "gb_fscs",
+                                      "de_edb", "de_edo", "de_edw", "gr_dgs", "hu_ndif", "ie_dgs", "it_fitd", "lv_dgf", "lt_vi",
+                                      "lu_fgdl", "mt_dcs", "nl_dgs", "pl_bfg", "pt_fgd", "ro_fgdb", "sk_dpf", "si_dgs", "es_fgd",
+                                      "se_ndo", "us_fdic"]))
+  ])
+
+def generate_transactions(num, folder, file_count, mode, cleanup=True):
+  spark.range(0,num).select("id", *compile_spec(transaction_spec())) \
+       .repartition(file_count).write.format('json').mode(mode).save(folder)
+  if cleanup:
+    cleanup_folder(output_path+'/raw_transactions')
   
 generate_transactions(10000, output_path+'/raw_transactions', 10, "overwrite")
 
 # COMMAND ----------
 
 import time
+from concurrent.futures import ThreadPoolExecutor
+
+def write_batches(batch_count, num_recs, batch_wait, target_rows_per_sec=0, max_in_flight=2):
+  """Append batch_count batches of num_recs transactions.
+  Batches are submitted to a thread pool so that batch N+1 is generated while batch N is being written (up to max_in_flight concurrent writes).
+  Writes are scheduled every batch_wait seconds, or every num_recs/target_rows_per_sec seconds when a target rate is set.
+  The _committed/_started files are cleaned once at the end instead of after each batch."""
+  interval = num_recs / target_rows_per_sec if target_rows_per_sec > 0 else batch_wait
+  start = time.time()
+  with ThreadPoolExecutor(max_in_flight) as pool:
+    in_flight = []
+    for i in range(batch_count):
+      if batch_count > 1:
+        time.sleep(max(0, start + i * interval - time.time()))
+      if len(in_flight) >= max_in_flight:
+        in_flight.pop(0).result()
+      in_flight.append(pool.submit(generate_transactions, num_recs, output_path+'/raw_transactions', 1, "append", False))
+      print(f'Submitted batch: {i}')
+    for f in in_flight:
+      f.result()
+  cleanup_folder(output_path+'/raw_transactions')
+  duration = time.time() - start
+  print(f'Finished writing {batch_count} batches, {batch_count*num_recs} rows in {duration:.1f}s ({batch_count*num_recs/duration:.0f} rows/sec)')
+
 batch_count = int(dbutils.widgets.get('batch_count'))
 assert batch_count <= 500, "please don't go above 500 writes, the generator will run for a too long time"
-for i in range(0, int(dbutils.widgets.get('batch_count'))):
-  if batch_count > 1:
-    time.sleep(int(dbutils.widgets.get('batch_wait')))
-  generate_transactions(int(dbutils.widgets.get('num_recs')), output_path+'/raw_transactions', 1, "append")
-  print(f'Finished writing batch: {i}')
+write_batches(batch_count, int(dbutils.widgets.get('num_recs')), int(dbutils.widgets.get('batch_wait')), int(dbutils.widgets.get('target_rows_per_sec')))
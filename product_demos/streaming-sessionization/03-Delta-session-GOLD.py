@@ -27,59 +27,27 @@
 # MAGIC ### Implementing the aggregation function to update our Session
 # MAGIC
 # MAGIC In this simple example, we'll just be counting the number of click in the session.
+# MAGIC
+# MAGIC The state function `func` is defined in the [_resources/01-session-functions]($./_resources/01-session-functions) notebook: for each user, it keeps the click count and the session start/end in the state, and sets a 30 seconds timeout to close the session.
+# MAGIC
+# MAGIC With a high number of active users, you can switch `sessionization_mode` to `session_window`: the sessions are then computed with a native `session_window` aggregation and emitted when they close, with a state bounded by the watermark (see `_resources/02-sessionization-benchmark`).
 
 # COMMAND ----------
 
-from typing import Tuple, Iterator
-from pyspark.sql.streaming.state import GroupState, GroupStateTimeout
+dbutils.widgets.dropdown("sessionization_mode", "applyInPandasWithState", ["applyInPandasWithState", "session_window"], "Sessionization implementation")
+dbutils.widgets.dropdown("sessions_sink_mode", "merge", ["merge", "compacted"], "Sessions MERGE sink")
+dbutils.widgets.dropdown("sessions_clustering", "none", ["none", "liquid", "zorder"], "Sessions table clustering (compacted sink)")
 
-DBDemos.wait_for_table("events") #Wait until the previous table is created to avoid error if all notebooks are started at once
+# COMMAND ----------
 
+# MAGIC %run ./_resources/01-session-functions
 
-#If we don't have activity after 30sec, close the session
-max_session_duration = 30000
-def func(
-    key: Tuple[str], events: Iterator[pd.DataFrame], state: GroupState
-) -> Iterator[pd.DataFrame]:
-  (user_id,) = key
-  print(user_id)
-  if state.exists:
-    (user_id, click_count, start_time, end_time) = state.get
-  else:
-    click_count = 0
-    start_time = sys.maxsize
-    end_time = 0
-  state.getOption
-  if state.hasTimedOut:
-    #Drop the session from the state and emit a final offline session update (end of the session)
-    state.remove() 
-    yield pd.DataFrame({"user_id": [user_id], "click_count": [click_count], "start_time": [start_time], "end_time": [end_time],  "status": ["offline"]})
-  else:
-    # as we can receive out-of-order events, we need to get the min/max date and the sum
-    for df in events:
-      start_time = min(start_time, df['event_date'].min())
-      end_time = max(df['event_date'].max(), end_time)
-      click_count += len(df)
-    #update the state with the new values
-    state.update((user_id, int(click_count), int(start_time), int(end_time)))
-    # Set the timeout as max_session_duration seconds.
-    state.setTimeoutDuration(max_session_duration)
-    #compute the status to flag offline session in case of restart
-    now = int(time.time())
-    status = "offline" if end_time >= now - max_session_duration else "online"
-    #emit the change. We could also yield an empty dataframe if we only want to emit when the session is closed: yield pd.DataFrame()
-    yield pd.DataFrame({"user_id": [user_id], "click_count": [click_count], "start_time": [start_time], "end_time": [end_time],  "status": [status]})
-
-
-output_schema = "user_id STRING, click_count LONG, start_time LONG, end_time LONG, status STRING"
-state_schema = "user_id STRING, click_count LONG, start_time LONG, end_time LONG"
-
-sessions = spark.readStream.table("events").groupBy(F.col("user_id")).applyInPandasWithState(
-    func,
-    output_schema,
-    state_schema,
-    "append",
-    GroupStateTimeout.ProcessingTimeTimeout)
+# COMMAND ----------
+
+DBDemos.wait_for_table("events") #Wait until the previous table is created to avoid error if all notebooks are started at once
+
+sessionization_mode = dbutils.widgets.get("sessionization_mode")
+sessions = sessionize(spark.readStream.table("events"), sessionization_mode)
 
 display(sessions, checkpointLocation = get_chkp_folder())
 
@@ -96,22 +64,62 @@ display(sessions, checkpointLocation = get_chkp_folder())
 # MAGIC - if it exists, we update it with the new count and potential new status
 # MAGIC
 # MAGIC This can easily be done with a MERGE operation using Delta and calling `foreachBatch`
+# MAGIC
+# MAGIC With a high number of users, use the `compacted` sink mode: each batch is first collapsed to the latest row per `user_id`, the `sessions` table can be clustered by `user_id` (liquid clustering or periodic Z-order) so that the MERGE only rewrites the files of the updated users, and the timing and metrics of every MERGE are saved in the `sessions_merge_metrics` table.
 
 # COMMAND ----------
 
 from delta.tables import DeltaTable
+from pyspark.sql.window import Window
+
+sessions_sink_mode = dbutils.widgets.get("sessions_sink_mode")
+sessions_clustering = dbutils.widgets.get("sessions_clustering")
+#The session_window implementation can emit several sessions for the same user in a batch: the batch must be compacted before the MERGE
+if sessionization_mode == "session_window":
+  sessions_sink_mode = "compacted"
+
+def latest_session_per_user(df):
+  #Keep only the most recent update of each user in the batch: the MERGE then touches each user row once
+  w = Window.partitionBy("user_id").orderBy(F.desc("end_time"), F.desc("click_count"))
+  return df.withColumn("rank", F.row_number().over(w)).where("rank = 1").drop("rank")
+
+def create_sessions_table(df):
+  df.limit(0).write.option('mergeSchema', 'true').mode('append').saveAsTable('sessions')
+  if sessions_clustering == "liquid":
+    #Liquid clustering on user_id: the MERGE only rewrites the files containing the updated users
+    spark.sql("ALTER TABLE sessions CLUSTER BY (user_id)")
 
 def upsert_sessions(df, epoch_id):
   #Create the table if it's the first time (we need it to be able to perform the merge)
   if epoch_id == 0 and not spark._jsparkSession.catalog().tableExists('sessions'):
-    df.limit(0).write.option('mergeSchema', 'true').mode('append').saveAsTable('sessions')
+    create_sessions_table(df)
 
+  if sessions_sink_mode == "compacted":
+    df = latest_session_per_user(df)
+  start = time.time()
   (DeltaTable.forName(spark, "sessions").alias("s").merge(
     source = df.alias("u"),
     condition = "s.user_id = u.user_id")
   .whenMatchedUpdateAll()
   .whenNotMatchedInsertAll()
   .execute())
+
+  if sessions_sink_mode == "compacted":
+    merge_ms = int((time.time() - start) * 1000)
+    #track the metrics first: they're read from the last commit, which must be the MERGE and not the OPTIMIZE
+    track_merge_metrics(epoch_id, merge_ms)
+    if sessions_clustering == "zorder" and epoch_id > 0 and epoch_id % 50 == 0:
+      spark.sql("OPTIMIZE sessions ZORDER BY (user_id)")
+
+def track_merge_metrics(epoch_id, merge_ms):
+  #Save the MERGE metrics of each epoch to follow the merge cost as the sessions table grows
+  metrics = DeltaTable.forName(spark, "sessions").history(1).select("version", "operationMetrics").first()
+  op = metrics["operationMetrics"] or {}
+  spark.createDataFrame([(epoch_id, metrics["version"], merge_ms,
+                          int(op.get("numSourceRows", 0)), int(op.get("numTargetRowsUpdated", 0)), int(op.get("numTargetRowsInserted", 0)),
+                          int(op.get("numTargetFilesRemoved", 0)), int(op.get("numTargetFilesAdded", 0)))],
+                        "epoch_id long, version long, merge_ms long, source_rows long, rows_updated long, rows_inserted long, files_removed long, files_added long") \
+       .write.mode("append").saveAsTable("sessions_merge_metrics")
   
 (sessions.writeStream
   .option("checkpointLocation", volume_folder+"/checkpoints/sessions")
@@ -1,5 +1,10 @@
 # Databricks notebook source
 dbutils.widgets.text("produce_time_sec", "300", "How long we'll produce data (sec)")
+dbutils.widgets.dropdown("producer_mode", "demo", ["demo", "high_throughput"], "Producer mode")
+dbutils.widgets.dropdown("sink", "kafka", ["kafka", "file"], "Sink")
+dbutils.widgets.dropdown("simulation_engine", "demo", ["demo", "numpy"], "User simulation engine")
+dbutils.widgets.text("concurrent_users", "0", "Concurrent users (numpy engine, 0: 2 new users/sec)")
+dbutils.widgets.text("file_sink_path", "/Volumes/main__build/dbdemos_streaming_sessionization/raw_data/producer_sink", "File sink path (sink=file)")
 
 # COMMAND ----------
 
@@ -10,6 +15,14 @@ dbutils.widgets.text("produce_time_sec", "300", "How long we'll produce data (se
 # MAGIC
 # MAGIC Run all the cells, once. Currently requires to run on a cluster with instance profile allowing kafka connection (one-env, aws).
 # MAGIC
+# MAGIC Producer modes:
+# MAGIC - `demo`: flush after every event and print each delivery report (easy to follow, ~1 round-trip per message)
+# MAGIC - `high_throughput`: leverage librdkafka batching (`linger.ms`, `batch.num.messages`, compression), aggregate the delivery reports in counters and only flush at shutdown. The sustained messages/sec is reported at the end.
+# MAGIC
+# MAGIC Set `sink` to `file` to test the producer without kafka: messages are appended as json lines under `file_sink_path`.
+# MAGIC
+# MAGIC The `numpy` simulation engine keeps the users state in numpy arrays and draws the clicks & events of all the users at once, to simulate 100k+ concurrent users (`concurrent_users`) and stress-test the sessionization downstream.
+# MAGIC
 # MAGIC <!-- Collect usage data (view). Remove it to disable collection or disable tracker during installation. View README for more details.  -->
 # MAGIC <img width="1px" src="https://ppxrzfxige.execute-api.us-west-2.amazonaws.com/v1/analytics?category=data-engineering&notebook=01-Delta-session-GOLD&demo_name=streaming-sessionization&event=VIEW">
 
@@ -22,17 +35,84 @@ dbutils.widgets.text("produce_time_sec", "300", "How long we'll produce data (se
 from confluent_kafka import Producer
 import json
 import random
+import time
 
 kafka_bootstrap_servers_tls = "b-1.oneenvkafka.fso631.c14.kafka.us-west-2.amazonaws.com:9094,b-2.oneenvkafka.fso631.c14.kafka.us-west-2.amazonaws.com:9094,b-3.oneenvkafka.fso631.c14.kafka.us-west-2.amazonaws.com:9094"
 #kafka_bootstrap_servers_tls = "<Replace by your own kafka servers>"
 # Also make sure to have the proper instance profile to allow the access if you're on AWS.
 
+producer_mode = dbutils.widgets.get("producer_mode")
+sink = dbutils.widgets.get("sink")
+
 conf = {
     'bootstrap.servers': kafka_bootstrap_servers_tls,
     'security.protocol': 'SSL'
 }
+if producer_mode == "high_throughput":
+    # Let librdkafka batch the messages instead of sending them one by one
+    conf.update({
+        'linger.ms': 50,
+        'batch.num.messages': 10000,
+        'compression.type': 'lz4',
+        'queue.buffering.max.messages': 1000000
+    })
+
+class FileSinkMessage:
+    """Minimal confluent_kafka Message (topic/partition/value) passed to the delivery callbacks of the file sink."""
+    def __init__(self, topic, value):
+        self._topic, self._value = topic, value
+
+    def topic(self):
+        return self._topic
+
+    def partition(self):
+        return 0
+
+    def value(self):
+        return self._value
 
-producer = Producer(conf)
+class FileSinkProducer:
+    """Kafka-compatible stand-in (produce/poll/flush) appending the messages as json lines to a file, to benchmark the producer without kafka."""
+    def __init__(self, folder, batch_size=10000):
+        import os
+        os.makedirs(folder, exist_ok=True)
+        self.path = f"{folder}/messages-{int(time.time())}.json"
+        self.batch_size = batch_size
+        self.buffer, self.callbacks = [], []
+
+    def produce(self, topic, value, callback=None):
+        self.buffer.append(value)
+        self.callbacks.append((callback, topic))
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def poll(self, timeout=0):
+        return 0
+
+    def flush(self, timeout=None):
+        if self.buffer:
+            with open(self.path, "a") as f:
+                f.write("\n".join(self.buffer) + "\n")
+            for (callback, topic), value in zip(self.callbacks, self.buffer):
+                if callback is not None:
+                    callback(None, FileSinkMessage(topic, value))
+            self.buffer, self.callbacks = [], []
+        return 0
+
+class DeliveryStats:
+    """Delivery report callback aggregating counters instead of printing every message."""
+    def __init__(self):
+        self.delivered, self.failed, self.last_error = 0, 0, None
+
+    def __call__(self, err, msg):
+        if err is not None:
+            self.failed += 1
+            self.last_error = err
+        else:
+            self.delivered += 1
+
+producer = FileSinkProducer(dbutils.widgets.get("file_sink_path")) if sink == "file" else Producer(conf)
+delivery_stats = DeliveryStats()
 
 def delivery_report(err, msg):
     """Callback for delivery reports."""
@@ -41,16 +121,29 @@ def delivery_report(err, msg):
     else:
         print(f"Message delivered to {msg.topic()} [{msg.partition()}]")
 
+def produce(event_json, topic):
+    if producer_mode == "demo":
+        producer.produce(topic, value=event_json, callback=delivery_report)
+        producer.poll(0)  # Trigger delivery report callbacks
+        return
+    while True:
+        try:
+            producer.produce(topic, value=event_json, callback=delivery_stats)
+            producer.poll(0)
+            return
+        except BufferError:
+            # Local queue is full: serve the delivery callbacks to free some room, then retry
+            producer.poll(0.1)
+
 def send_message(event, topic = 'dbdemos-sessions'):
     event_json = json.dumps(event)
-    producer.produce(topic, value=event_json, callback=delivery_report)
-    producer.poll(0)  # Trigger delivery report callbacks
+    produce(event_json, topic)
 
     # Simulate duplicate events to test deduplication
     if random.uniform(0, 1) > 0.96:
-        producer.produce(topic, value=event_json, callback=delivery_report)
-        producer.poll(0)
-    producer.flush()
+        produce(event_json, topic)
+    if producer_mode == "demo":
+        producer.flush()
 
 #send_message({"test": "toto"},  'test')
 
@@ -83,6 +176,63 @@ print(create_event(str(uuid.uuid4()), int(time.time())))
 
 # COMMAND ----------
 
+# DBTITLE 1,Vectorized user simulation engine
+import numpy as np
+import pandas as pd
+
+class UserSimulation:
+  """Simulated users held in numpy arrays (id, end_date). Each tick expires the users, draws the click mask of all the users with one call and generates the events in bulk."""
+  def __init__(self, user_creation_rate, user_max_duration_time, concurrent_users=0, click_probability=0.19, uri_pool_size=1000, seed=None):
+    self.rng = np.random.default_rng(seed)
+    self.user_creation_rate, self.user_max_duration_time, self.click_probability = user_creation_rate, user_max_duration_time, click_probability
+    self.uris = np.array([re.sub(r'https?:\/\/.*?\/', "https://databricks.com/", fake.uri()) for _ in range(uri_pool_size)], dtype=object)
+    now = int(time.time())
+    # Warm start: directly begin with the target number of users, with their remaining time already spread
+    self.ids = self._new_ids(concurrent_users)
+    self.end_dates = now + self.rng.integers(0, user_max_duration_time, concurrent_users)
+
+  def _new_ids(self, n):
+    return np.array([str(uuid.uuid4()) for _ in range(n)], dtype=object)
+
+  def _weighted_choice(self, elements, n):
+    values = np.array(list(elements.keys()), dtype=object)
+    weights = np.array(list(elements.values()))
+    return values[self.rng.choice(len(values), n, p=weights/weights.sum())]
+
+  def tick(self, now):
+    """Returns the events of all the users clicking during this second, as a pandas DataFrame."""
+    alive = self.end_dates >= now
+    self.ids, self.end_dates = self.ids[alive], self.end_dates[alive]
+    user_ids = self.ids[self.rng.random(len(self.ids)) < self.click_probability]
+    n = len(user_ids)
+    events = pd.DataFrame({
+      "user_id": user_ids,
+      "platform": self._weighted_choice(platform, n),
+      #event id with 2% of null event to have some errors/cleanup
+      "event_id": np.where(self.rng.random(n) < 0.98, self._new_ids(n), None),
+      #adds some noise in the timestamp to simulate out-of order events
+      "event_date": now + self.rng.integers(-5, 5, n),
+      "action": self._weighted_choice(action_type, n),
+      "uri": self.uris[self.rng.integers(0, len(self.uris), n)]})
+    #Re-create new users, leaving after max user_max_duration_time sec
+    self.ids = np.concatenate([self.ids, self._new_ids(self.user_creation_rate)])
+    self.end_dates = np.concatenate([self.end_dates, now + self.rng.integers(0, self.user_max_duration_time, self.user_creation_rate)])
+    return events
+
+def send_events(events, topic = 'dbdemos-sessions'):
+  if len(events) == 0:
+    return
+  # Serialize all the events at once
+  for event_json in events.to_json(orient="records", lines=True).splitlines():
+    produce(event_json, topic)
+    # Simulate duplicate events to test deduplication
+    if random.uniform(0, 1) > 0.96:
+      produce(event_json, topic)
+  if producer_mode == "demo":
+    producer.flush()
+
+# COMMAND ----------
+
 users = {}
 #How long it'll produce messages
 produce_time_sec = int(dbutils.widgets.get("produce_time_sec"))
@@ -91,32 +241,54 @@ user_creation_rate = 2
 #Max duration a user stays in the website (after this time user will stop producing events)
 user_max_duration_time = 120
 
-for _ in range(produce_time_sec):
-  #print(len(users))
-  for id in list(users.keys()):
-    user = users[id]
+simulation_engine = dbutils.widgets.get("simulation_engine")
+concurrent_users = int(dbutils.widgets.get("concurrent_users"))
+
+start_time = time.time()
+if simulation_engine == "numpy":
+  #Steady state: concurrent users = creation rate x average stay duration
+  if concurrent_users > 0:
+    user_creation_rate = max(1, int(concurrent_users / (user_max_duration_time / 2)))
+  simulation = UserSimulation(user_creation_rate, user_max_duration_time, concurrent_users)
+  for i in range(produce_time_sec):
     now = int(time.time())
-    if (user['end_date'] < now):
-      del users[id]
-      #print(f"User {id} removed")
+    send_events(simulation.tick(now))
+    #Keep the simulation in real time: only sleep what's left of the second
+    lag = time.time() - (start_time + i + 1)
+    if lag > 0:
+      print(f"Simulation is {lag:.1f}s late with {len(simulation.ids)} users")
     else:
-      #10% chance to click on something
-      if (randrange(100) > 80):
-        event = create_event(id, now)
-        send_message(event)
-        #print(f"User {id} sent event {event}")
+      time.sleep(-lag)
+else:
+  for _ in range(produce_time_sec):
+    #print(len(users))
+    for id in list(users.keys()):
+      user = users[id]
+      now = int(time.time())
+      if (user['end_date'] < now):
+        del users[id]
+        #print(f"User {id} removed")
+      else:
+        #10% chance to click on something
+        if (randrange(100) > 80):
+          event = create_event(id, now)
+          send_message(event)
+          #print(f"User {id} sent event {event}")
         
-  #Re-create new users
-  for i in range(user_creation_rate):
-    #Add new user
-    user_id = str(uuid.uuid4())
-    now = int(time.time())
-    #end_date is when the user will leave and the session stops (so max user_max_duration_time sec and then leaves the website)
-    user = {"id": user_id, "creation_date": now, "end_date": now + randrange(user_max_duration_time) }
-    users[user_id] = user
-    #print(f"User {user_id} created")
-  time.sleep(1)
+    #Re-create new users
+    for i in range(user_creation_rate):
+      #Add new user
+      user_id = str(uuid.uuid4())
+      now = int(time.time())
+      #end_date is when the user will leave and the session stops (so max user_max_duration_time sec and then leaves the website)
+      user = {"id": user_id, "creation_date": now, "end_date": now + randrange(user_max_duration_time) }
+      users[user_id] = user
+      #print(f"User {user_id} created")
+    time.sleep(1)
 
 
 # Ensure all messages are delivered before exiting
 producer.flush()
+if producer_mode == "high_throughput":
+  duration = time.time() - start_time
+  print(f"Delivered {delivery_stats.delivered} messages ({delivery_stats.failed} failed, last error: {delivery_stats.last_error}) in {duration:.1f}s: {delivery_stats.delivered/duration:.0f} messages/sec")
@@ -0,0 +1,75 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC ## Sessionization implementations
+# MAGIC
+# MAGIC Shared by `03-Delta-session-GOLD` and the `02-sessionization-benchmark` notebook. Both implementations have the same output contract: `user_id, click_count, start_time, end_time, status`.
+# MAGIC
+# MAGIC - `applyInPandasWithState`: custom state per user, with a processing-time timeout to close the session
+# MAGIC - `session_window`: native SQL session window aggregation. The state is kept in the JVM and bounded by the watermark: closed sessions are evicted from the state store once the watermark passes them. Sessions are emitted once, when they close (append mode), instead of on every update.
+
+# COMMAND ----------
+
+from typing import Tuple, Iterator
+from pyspark.sql.streaming.state import GroupState, GroupStateTimeout
+import pyspark.sql.functions as F
+import pandas as pd
+import sys
+import time
+
+#If we don't have activity after 30sec, close the session
+max_session_duration = 30000
+def func(
+    key: Tuple[str], events: Iterator[pd.DataFrame], state: GroupState
+) -> Iterator[pd.DataFrame]:
+  (user_id,) = key
+  if state.exists:
+    (user_id, click_count, start_time, end_time) = state.get
+  else:
+    click_count = 0
+    start_time = sys.maxsize
+    end_time = 0
+  if state.hasTimedOut:
+    #Drop the session from the state and emit a final offline session update (end of the session)
+    state.remove()
+    yield pd.DataFrame({"user_id": [user_id], "click_count": [click_count], "start_time": [start_time], "end_time": [end_time],  "status": ["offline"]})
+  else:
+    # as we can receive out-of-order events, we need to get the min/max date and the sum
+    for df in events:
+      start_time = min(start_time, df['event_date'].min())
+      end_time = max(df['event_date'].max(), end_time)
+      click_count += len(df)
+    #update the state with the new values
+    state.update((user_id, int(click_count), int(start_time), int(end_time)))
+    # Set the timeout as max_session_duration seconds.
+    state.setTimeoutDuration(max_session_duration)
+    #compute the status to flag offline session in case of restart
+    now = int(time.time())
+    status = "offline" if end_time >= now - max_session_duration else "online"
+    #emit the change. We could also yield an empty dataframe if we only want to emit when the session is closed: yield pd.DataFrame()
+    yield pd.DataFrame({"user_id": [user_id], "click_count": [click_count], "start_time": [start_time], "end_time": [end_time],  "status": [status]})
+
+
+output_schema = "user_id STRING, click_count LONG, start_time LONG, end_time LONG, status STRING"
+state_schema = "user_id STRING, click_count LONG, start_time LONG, end_time LONG"
+
+def sessions_with_state(events):
+  return events.groupBy(F.col("user_id")).applyInPandasWithState(
+    func,
+    output_schema,
+    state_schema,
+    "append",
+    GroupStateTimeout.ProcessingTimeTimeout)
+
+def sessions_with_session_window(events, watermark="1 minute"):
+  """Same sessions with a native session_window: no python worker, and the state is bounded by the watermark.
+  Must run in append mode: each session is emitted once, when the watermark closes it (status offline)."""
+  gap = f"{max_session_duration // 1000} seconds"
+  return (events
+    .withWatermark("event_datetime", watermark)
+    .groupBy(F.col("user_id"), F.session_window("event_datetime", gap))
+    .agg(F.count("*").alias("click_count"), F.min("event_date").alias("start_time"), F.max("event_date").alias("end_time"))
+    .withColumn("status", F.lit("offline"))
+    .select("user_id", "click_count", "start_time", "end_time", "status"))
+
+def sessionize(events, mode="applyInPandasWithState"):
+  return sessions_with_session_window(events) if mode == "session_window" else sessions_with_state(events)
@@ -0,0 +1,67 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC # Sessionization benchmark
+# MAGIC
+# MAGIC Compare the two sessionization implementations of `01-session-functions` (`applyInPandasWithState` vs native `session_window`) with 10k, 100k and 1M active users.
+# MAGIC
+# MAGIC For each volume, we generate a synthetic `events` table where every user clicks `events_per_user` times over 5 minutes. Each time slice is committed separately and consumed one per trigger, so every trigger updates all the active users. We then report the trigger latency and the state store size from the streaming query progress.
+
+# COMMAND ----------
+
+# MAGIC %run ./00-setup $reset_all_data=false
+
+# COMMAND ----------
+
+# MAGIC %run ./01-session-functions
+
+# COMMAND ----------
+
+try:
+  # RocksDB keeps the state off-heap, required to hold 1M+ keys
+  spark.conf.set("spark.sql.streaming.stateStore.providerClass", "com.databricks.sql.streaming.state.RocksDBStateStoreProvider")
+except Exception as e:
+  print(f"Error {e}: Unable to set the state store provider, conf not available in serverless")
+
+events_per_user = 10
+
+def create_benchmark_events(num_users):
+  table_name = f"sessionization_benchmark_events_{num_users}"
+  spark.sql(f"DROP TABLE IF EXISTS {table_name}")
+  start_ts = int(time.time())
+  for i in range(events_per_user):
+    # One commit per time slice: all the users click once per slice, 30 sec apart
+    (spark.range(num_users)
+       .select(F.concat(F.lit("user-"), F.col("id")).alias("user_id"),
+               (F.lit(start_ts + i * 30) + (F.rand() * 10).cast("int")).alias("event_date"))
+       .withColumn("event_datetime", F.to_timestamp(F.from_unixtime(F.col("event_date"))))
+       .coalesce(1).write.mode("append").saveAsTable(table_name))
+  return table_name
+
+def run_benchmark(table_name, mode):
+  events = spark.readStream.option("maxFilesPerTrigger", 1).table(table_name)
+  query = (sessionize(events, mode).writeStream
+             .format("noop")
+             .outputMode("append")
+             .trigger(availableNow=True)
+             .option("checkpointLocation", get_chkp_folder())
+             .start())
+  query.awaitTermination()
+  progress = [p for p in query.recentProgress if p["numInputRows"] > 0]
+  state = [p["stateOperators"][0] for p in progress if p["stateOperators"]]
+  return {"mode": mode,
+          "triggers": len(progress),
+          "avg_trigger_ms": int(sum(p["durationMs"]["triggerExecution"] for p in progress) / len(progress)),
+          "max_trigger_ms": max(p["durationMs"]["triggerExecution"] for p in progress),
+          "max_state_rows": max((s["numRowsTotal"] for s in state), default=0),
+          "max_state_memory_mb": round(max((s["memoryUsedBytes"] for s in state), default=0) / 1024 / 1024, 1)}
+
+# COMMAND ----------
+
+results = []
+for num_users in [10000, 100000, 1000000]:
+  table_name = create_benchmark_events(num_users)
+  for mode in ["applyInPandasWithState", "session_window"]:
+    results.append({"active_users": num_users, **run_benchmark(table_name, mode)})
+  spark.sql(f"DROP TABLE IF EXISTS {table_name}")
+
+display(pd.DataFrame(results))
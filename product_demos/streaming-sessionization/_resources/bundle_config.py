@@ -43,6 +43,24 @@
       "description": "Init load data",
       "depends_on_previous": False
     },
+    {
+      "path": "_resources/01-session-functions", 
+      "pre_run": False, 
+      "publish_on_website": False, 
+      "add_cluster_setup_cell": False, 
+      "title":  "Sessionization functions", 
+      "description": "applyInPandasWithState and session_window sessionization",
+      "depends_on_previous": False
+    },
+    {
+      "path": "_resources/02-sessionization-benchmark", 
+      "pre_run": False, 
+      "publish_on_website": False, 
+      "add_cluster_setup_cell": False, 
+      "title":  "Sessionization benchmark", 
+      "description": "Trigger latency and state size of the sessionization implementations",
+      "depends_on_previous": False
+    },
     {
       "path": "01-Delta-session-BRONZE", 
       "pre_run": True, 